@@ -21,6 +21,7 @@ xcopy /i fileformat.txt winbuild\dist
 xcopy /i LICENSE winbuild\dist
 xcopy /i README winbuild\dist
 xcopy /i dict_en.dat.gz winbuild\dist
+xcopy /i dict_en.bin winbuild\dist
 
 xcopy /i /y resources winbuild\dist\resources
 
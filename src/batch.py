@@ -0,0 +1,245 @@
+# headless batch conversion of scripts between the formats Trelby can
+# read and write. this does not need a display, so it can be run from
+# cron jobs and the like. see trelby-batch for the command line
+# interface.
+
+from error import *
+import config
+import instrument
+import misc
+import myimport
+import screenplay
+import util
+
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+
+# input formats, by file extension. value is the function used to parse
+# the file contents into a list of Lines, or None for .trelby files.
+INPUT_FORMATS = {
+    "trelby" : None,
+    "astx" : myimport.parseAstx,
+    "celtx" : myimport.parseCeltx,
+    "fadein" : myimport.parseFadein,
+    "fdx" : myimport.parseFDX,
+    "fountain" : myimport.parseFountain,
+    "txt" : myimport.parseTextFile,
+    }
+
+# output formats, with the extensions used for them
+OUTPUT_FORMATS = ("trelby", "fountain", "fdx", "pdf", "rtf", "html", "txt")
+
+# global config used by all conversions, created in init
+cfgGl = None
+
+# initialize the modules needed for conversions. called once in each
+# worker process.
+def init():
+    global cfgGl
+
+    misc.init(False)
+    util.init(False)
+
+    cfgGl = config.ConfigGlobal()
+
+# load file 'fileName' and return it as a Screenplay. raises TrelbyError
+# or IOError on errors.
+def loadScript(fileName):
+    ext = getExt(fileName)
+
+    if ext not in INPUT_FORMATS:
+        raise MiscError("Unknown input format '%s'." % ext)
+
+    f = open(misc.toPath(fileName), "rb")
+
+    try:
+        if ext == "trelby":
+            return screenplay.Screenplay.loadFile(f, cfgGl)[0]
+
+        sp = screenplay.Screenplay(cfgGl)
+        sp.titles.addDefaults()
+        sp.headers.addDefaults()
+
+        parse = INPUT_FORMATS[ext]
+
+        # Fountain and Final Draft files are parsed as they are read
+        if parse == myimport.parseFountain:
+            sp.lines = myimport.parseFountainFile(f,
+                actionWidth = sp.cfg.getType(screenplay.ACTION).width)
+        elif parse == myimport.parseFDX:
+            sp.lines = myimport.parseFDXFile(f)
+        else:
+            sp.lines = parse(f.read())
+    finally:
+        f.close()
+
+    sp.reformatAll()
+    sp.paginate()
+
+    return sp
+
+# save Screenplay 'sp' to 'fileName' in format 'fmt', one of
+# OUTPUT_FORMATS. raises IOError or OSError on errors.
+def saveScript(sp, fileName, fmt):
+    util.writeFileSafely(fileName, lambda f: writeScript(sp, f, fmt))
+
+# write sp to file object f in format 'fmt'.
+def writeScript(sp, f, fmt):
+    if fmt == "pdf":
+        sp.generatePDFTo(f, True)
+    elif fmt == "trelby":
+        f.write(sp.save())
+    elif fmt == "fountain":
+        sp.generateFountainTo(f)
+    elif fmt == "fdx":
+        sp.generateFDXTo(f)
+    elif fmt == "rtf":
+        f.write(sp.generateRTF())
+    elif fmt == "html":
+        f.write(sp.generateHtml())
+    else:
+        f.write(sp.generateText(False))
+
+# convert one file. args is a (inputFileName, outputFileName, format)
+# tuple. returns (inputFileName, outputFileName, seconds taken, error
+# message or None, profiling stats or None). this is run in the worker
+# processes, so it must not raise exceptions. the worker processes don't
+# write profiling stats themselves, so the ones recorded during the
+# conversion are returned for the main process to add to its own, as
+# returned by instrument.takeStats.
+def convert(args):
+    inFile, outFile, fmt = args
+    t = time.time()
+    err = None
+
+    try:
+        saveScript(loadScript(inFile), outFile, fmt)
+    except (IOError, OSError), e:
+        err = "%s" % (e.strerror or e)
+    except TrelbyError, e:
+        err = str(e)
+    except Exception, e:
+        err = "Internal error: %s: %s" % (e.__class__.__name__, e)
+
+    if instrument.enabled:
+        profile = instrument.takeStats()
+    else:
+        profile = None
+
+    return (inFile, outFile, time.time() - t, err, profile)
+
+# return lowercase extension of fileName, without the dot.
+def getExt(fileName):
+    return os.path.splitext(fileName)[1][1:].lower()
+
+# expand 'paths', which can be files or directories, into a list of
+# files to convert. from directories, only files in a known input format
+# are included.
+def findFiles(paths):
+    ret = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                fn = os.path.join(path, name)
+
+                if os.path.isfile(fn) and (getExt(name) in INPUT_FORMATS):
+                    ret.append(fn)
+        else:
+            ret.append(path)
+
+    return ret
+
+# return list of (inputFileName, outputFileName, format) tuples to give
+# to convert, one for each file in 'files'. outDir is the directory to
+# write output files to, or None to write them next to the input files.
+def makeTasks(files, fmt, outDir):
+    ret = []
+
+    for fn in files:
+        base = os.path.splitext(os.path.basename(fn))[0]
+        ret.append((fn, os.path.join(outDir or os.path.dirname(fn),
+                                     base + "." + fmt), fmt))
+
+    return ret
+
+def main(argv = None):
+    parser = optparse.OptionParser(
+        usage = "%prog [options] -f FORMAT file-or-directory...",
+        description = "Convert screenplays between file formats. "
+        "Input formats: %s. Output formats: %s." % (
+            ", ".join(sorted(INPUT_FORMATS)), ", ".join(OUTPUT_FORMATS)))
+
+    parser.add_option("-f", "--format", choices = OUTPUT_FORMATS,
+        help = "output format")
+    parser.add_option("-o", "--output-dir",
+        help = "directory to write output files to (default: same as"
+        " input file)")
+    parser.add_option("-j", "--jobs", type = "int",
+        default = multiprocessing.cpu_count(),
+        help = "number of worker processes (default: number of CPUs)")
+
+    opts, args = parser.parse_args(argv)
+
+    if not opts.format:
+        parser.error("no output format given")
+
+    if not args:
+        parser.error("no input files given")
+
+    for path in args:
+        if not os.path.exists(path):
+            parser.error("'%s': No such file or directory" % path)
+
+    tasks = makeTasks(findFiles(args), opts.format, opts.output_dir)
+
+    # output file -> input file
+    outputs = {}
+
+    for inFile, outFile, fmt in tasks:
+        outFile = os.path.abspath(outFile)
+
+        if outFile == os.path.abspath(inFile):
+            parser.error("converting '%s' would overwrite it" % inFile)
+
+        if outFile in outputs:
+            parser.error("'%s' and '%s' would both be converted to '%s'" % (
+                outputs[outFile], inFile, outFile))
+
+        outputs[outFile] = inFile
+
+    if opts.output_dir and not os.path.isdir(opts.output_dir):
+        os.makedirs(opts.output_dir)
+
+    t = time.time()
+    failed = 0
+
+    if opts.jobs > 1:
+        pool = multiprocessing.Pool(opts.jobs, init)
+        results = pool.imap(convert, tasks)
+    else:
+        pool = None
+        init()
+        results = (convert(task) for task in tasks)
+
+    try:
+        for inFile, outFile, secs, err, profile in results:
+            if profile:
+                instrument.addStats(profile)
+
+            if err:
+                print >> sys.stderr, "%s: %s" % (inFile, err)
+                failed += 1
+            else:
+                print "%s -> %s: %.2f s" % (inFile, outFile, secs)
+    finally:
+        if pool:
+            pool.terminate()
+
+    print "%d files converted, %d failed, in %.2f s" % (
+        len(tasks) - failed, failed, time.time() - t)
+
+    return 1 if failed else 0
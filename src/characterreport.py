@@ -2,7 +2,6 @@ import gutil
 import misc
 import pdf
 import pml
-import screenplay
 import util
 
 import wx
@@ -45,63 +44,12 @@ class CharacterReport:
 
         self.sp = sp
 
-        ls = sp.lines
-
-        # key = character name, value = CharInfo
-        chars = {}
-
-        name = None
-        scene = "(NO SCENE NAME)"
-
-        # how many lines processed for current speech
-        curSpeechLines = 0
-
-        for i in xrange(len(ls)):
-            line = ls[i]
-
-            if (line.lt == screenplay.SCENE) and\
-                   (line.lb == screenplay.LB_LAST):
-                scene = util.upper(line.text)
-
-            elif (line.lt == screenplay.CHARACTER) and\
-                   (line.lb == screenplay.LB_LAST):
-                name = util.upper(line.text)
-                curSpeechLines = 0
-
-            elif line.lt in (screenplay.DIALOGUE, screenplay.PAREN) and name:
-                ci = chars.get(name)
-                if not ci:
-                    ci = CharInfo(name, sp)
-                    chars[name] = ci
-
-                if scene:
-                    ci.scenes[scene] = ci.scenes.get(scene, 0) + 1
-
-                if curSpeechLines == 0:
-                    ci.speechCnt += 1
-
-                curSpeechLines += 1
-
-                # PAREN lines don't count as spoken words
-                if line.lt == screenplay.DIALOGUE:
-                    ci.lineCnt += 1
-
-                    words = util.splitToWords(line.text)
-
-                    ci.wordCnt += len(words)
-                    ci.wordCharCnt += reduce(lambda x, y: x + len(y), words,
-                                             0)
-
-                ci.pages.addPage(sp.line2page(i))
-
-            else:
-                name = None
-                curSpeechLines = 0
-
-        # list of CharInfo objects
+        # list of CharInfo objects. speakers with an empty name are left
+        # out.
         self.cinfo = []
-        for v in chars.values():
-            self.cinfo.append(v)
+        for ss in sp.getStats().speakers:
+            if ss.name and ss.speechCnt:
+                self.cinfo.append(CharInfo(ss))
 
         self.cinfo.sort(cmpLines)
 
@@ -157,18 +105,18 @@ class CharacterReport:
 
         return pdf.generate(tf.doc)
 
-# information about one character
+# information about one character. ss = scriptstats.SpeakerStats
 class CharInfo:
-    def __init__(self, name, sp):
-        self.name = name
-
-        self.speechCnt = 0
-        self.lineCnt = 0
-        self.wordCnt = 0
-        self.wordCharCnt = 0
-        self.scenes = {}
+    def __init__(self, ss):
+        self.name = ss.name
+
+        self.speechCnt = ss.speechCnt
+        self.lineCnt = ss.lineCnt
+        self.wordCnt = ss.wordCnt
+        self.wordCharCnt = ss.wordCharCnt
+        self.scenes = ss.scenes
         self.include = True
-        self.pages = screenplay.PageList(sp.getPageNumbers())
+        self.pages = ss.pages
 
 def cmpLines(c1, c2):
     ret = cmp(c2.lineCnt, c1.lineCnt)
@@ -5,6 +5,8 @@ import pml
 import screenplay
 import util
 
+import itertools
+
 import wx
 
 def genDialogueChart(mainFrame, sp):
@@ -61,31 +63,30 @@ class DialogueChart:
 
         self.sp = sp
 
-        ls = sp.lines
+        stats = sp.getStats()
 
         # PageInfo's for each page, 0-indexed.
         self.pages = []
 
-        for i in xrange(len(sp.pages) - 1):
+        for i in xrange(len(stats.pages) - 1):
             self.pages.append(PageInfo())
 
         # map of CharInfo objects. key = name, value = CharInfo.
         tmpCinfo = {}
 
-        name = "UNKNOWN"
-
-        for i in xrange(len(ls)):
-            pgNr = sp.line2page(i) -1
+        for lt, pgNr, speaker in itertools.izip(stats.lineTypes,
+                stats.linePages, stats.lineSpeakers):
+            pgNr -= 1
             pi = self.pages[pgNr]
-            line = ls[i]
 
-            pi.addLine(line.lt)
+            pi.addLine(lt)
 
-            if (line.lt == screenplay.CHARACTER) and\
-                   (line.lb == screenplay.LB_LAST):
-                name = util.upper(line.text)
+            if lt == screenplay.DIALOGUE:
+                if speaker != -1:
+                    name = stats.speakers[speaker].name
+                else:
+                    name = "UNKNOWN"
 
-            elif line.lt == screenplay.DIALOGUE:
                 pi.addLineToSpeaker(name)
 
                 ci = tmpCinfo.get(name)
@@ -95,9 +96,6 @@ class DialogueChart:
                 else:
                     tmpCinfo[name] = CharInfo(name, pgNr)
 
-            elif line.lt != screenplay.PAREN:
-                name = "UNKNOWN"
-
         # CharInfo's.
         self.cinfo = []
         for v in tmpCinfo.values():
@@ -15,3 +15,7 @@ class ConfigError(TrelbyError):
 class MiscError(TrelbyError):
     def __init__(self, msg):
         TrelbyError.__init__(self, msg)
+
+class CancelledError(TrelbyError):
+    def __init__(self, msg = "Cancelled."):
+        TrelbyError.__init__(self, msg)
@@ -1,9 +1,12 @@
+from error import *
 import config
 import gutil
 import misc
-import undo
+import search
 import util
 
+import sys
+
 import wx
 
 class FindDlg(wx.Dialog):
@@ -15,7 +18,10 @@ class FindDlg(wx.Dialog):
 
         self.searchLine = -1
         self.searchColumn = -1
-        self.searchWidth = -1
+
+        # search.Search used for the last search, and the match it found
+        self.search = None
+        self.match = None
 
         hsizer = wx.BoxSizer(wx.HORIZONTAL)
 
@@ -52,6 +58,9 @@ class FindDlg(wx.Dialog):
         self.matchCaseCb = wx.CheckBox(self, -1, "Match case")
         vsizer2.Add(self.matchCaseCb, 0, wx.TOP, pad)
 
+        self.regexCb = wx.CheckBox(self, -1, "Regular expression")
+        vsizer2.Add(self.regexCb, 0, wx.TOP, pad)
+
         hsizer2.Add(vsizer2, 0, wx.EXPAND | wx.RIGHT, 10)
 
         self.direction = wx.RadioBox(self, -1, "Direction",
@@ -117,6 +126,7 @@ class FindDlg(wx.Dialog):
         wx.EVT_CHAR(self.moreButton, self.OnCharButton)
         wx.EVT_CHAR(self.matchWholeCb, self.OnCharMisc)
         wx.EVT_CHAR(self.matchCaseCb, self.OnCharMisc)
+        wx.EVT_CHAR(self.regexCb, self.OnCharMisc)
         wx.EVT_CHAR(self.direction, self.OnCharMisc)
         wx.EVT_CHAR(self.elements, self.OnCharMisc)
 
@@ -133,6 +143,7 @@ class FindDlg(wx.Dialog):
 
         self.matchWholeCb.SetValue(self.ctrl.findDlgMatchWholeWord)
         self.matchCaseCb.SetValue(self.ctrl.findDlgMatchCase)
+        self.regexCb.SetValue(self.ctrl.findDlgRegex)
 
         self.direction.SetSelection(int(not self.ctrl.findDlgDirUp))
 
@@ -156,6 +167,7 @@ class FindDlg(wx.Dialog):
             self.replaceEntry.GetValue())
         self.ctrl.findDlgMatchWholeWord = self.matchWhole
         self.ctrl.findDlgMatchCase = self.matchCase
+        self.ctrl.findDlgRegex = self.isRegex
         self.ctrl.findDlgDirUp = self.dirUp
         self.ctrl.findDlgUseExtra = self.useExtra
 
@@ -238,6 +250,7 @@ class FindDlg(wx.Dialog):
         self.dirUp = self.direction.GetSelection() == 0
         self.matchWhole = self.matchWholeCb.IsChecked()
         self.matchCase = self.matchCaseCb.IsChecked()
+        self.isRegex = self.regexCb.IsChecked()
 
         if self.useExtra:
             self.elementMap = {}
@@ -245,48 +258,60 @@ class FindDlg(wx.Dialog):
                 self.elementMap[self.elementTypes[i]] = \
                     self.elements.IsChecked(i)
 
-    def typeIncluded(self, lt):
-        if not self.useExtra:
-            return True
+    # return a search.Search for the current parameters, or None if there
+    # is nothing to search for or the search text is invalid.
+    def getSearch(self):
+        value = misc.fromGUI(self.findEntry.GetValue())
+
+        if value == "":
+            return None
+
+        if self.useExtra:
+            elements = [lt for lt, checked in self.elementMap.iteritems()
+                        if checked]
+        else:
+            elements = None
+
+        try:
+            return search.Search(value, self.matchCase, self.matchWhole,
+                                 self.isRegex, elements)
+        except MiscError, e:
+            wx.MessageBox(str(e), "Error", wx.OK, self)
 
-        return self.elementMap[lt]
+            return None
 
     def OnFind(self, event = None, autoFind = False):
         if not autoFind:
             self.getParams()
 
-        value = misc.fromGUI(self.findEntry.GetValue())
-        if not self.matchCase:
-            value = util.upper(value)
+        srch = self.getSearch()
 
-        if value == "":
+        if not srch:
             return
 
-        self.searchWidth = len(value)
+        self.search = srch
 
         if self.dirUp:
             inc = -1
         else:
             inc = 1
 
-        line = self.ctrl.sp.line
-        col = self.ctrl.sp.column
-        ls = self.ctrl.sp.lines
-
-        if (line == self.searchLine) and (col == self.searchColumn):
-            text = ls[line].text
+        sp = self.ctrl.sp
+        line = sp.line
+        col = sp.column
+        ls = sp.lines
 
-            col += inc
-            if col >= len(text):
-                line += 1
-                col = 0
-            elif col < 0:
-                line -= 1
-                if line >= 0:
-                    col = max(len(ls[line].text) - 1, 0)
+        first = sp.getParaFirstIndexFromLine(line)
+        offset = search.pos2offset(sp, first, line, col)
 
         fullSearch = False
-        if inc > 0:
+
+        if (line == self.searchLine) and (col == self.searchColumn):
+            # continue from the next (previous) character in the paragraph
+            # after the start of the previous match, which may also be
+            # the space between two lines
+            first, offset = self.match[0], self.match[1] + inc
+        elif inc > 0:
             if (line == 0) and (col == 0):
                 fullSearch = True
         else:
@@ -296,47 +321,20 @@ class FindDlg(wx.Dialog):
         self.searchLine = -1
 
         while True:
-            found = False
+            match = srch.findFrom(sp, first, offset, inc > 0)
 
-            while True:
-                if (line >= len(ls)) or (line < 0):
-                    break
+            if match:
+                first, start, end = match
 
-                if self.typeIncluded(ls[line].lt):
-                    text = ls[line].text
-                    if not self.matchCase:
-                        text = util.upper(text)
+                self.match = match
+                self.searchLine, self.searchColumn = search.offset2pos(
+                    sp, first, start)
 
-                    if inc > 0:
-                        res = text.find(value, col)
-                    else:
-                        res = text.rfind(value, 0, col + 1)
-
-                    if res != -1:
-                        if not self.matchWhole or (
-                            util.isWordBoundary(text[res - 1 : res]) and
-                            util.isWordBoundary(text[res + len(value) :
-                                                     res + len(value) + 1])):
-
-                            found = True
-
-                            break
-
-                line += inc
-                if inc > 0:
-                    col = 0
-                else:
-                    if line >= 0:
-                        col = max(len(ls[line].text) - 1, 0)
-
-            if found:
-                self.searchLine = line
-                self.searchColumn = res
-                self.ctrl.sp.gotoPos(line, res)
-                self.ctrl.sp.setMark(line, res + self.searchWidth - 1)
+                sp.gotoPos(self.searchLine, self.searchColumn)
+                sp.setMark(*search.offset2pos(sp, first, end - 1))
 
                 if not autoFind:
-                    self.ctrl.makeLineVisible(line)
+                    self.ctrl.makeLineVisible(self.searchLine)
                     self.ctrl.updateScreen()
 
                 break
@@ -353,17 +351,18 @@ class FindDlg(wx.Dialog):
                 if inc > 0:
                     s1 = "end"
                     s2 = "start"
-                    restart = 0
+                    first = 0
+                    offset = 0
                 else:
                     s1 = "start"
                     s2 = "end"
-                    restart = len(ls) - 1
+                    first = sp.getParaFirstIndexFromLine(len(ls) - 1)
+                    offset = sys.maxint
 
                 if wx.MessageBox("Search finished at the %s of the script. Do\n"
                                  "you want to continue at the %s of the script?"
                                  % (s1, s2), "Continue?",
                                  wx.YES_NO | wx.YES_DEFAULT, self) == wx.YES:
-                    line = restart
                     fullSearch = True
                 else:
                     break
@@ -376,44 +375,36 @@ class FindDlg(wx.Dialog):
             return False
 
         value = util.toInputStr(misc.fromGUI(self.replaceEntry.GetValue()))
-        ls = self.ctrl.sp.lines
-
         sp = self.ctrl.sp
-        u = undo.SinglePara(sp, undo.CMD_MISC, self.searchLine)
 
-        ls[self.searchLine].text = util.replace(
-            ls[self.searchLine].text, value,
-            self.searchColumn, self.searchWidth)
+        try:
+            end = self.search.replace(sp, self.match, value)
+        except MiscError, e:
+            wx.MessageBox(str(e), "Error", wx.OK, self)
 
-        sp.rewrapPara(sp.getParaFirstIndexFromLine(self.searchLine))
+            return False
 
         self.searchLine = -1
 
-        diff = len(value) - self.searchWidth
-
-        if not self.dirUp:
-            sp.column += self.searchWidth + diff
-        else:
-            sp.column -= 1
-
-            if sp.column < 0:
-                sp.line -= 1
-
-                if sp.line < 0:
-                    sp.line = 0
-                    sp.column = 0
-
-                    self.searchLine = 0
-                    self.searchColumn = 0
-                    self.searchWidth = 0
-                else:
-                    sp.column = len(ls[sp.line].text)
+        if end is None:
+            # script has been modified since the search
+            return False
 
-        sp.clearMark()
-        sp.markChanged()
+        if self.dirUp:
+            # continue searching from just before the replaced text
+            first, start, end = self.match
+
+            if start > 0:
+                sp.line, sp.column = search.offset2pos(sp, first, start - 1)
+            elif first > 0:
+                sp.line = first - 1
+                sp.column = len(sp.lines[sp.line].text)
+            else:
+                sp.line = 0
+                sp.column = 0
 
-        u.setAfter(sp)
-        sp.addUndo(u)
+                self.searchLine = 0
+                self.searchColumn = 0
 
         self.OnFind(autoFind = autoFind)
 
@@ -422,12 +413,21 @@ class FindDlg(wx.Dialog):
     def OnReplaceAll(self, event = None):
         self.getParams()
 
-        if self.searchLine == -1:
-            self.OnFind(autoFind = True)
+        srch = self.getSearch()
 
-        count = 0
-        while self.OnReplace(autoFind = True):
-            count += 1
+        if not srch:
+            return
+
+        value = util.toInputStr(misc.fromGUI(self.replaceEntry.GetValue()))
+
+        try:
+            count = srch.replaceAll(self.ctrl.sp, value)
+        except MiscError, e:
+            wx.MessageBox(str(e), "Error", wx.OK, self)
+
+            return
+
+        self.searchLine = -1
 
         if count != 0:
             self.ctrl.makeLineVisible(self.ctrl.sp.line)
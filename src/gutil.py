@@ -67,7 +67,8 @@ def btnDblClick(btn, func):
 # show PDF document 'pdfData' in an external viewer program. writes out a
 # temporary file, first deleting all old temporary files, then opens PDF
 # viewer application. 'mainFrame' is used as a parent for message boxes in
-# case there are any errors.
+# case there are any errors. 'pdfData' is either a string or a function
+# that writes the document to a given file object.
 def showTempPDF(pdfData, cfgGl, mainFrame):
     try:
         try:
@@ -76,10 +77,15 @@ def showTempPDF(pdfData, cfgGl, mainFrame):
             fd, filename = tempfile.mkstemp(prefix = misc.tmpPrefix,
                                             suffix = ".pdf")
 
+            f = os.fdopen(fd, "wb")
+
             try:
-                os.write(fd, pdfData)
+                if callable(pdfData):
+                    pdfData(f)
+                else:
+                    f.write(pdfData)
             finally:
-                os.close(fd)
+                f.close()
 
             util.showPDF(filename, cfgGl, mainFrame)
 
@@ -0,0 +1,263 @@
+# optional instrumentation of the program's hot paths. functions wrapped
+# with the 'timed' decorator get their call counts and a histogram of
+# their call latencies recorded, which are written to a file on exit.
+#
+# this is enabled by setting the environment variable TRELBY_PROFILE to
+# the name of the file to write, or with the --profile command line
+# option of the GUI. the file is written as CSV if its name ends in
+# ".csv", and as JSON otherwise. when not enabled, the only overhead is
+# one check of a global variable per call.
+
+import atexit
+import csv
+import functools
+import json
+import os
+import threading
+import timeit
+
+# name of the environment variable to check
+ENV_VAR = "TRELBY_PROFILE"
+
+# histogram buckets: latencies up to 2^i microseconds go into bucket i,
+# with the last one holding everything slower than the one before it
+# (about 67 seconds)
+BUCKETS = 28
+
+# upper bounds of the buckets, in seconds
+bucketBounds = [(2 ** i) / 1000000.0 for i in range(BUCKETS - 1)] + \
+               [float("inf")]
+
+# file to write stats to, or None if not enabled
+outFile = None
+
+# True if stats are being recorded
+enabled = False
+
+# True if dumpAtExit has been registered to run on exit
+exitHandlerSet = False
+
+# key = name, value = Stats
+stats = {}
+
+# protects 'stats', since some timed functions are called from background
+# threads
+lock = threading.Lock()
+
+# the most accurate wall clock timer on the platform
+timer = timeit.default_timer
+
+# stats of calls to one function
+class Stats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+        # call counts per bucket
+        self.buckets = [0] * BUCKETS
+
+    def add(self, t):
+        self.count += 1
+        self.total += t
+
+        if (self.min is None) or (t < self.min):
+            self.min = t
+
+        self.max = max(self.max, t)
+
+        self.buckets[getBucket(t)] += 1
+
+    # add the calls recorded in Stats 'other' to these.
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+
+        if (self.min is None) or ((other.min is not None) and
+                                  (other.min < self.min)):
+            self.min = other.min
+
+        self.max = max(self.max, other.max)
+
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+
+    # return an estimate of the p'th percentile latency (0 < p <= 100),
+    # which is the upper bound of the bucket it falls in, but at most the
+    # maximum.
+    def percentile(self, p):
+        limit = self.count * p / 100.0
+        cnt = 0
+
+        for i, n in enumerate(self.buckets):
+            cnt += n
+
+            if cnt >= limit:
+                return min(bucketBounds[i], self.max)
+
+        return self.max
+
+    # return stats as a dictionary.
+    def asDict(self):
+        return {
+            "calls" : self.count,
+            "total" : self.total,
+            "min" : self.min or 0.0,
+            "max" : self.max,
+            "mean" : self.total / max(1, self.count),
+            "p50" : self.percentile(50),
+            "p90" : self.percentile(90),
+            "p99" : self.percentile(99),
+            "histogram" : self.buckets[:]
+            }
+
+# return histogram bucket for latency 't' (seconds).
+def getBucket(t):
+    us = int(t * 1000000.0)
+
+    if us <= 1:
+        return 0
+
+    return min((us - 1).bit_length(), BUCKETS - 1)
+
+# start recording stats, writing them to 'fileName' on exit, or not at
+# all if it is None.
+def enable(fileName):
+    global outFile, enabled, exitHandlerSet
+
+    if not exitHandlerSet:
+        atexit.register(dumpAtExit)
+        exitHandlerSet = True
+
+    outFile = fileName
+    enabled = True
+
+# stop recording stats and forget the ones recorded so far.
+def disable():
+    global enabled
+
+    enabled = False
+    reset()
+
+# forget stats recorded so far.
+def reset():
+    lock.acquire()
+
+    try:
+        stats.clear()
+    finally:
+        lock.release()
+
+# record a call to 'name' taking 't' seconds.
+def record(name, t):
+    lock.acquire()
+
+    try:
+        st = stats.get(name)
+
+        if st is None:
+            st = Stats()
+            stats[name] = st
+
+        st.add(t)
+    finally:
+        lock.release()
+
+# decorator recording calls to the decorated function under 'name'.
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+
+            t = timer()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, timer() - t)
+
+        return wrapper
+
+    return decorator
+
+# return recorded stats as a dictionary of name -> Stats.asDict().
+def getStats():
+    lock.acquire()
+
+    try:
+        return dict([(name, st.asDict()) for name, st in stats.iteritems()])
+    finally:
+        lock.release()
+
+# return the stats recorded so far as a dictionary of name -> Stats, and
+# forget them. this and addStats are used to get stats recorded in worker
+# processes, which never run exit handlers, to the parent process.
+def takeStats():
+    lock.acquire()
+
+    try:
+        ret = dict(stats)
+        stats.clear()
+
+        return ret
+    finally:
+        lock.release()
+
+# add stats returned by takeStats to the ones recorded so far.
+def addStats(newStats):
+    lock.acquire()
+
+    try:
+        for name, st in newStats.iteritems():
+            if name in stats:
+                stats[name].merge(st)
+            else:
+                stats[name] = st
+    finally:
+        lock.release()
+
+# write stats to file object 'f' as JSON.
+def writeJSON(f):
+    json.dump({ "buckets" : bucketBounds[:-1], "functions" : getStats() },
+              f, indent = 1, sort_keys = True)
+    f.write("\n")
+
+# write stats to file object 'f' as CSV, one row per function. the
+# histogram columns are named by the upper bounds of their buckets in
+# seconds.
+def writeCSV(f):
+    fields = ["calls", "total", "min", "max", "mean", "p50", "p90", "p99"]
+
+    w = csv.writer(f)
+    w.writerow(["function"] + fields +
+               ["le_%g" % b for b in bucketBounds[:-1]] + ["le_inf"])
+
+    for name, st in sorted(getStats().iteritems()):
+        w.writerow([name] + [repr(st[fl]) for fl in fields] +
+                   st["histogram"])
+
+# write stats to 'fileName', as CSV if it ends in ".csv" and as JSON
+# otherwise. raises IOError on errors.
+def dump(fileName):
+    f = open(fileName, "wb")
+
+    try:
+        if fileName.lower().endswith(".csv"):
+            writeCSV(f)
+        else:
+            writeJSON(f)
+    finally:
+        f.close()
+
+def dumpAtExit():
+    if enabled and outFile:
+        try:
+            dump(outFile)
+        except IOError, (errno, strerror):
+            print "Error writing profile to '%s': %s" % (outFile, strerror)
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR])
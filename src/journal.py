@@ -0,0 +1,494 @@
+# on-disk journal of the changes made to a script, so that unsaved changes
+# can be recovered if the program dies, and so that undo history doesn't
+# have to be kept in memory.
+#
+# each open script has its own journal file. it starts with a full copy of
+# the script, followed by one record for each undo object added to the
+# script (in the compact undo.lines2storage format), each undo / redo, and
+# each save. changes that don't go through the undo system (config
+# changes, title pages, etc.) are recorded as new full copies. replaying
+# the records in order gives the state of the script at the time of the
+# last record.
+#
+# records are written and fsynced in batches by a background thread, so
+# the GUI never waits for the disk. the journal is deleted when the script
+# is closed normally; journals left behind by a crashed program are found
+# and replayed on the next start.
+#
+# file format: MAGIC, then records, each of which is a (length, crc32)
+# pair of little-endian 32-bit unsigned integers followed by 'length'
+# bytes of marshaled data, which is a tuple whose first item tells the
+# record type:
+#
+#  ("B", fileName, script, lines, line, column, isModified): full copy of
+#    the script. script is the zlib-compressed output of Screenplay.save,
+#    and lines is the script's lines in undo.lines2storage format, since
+#    loading a script can change how its lines are wrapped.
+#
+#  ("E", line, linesBefore, linesAfter, startPos, endPos, cmdType): undo
+#    object added. linesBefore / linesAfter are the lines from 'line'
+#    onwards before / after the change, in lines2storage format.
+#    startPos / endPos are the cursor positions before / after the change
+#    as (line, column) tuples.
+#
+#  ("M", ...): the same, for an undo object merged with the last one. the
+#    record replaces the last "E" or "M" record.
+#
+#  ("U",), ("R",): undo / redo.
+#
+#  ("S", fileName): script saved.
+
+from error import *
+import misc
+import screenplay
+import undo
+
+import marshal
+import os
+import Queue
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+MAGIC = "TRELBYJ1"
+
+# file name extension of journal files
+EXT = ".jnl"
+
+# return the directory journal files are kept in.
+def getDir():
+    return os.path.join(misc.confPath, u"journal")
+
+class Journal:
+
+    # how often, in seconds, written records are synced to disk
+    SYNC_INTERVAL = 1.0
+
+    # create a new journal file in directory 'dirName' for Screenplay
+    # 'sp', stored in file 'fileName' (None if not saved yet). raises
+    # EnvironmentError on errors.
+    def __init__(self, dirName, sp, fileName):
+        if not os.path.isdir(misc.toPath(dirName)):
+            os.makedirs(misc.toPath(dirName))
+
+        fd, self.path = tempfile.mkstemp(EXT, "", misc.toPath(dirName))
+        self.f = os.fdopen(fd, "w+b")
+
+        lockFile(self.f)
+
+        self.fileName = fileName
+
+        # position the next record will be written at, and the position
+        # of the last one written
+        self.size = 0
+        self.lastPos = None
+
+        # the number of undo records that can currently be undone, and
+        # the total number of them, counting the ones that can be redone.
+        # they are reset by full copies, since the undo objects from
+        # before can't be applied on them when replaying the journal.
+        self.undoCnt = 0
+        self.undoTotal = 0
+
+        # sp.editCount as of the last record
+        self.editCount = -1
+
+        # True if sp has been marked as changed since the last record
+        self.isChanged = False
+
+        # True if writing has failed, after which nothing more is written
+        self.failed = False
+
+        # records waiting to be written, and the thread writing them
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target = self.writer)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+        self.append(MAGIC)
+        self.writeCopy(sp)
+
+    # queue 'data' to be written to the file and return its position.
+    def append(self, data):
+        pos = self.size
+        self.size += len(data)
+        self.queue.put(data)
+
+        return pos
+
+    # queue record 'rec' to be written to the file and return its
+    # position.
+    def add(self, rec):
+        data = marshal.dumps(rec, 2)
+
+        self.lastPos = self.append(struct.pack("<II", len(data),
+            zlib.crc32(data) & 0xffffffff) + data)
+
+        return self.lastPos
+
+    # write a full copy of sp.
+    def writeCopy(self, sp):
+        self.add(("B", self.fileName, zlib.compress(sp.save(), 6),
+                  undo.lines2storage(sp.lines), sp.line, sp.column,
+                  sp.isModified()))
+
+        self.undoCnt = 0
+        self.undoTotal = 0
+        self.recorded(sp)
+
+    # update state after sp's current state has been recorded.
+    def recorded(self, sp):
+        self.editCount = sp.editCount
+        self.isChanged = False
+
+    # called when sp has been marked as changed.
+    def changed(self):
+        self.isChanged = True
+
+    # record undo object 'u' having been added to sp.
+    def addEdit(self, sp, u):
+        # if the script has been modified since the last record by
+        # something other than this action, the action can't be applied
+        # to the state recorded in the journal
+        if u.editCount != self.editCount:
+            u.journalPos = None
+            self.writeCopy(sp)
+
+            return
+
+        u.journalPos = self.add(("E",) + self.getDelta(u))
+
+        self.undoCnt += 1
+        self.undoTotal = self.undoCnt
+        self.recorded(sp)
+
+    # record undo object 'u', the last one added to sp, having been
+    # merged with a new change. this only works if u's record is the last
+    # one in the journal, i.e. nothing else has happened since it, which
+    # sync being called after each command guarantees.
+    def mergeEdit(self, sp, u):
+        if (u.journalPos is None) or (u.journalPos != self.lastPos):
+            u.journalPos = None
+            self.writeCopy(sp)
+
+            return
+
+        u.journalPos = self.add(("M",) + self.getDelta(u))
+        self.recorded(sp)
+
+    # record an undo having been done in sp. editCount is sp.editCount
+    # before the undo.
+    def addUndo(self, sp, editCount):
+        if (editCount != self.editCount) or (self.undoCnt == 0):
+            self.writeCopy(sp)
+
+            return
+
+        self.add(("U",))
+        self.undoCnt -= 1
+        self.recorded(sp)
+
+    # record a redo having been done in sp. editCount is sp.editCount
+    # before the redo.
+    def addRedo(self, sp, editCount):
+        if (editCount != self.editCount) or \
+               (self.undoCnt == self.undoTotal):
+            self.writeCopy(sp)
+
+            return
+
+        self.add(("R",))
+        self.undoCnt += 1
+        self.recorded(sp)
+
+    # record sp having been saved to 'fileName'.
+    def saved(self, sp, fileName):
+        self.sync(sp)
+
+        self.fileName = fileName
+        self.add(("S", fileName))
+
+    # record any changes to sp not recorded yet.
+    def sync(self, sp):
+        if self.isChanged or (sp.editCount != self.editCount):
+            self.writeCopy(sp)
+
+    # return the part of an "E" / "M" record describing undo object 'u'.
+    def getDelta(self, u):
+        return u.getDelta() + ((u.startPos.line, u.startPos.column),
+            (u.endPos.line, u.endPos.column), u.cmdType)
+
+    # return (line, linesBefore, linesAfter) from the "E" / "M" record at
+    # position 'pos'. raises MiscError or EnvironmentError on errors.
+    def readDelta(self, pos):
+        self.flush()
+
+        f = open(self.path, "rb")
+
+        try:
+            f.seek(pos)
+            rec = readRecord(f)
+        finally:
+            f.close()
+
+        if not rec or (rec[0] not in ("E", "M")):
+            raise MiscError("Undo journal is corrupted.")
+
+        return rec[1:4]
+
+    # wait until everything queued so far has been written to the file.
+    def flush(self):
+        self.queue.join()
+
+    # stop writing and close the journal. the file is deleted, unless
+    # 'remove' is False.
+    def close(self, remove = True):
+        self.queue.put(None)
+        self.thread.join()
+
+        self.f.close()
+
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    # body of the writer thread.
+    def writer(self):
+        # whether there's data not yet synced to disk, and when the last
+        # sync was done
+        unsynced = False
+        lastSync = time.time()
+
+        while 1:
+            if unsynced:
+                timeout = max(0.0, lastSync + self.SYNC_INTERVAL -
+                              time.time())
+            else:
+                timeout = None
+
+            try:
+                data = self.queue.get(True, timeout)
+                gotItem = True
+            except Queue.Empty:
+                data = ""
+                gotItem = False
+
+            # the item only counts as done once it's been written, so that
+            # flush doesn't return before that
+            try:
+                if data and not self.failed:
+                    try:
+                        self.f.write(data)
+
+                        # this gets it to the OS, so it survives the
+                        # program crashing
+                        self.f.flush()
+                        unsynced = True
+                    except EnvironmentError:
+                        self.failed = True
+
+                # and this gets it to the disk, in case the whole system
+                # crashes, which is slower and can wait a bit
+                if unsynced and ((data is None) or
+                        ((time.time() - lastSync) >= self.SYNC_INTERVAL)):
+                    try:
+                        os.fsync(self.f.fileno())
+                    except EnvironmentError:
+                        self.failed = True
+
+                    unsynced = False
+                    lastSync = time.time()
+            finally:
+                if gotItem:
+                    self.queue.task_done()
+
+            if data is None:
+                break
+
+# try to lock file object 'f' so that no other program, or other file
+# object in this program, can lock it. returns True on success.
+def lockFile(f):
+    try:
+        if misc.isWindows:
+            import msvcrt
+
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except EnvironmentError:
+        return False
+
+    return True
+
+# read one record from the current position of file object 'f'. returns
+# None at the end of the file, and also on incomplete or damaged records,
+# which is what the end of the file looks like if the program died while
+# writing it.
+def readRecord(f):
+    hdr = f.read(8)
+    if len(hdr) < 8:
+        return None
+
+    size, crc = struct.unpack("<II", hdr)
+    data = f.read(size)
+
+    if (len(data) < size) or ((zlib.crc32(data) & 0xffffffff) != crc):
+        return None
+
+    try:
+        return marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        return None
+
+# return list of journal files in 'dirName' that are not in use, i.e.
+# ones left behind by programs that didn't exit cleanly.
+def findOrphans(dirName):
+    ret = []
+
+    try:
+        names = os.listdir(misc.toPath(dirName))
+    except OSError:
+        return ret
+
+    for name in sorted(names):
+        if not name.endswith(EXT):
+            continue
+
+        path = os.path.join(misc.toPath(dirName), name)
+
+        try:
+            f = open(path, "rb")
+        except IOError:
+            continue
+
+        try:
+            if lockFile(f):
+                ret.append(path)
+        finally:
+            f.close()
+
+    return ret
+
+# replay the journal in file 'path' and return (Screenplay, fileName) of
+# the script as it was when the journal was last written, or None if it
+# has no unsaved changes. raises EnvironmentError or TrelbyError on
+# errors.
+def recover(path, cfgGl):
+    f = open(path, "rb")
+
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise MiscError("Invalid journal file.")
+
+        # the last full copy, and the records after it
+        base = None
+        recs = []
+
+        fileName = None
+        isModified = False
+
+        while 1:
+            rec = readRecord(f)
+
+            if not rec:
+                break
+
+            if rec[0] == "B":
+                base = rec
+                recs = []
+                fileName = rec[1]
+                isModified = rec[6]
+            elif rec[0] == "S":
+                fileName = rec[1]
+                isModified = False
+            else:
+                recs.append(rec)
+                isModified = True
+    finally:
+        f.close()
+
+    if not base or not isModified:
+        return None
+
+    sp = screenplay.Screenplay.load(zlib.decompress(base[2]), cfgGl)[0]
+    sp.lines = undo.storage2lines(base[3])
+    sp.line, sp.column = base[4], base[5]
+
+    replay(sp, recs)
+
+    sp.markLinesChanged(0, len(sp.lines) - 1)
+    sp.validatePos()
+    sp.paginate()
+    sp.markChanged()
+
+    return (sp, fileName)
+
+# apply "E", "M", "U" and "R" records 'recs' to Screenplay 'sp'. stops at
+# the first record that doesn't fit the script, which shouldn't happen.
+def replay(sp, recs):
+    # the "E" / "M" records that can be undone / redone, and how many of
+    # them can be undone
+    history = []
+    cnt = 0
+
+    for rec in recs:
+        t = rec[0]
+
+        if t == "E":
+            del history[cnt:]
+            history.append(rec)
+
+            if not apply(sp, rec, True):
+                break
+
+            cnt += 1
+
+        elif t == "M":
+            if not history or (cnt != len(history)) or \
+                   not apply(sp, history[-1], False):
+                break
+
+            history[-1] = rec
+
+            if not apply(sp, rec, True):
+                break
+
+        elif t == "U":
+            if (cnt == 0) or not apply(sp, history[cnt - 1], False):
+                break
+
+            cnt -= 1
+
+        elif t == "R":
+            if (cnt == len(history)) or not apply(sp, history[cnt], True):
+                break
+
+            cnt += 1
+
+# apply "E" / "M" record 'rec' to sp, forwards (redo) if 'forward' is
+# True, backwards (undo) otherwise. returns False if the record doesn't
+# fit the script.
+def apply(sp, rec, forward):
+    line, before, after, startPos, endPos = rec[1:6]
+
+    if not forward:
+        before, after = after, before
+        endPos = startPos
+
+    if (line + before[0]) > len(sp.lines):
+        return False
+
+    sp.lines[line:line + before[0]] = undo.storage2lines(after)
+
+    if not sp.lines:
+        return False
+
+    sp.line, sp.column = endPos
+
+    return True
@@ -3,7 +3,6 @@ import misc
 import pdf
 import pml
 import scenereport
-import screenplay
 import util
 
 import wx
@@ -34,6 +33,8 @@ class LocationReport:
 
         self.sp = sr.sp
 
+        stats = self.sp.getStats()
+
         # key = scene name, value = LocationInfo. note that multiple keys
         # can point to the same LocationInfo.
         locations = {}
@@ -43,7 +44,7 @@ class LocationReport:
 
         # make grouped scenes point to the same LocationInfos.
         for sceneList in self.sp.locations.locations:
-            li = LocationInfo(self.sp)
+            li = LocationInfo(stats)
 
             for scene in sceneList:
                 locations[scene] = li
@@ -51,9 +52,9 @@ class LocationReport:
         # merge scene information for locations and store scene
         # information
         for si in sr.scenes:
-            locations.setdefault(si.name, LocationInfo(self.sp)).addScene(si)
+            locations.setdefault(si.name, LocationInfo(stats)).addScene(si)
 
-            self.scenes.setdefault(si.name, LocationInfo(self.sp)).\
+            self.scenes.setdefault(si.name, LocationInfo(stats)).\
                  addScene(si)
 
         # remove empty LocationInfos, sort them and store to a list
@@ -129,7 +130,8 @@ class LocationReport:
 
 # information about one location
 class LocationInfo:
-    def __init__(self, sp):
+    # stats = scriptstats.ScriptStats
+    def __init__(self, stats):
         # number of scenes
         self.sceneCount = 0
 
@@ -144,13 +146,13 @@ class LocationInfo:
         self.actionLines = 0
 
         # page numbers
-        self.pages = screenplay.PageList(sp.getPageNumbers())
+        self.pages = stats.newPageList()
 
         # key = character name (upper cased), value = number of dialogue
         # lines
         self.chars = {}
 
-    # add a scene. si = SceneInfo
+    # add a scene. si = scriptstats.SceneStats
     def addScene(self, si):
         if si.name not in self.scenes:
             self.scenes.append(si.name)
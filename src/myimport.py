@@ -1,3 +1,4 @@
+from error import *
 import config
 import gutil
 import misc
@@ -8,6 +9,7 @@ from lxml import etree
 import wx
 
 import StringIO
+import itertools
 import re
 import zipfile
 
@@ -19,22 +21,42 @@ SCENE_ACTION = -2
 # numbers etc
 IGNORE = -3
 
+# load fileName, pass its contents to parser function 'func' as
+# func(data, *args) and return the resulting lines, or None if something
+# went wrong, in which case the error has been shown to the user in a
+# message box with 'frame' as its parent. maxSize is as in util.loadFile.
+def importWith(func, fileName, frame, maxSize, *args):
+    data = util.loadFile(fileName, frame, maxSize)
+
+    if data == None:
+        return None
+
+    try:
+        return func(data, *args)
+    except MiscError, e:
+        wx.MessageBox(str(e), "Error", wx.OK, frame)
+
+        return None
+
+# raise a MiscError if file contents 'data' is empty.
+def checkNotEmpty(data):
+    if len(data) == 0:
+        raise MiscError("File is empty.")
+
 #like importTextFile, but for Adobe Story files.
 def importAstx(fileName, frame):
+    return importWith(parseAstx, fileName, frame, 5000000)
+
+# parse Adobe Story file contents 'data' and return a list of Line
+# objects. raises MiscError on errors. this and the other parse* functions
+# do not use the GUI in any way.
+def parseAstx(data):
     # astx files are xml files. The textlines can be found under
     # AdobeStory/document/stream/section/scene/paragraph which contain
     # one or more textRun/break elements, to be joined. The paragraph
     # attribute "element" gives us the element style.
 
-    data = util.loadFile(fileName, frame, 5000000)
-
-    if data == None:
-        return None
-
-    if len(data) == 0:
-        wx.MessageBox("File is empty.", "Error", wx.OK, frame)
-
-        return None
+    checkNotEmpty(data)
 
     elemMap = {
         "Action" : screenplay.ACTION,
@@ -49,8 +71,7 @@ def importAstx(fileName, frame):
     try:
         root = etree.XML(data)
     except etree.XMLSyntaxError, e:
-        wx.MessageBox("Error parsing file: %s" %e, "Error", wx.OK, frame)
-        return None
+        raise MiscError("Error parsing file: %s" % e)
 
     lines = []
 
@@ -85,28 +106,23 @@ def importAstx(fileName, frame):
         addElem(lt, items)
 
     if not lines:
-        wx.MessageBox("File has no content.", "Error", wx.OK, frame)
-        return None
+        raise MiscError("File has no content.")
 
     return lines
 
 # like importTextFile, but for fadein files.
 def importFadein(fileName, frame):
-    # Fadein file is a zipped document.xml file.
-    # the .xml is in open screenplay format:
-    # http://sourceforge.net/projects/openscrfmt/files/latest/download
-
     # the 5 MB limit is arbitrary, we just want to avoid getting a
     # MemoryError exception for /dev/zero etc.
-    data = util.loadFile(fileName, frame, 5000000)
-
-    if data == None:
-        return None
+    return importWith(parseFadein, fileName, frame, 5000000)
 
-    if len(data) == 0:
-        wx.MessageBox("File is empty.", "Error", wx.OK, frame)
+# like parseAstx, but for fadein files.
+def parseFadein(data):
+    # Fadein file is a zipped document.xml file.
+    # the .xml is in open screenplay format:
+    # http://sourceforge.net/projects/openscrfmt/files/latest/download
 
-        return None
+    checkNotEmpty(data)
 
     buf = StringIO.StringIO(data)
 
@@ -116,12 +132,10 @@ def importFadein(fileName, frame):
         content = f.read()
         z.close()
     except:
-        wx.MessageBox("File is not a valid .fadein file.", "Error", wx.OK, frame)
-        return None
+        raise MiscError("File is not a valid .fadein file.")
 
     if not content:
-        wx.MessageBox("Script seems to be empty.", "Error", wx.OK, frame)
-        return None
+        raise MiscError("Script seems to be empty.")
 
     elemMap = {
         "Action" : screenplay.ACTION,
@@ -136,8 +150,7 @@ def importFadein(fileName, frame):
     try:
         root = etree.XML(content)
     except etree.XMLSyntaxError, e:
-        wx.MessageBox("Error parsing file: %s" %e, "Error", wx.OK, frame)
-        return None
+        raise MiscError("Error parsing file: %s" % e)
 
     lines = []
 
@@ -201,50 +214,42 @@ def importFadein(fileName, frame):
         addElem(lt, items)
 
     if len(lines) == 0:
-        wx.MessageBox("The file contains no importable lines", "Error", wx.OK, frame)
-        return None
+        raise MiscError("The file contains no importable lines")
 
     return lines
 
 # like importTextFile, but for Celtx files.
 def importCeltx(fileName, frame):
-    # Celtx files are zipfiles, and the script content is within a file
-    # called "script-xxx.html", where xxx can be random.
-
     # the 5 MB limit is arbitrary, we just want to avoid getting a
     # MemoryError exception for /dev/zero etc.
-    data = util.loadFile(fileName, frame, 5000000)
+    return importWith(parseCeltx, fileName, frame, 5000000)
 
-    if data == None:
-        return None
-
-    if len(data) == 0:
-        wx.MessageBox("File is empty.", "Error", wx.OK, frame)
+# like parseAstx, but for Celtx files.
+def parseCeltx(data):
+    # Celtx files are zipfiles, and the script content is within a file
+    # called "script-xxx.html", where xxx can be random.
 
-        return None
+    checkNotEmpty(data)
 
     buf = StringIO.StringIO(data)
 
     try:
         z = zipfile.ZipFile(buf)
     except:
-        wx.MessageBox("File is not a valid Celtx script file.", "Error", wx.OK, frame)
-        return None
+        raise MiscError("File is not a valid Celtx script file.")
 
     files = z.namelist()
     scripts = [s for s in files if s.startswith("script") ]
 
     if len(scripts) == 0:
-        wx.MessageBox("Unable to find script in this Celtx file.", "Error", wx.OK, frame)
-        return None
+        raise MiscError("Unable to find script in this Celtx file.")
 
     f = z.open(scripts[0])
     content = f.read()
     z.close()
 
     if not content:
-        wx.MessageBox("Script seems to be empty.", "Error", wx.OK, frame)
-        return None
+        raise MiscError("Script seems to be empty.")
 
     elemMap = {
         "action" : screenplay.ACTION,
@@ -261,8 +266,7 @@ def importCeltx(fileName, frame):
         parser = etree.HTMLParser()
         root = etree.XML(content, parser)
     except etree.XMLSyntaxError, e:
-        wx.MessageBox("Error parsing file: %s" %e, "Error", wx.OK, frame)
-        return None
+        raise MiscError("Error parsing file: %s" % e)
 
     lines = []
 
@@ -290,13 +294,40 @@ def importCeltx(fileName, frame):
             addElem(lt, items)
 
     if len(lines) == 0:
-        wx.MessageBox("The file contains no importable lines", "Error", wx.OK, frame)
-        return None
+        raise MiscError("The file contains no importable lines")
 
     return lines
 
 # like importTextFile, but for Final Draft files.
 def importFDX(fileName, frame):
+    f = util.openFile(fileName, frame)
+
+    if f == None:
+        return None
+
+    try:
+        return parseFDXFile(f)
+
+    except IOError, (errno, strerror):
+        wx.MessageBox("Error loading file '%s': %s" % (
+                fileName, strerror), "Error", wx.OK, frame)
+
+    except MiscError, e:
+        wx.MessageBox(str(e), "Error", wx.OK, frame)
+
+    finally:
+        f.close()
+
+    return None
+
+# like parseAstx, but for Final Draft files.
+def parseFDX(data):
+    return parseFDXFile(StringIO.StringIO(data))
+
+# like parseFDX, but parse the XML incrementally from file object 'f',
+# which must be seekable, discarding each paragraph once it's been
+# imported, so that only the resulting Lines are held in memory.
+def parseFDXFile(f):
     elemMap = {
         "Action" : screenplay.ACTION,
         "Character" : screenplay.CHARACTER,
@@ -307,89 +338,170 @@ def importFDX(fileName, frame):
         "Transition" : screenplay.TRANSITION,
     }
 
-    # the 5 MB limit is arbitrary, we just want to avoid getting a
-    # MemoryError exception for /dev/zero etc.
-    data = util.loadFile(fileName, frame, 5000000)
+    checkNotEmpty(f.read(1))
+    f.seek(0)
 
-    if data == None:
-        return None
+    lines = []
 
-    if len(data) == 0:
-        wx.MessageBox("File is empty.", "Error", wx.OK, frame)
+    def addElem(eleType, eleText):
+        lns = eleText.split("\n")
 
-        return None
+        # if elem ends in a newline, last line is empty and useless;
+        # get rid of it
+        if not lns[-1] and (len(lns) > 1):
+            lns = lns[:-1]
 
-    try:
-        root = etree.XML(data)
-        lines = []
+        for s in lns[:-1]:
+            lines.append(screenplay.Line(
+                    screenplay.LB_FORCED, eleType, util.cleanInput(s)))
 
-        def addElem(eleType, eleText):
-            lns = eleText.split("\n")
+        lines.append(screenplay.Line(
+                screenplay.LB_LAST, eleType, util.cleanInput(lns[-1])))
 
-            # if elem ends in a newline, last line is empty and useless;
-            # get rid of it
-            if not lns[-1] and (len(lns) > 1):
-                lns = lns[:-1]
+    def addPara(para):
+        addedNote = False
+        et = para.get("Type")
 
-            for s in lns[:-1]:
-                lines.append(screenplay.Line(
-                        screenplay.LB_FORCED, eleType, util.cleanInput(s)))
+        # Check for script notes
+        s = u""
+        for note in para.iterchildren("ScriptNote"):
+            for notePara in note.iterchildren("Paragraph"):
+                for notes in notePara.iterchildren("Text"):
+                    if notes.text:
+                        s += notes.text
 
-            lines.append(screenplay.Line(
-                    screenplay.LB_LAST, eleType, util.cleanInput(lns[-1])))
+                    # FD has AdornmentStyle set to "0" on notes with
+                    # newline.
+                    if notes.get("AdornmentStyle") == "0":
+                        s += "\n"
 
-        for para in root.xpath("Content//Paragraph"):
-            addedNote = False
-            et = para.get("Type")
+        if s:
+            addElem(screenplay.NOTE, s)
+            addedNote = True
+
+        # "General" has embedded Dual Dialogue paragraphs inside it;
+        # nothing to do for the General element itself.
+        #
+        # If no type is defined (like inside scriptnote), skip.
+        if (et == "General") or (et is None):
+            return
+
+        # text.text is None for paragraphs with no text, and join blows
+        # up trying to add a string object and None, so guard against
+        # that
+        s = u"".join([text.text for text in para.iterchildren("Text")
+                      if text.text])
+
+        # don't remove paragraphs with no text, unless that paragraph
+        # contained a scriptnote
+        if s or not addedNote:
+            lt = elemMap.get(et, screenplay.ACTION)
+            addElem(lt, s)
+
+    # the paragraphs imported are the ones under the Content element
+    # directly under the root, including ones nested in other paragraphs
+    # (script notes, dual dialogue). returns True for paragraphs to
+    # import, False for ones nested in other paragraphs, which are
+    # handled along with the outermost paragraph they're in so that they
+    # are all imported in document order, and None for ones not imported
+    # at all.
+    def classify(para):
+        parent = para.getparent()
+
+        while parent is not None:
+            grandParent = parent.getparent()
+
+            if grandParent is None:
+                return None
+
+            if parent.tag == "Paragraph":
+                return False
+
+            if (parent.tag == "Content") and \
+                   (grandParent.getparent() is None):
+                return True
+
+            parent = grandParent
 
-            # Check for script notes
-            s = u""
-            for notes in para.xpath("ScriptNote/Paragraph/Text"):
-                if notes.text:
-                    s += notes.text
+        return None
 
-                # FD has AdornmentStyle set to "0" on notes with newline.
-                if notes.get("AdornmentStyle") == "0":
-                    s += "\n"
+    try:
+        for event, para in etree.iterparse(f, tag = "Paragraph"):
+            res = classify(para)
 
-            if s:
-                addElem(screenplay.NOTE, s)
-                addedNote = True
-
-            # "General" has embedded Dual Dialogue paragraphs inside it;
-            # nothing to do for the General element itself.
-            #
-            # If no type is defined (like inside scriptnote), skip.
-            if (et == "General") or (et is None):
-                continue
+            if res:
+                for p in para.iter("Paragraph"):
+                    addPara(p)
 
-            s = u""
-            for text in para.xpath("Text"):
-                # text.text is None for paragraphs with no text, and +=
-                # blows up trying to add a string object and None, so
-                # guard against that
-                if text.text:
-                    s += text.text
+            if res != False:
+                # drop the paragraph, and anything before it, from the
+                # tree
+                para.clear()
 
-            # don't remove paragraphs with no text, unless that paragraph
-            # contained a scriptnote
-            if s or not addedNote:
-                lt = elemMap.get(et, screenplay.ACTION)
-                addElem(lt, s)
+                while para.getprevious() is not None:
+                    del para.getparent()[0]
 
         if len(lines) == 0:
-            wx.MessageBox("The file contains no importable lines", "Error", wx.OK, frame)
-            return None
+            raise MiscError("The file contains no importable lines")
 
         return lines
 
     except etree.XMLSyntaxError, e:
-        wx.MessageBox("Error parsing file: %s" %e, "Error", wx.OK, frame)
-        return None
+        raise MiscError("Error parsing file: %s" % e)
 
 # import Fountain files.
 # http://fountain.io
 def importFountain(fileName, frame):
+    f = util.openFile(fileName, frame)
+
+    if f == None:
+        return None
+
+    try:
+        data = f.read(1)
+
+        if len(data) == 0:
+            wx.MessageBox("File is empty.", "Error", wx.OK, frame)
+            return None
+
+        inf = []
+        inf.append(misc.CheckBoxItem("Import titles as action lines."))
+        inf.append(misc.CheckBoxItem("Remove unsupported formatting markup."))
+        inf.append(misc.CheckBoxItem("Import section/synopsis as notes."))
+
+        dlg = misc.CheckBoxDlg(frame, "Fountain import options", inf,
+            "Import options:", False)
+
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return None
+
+        return parseFountainFile(f, inf[0].selected, inf[1].selected,
+            inf[2].selected,
+            frame.panel.ctrl.sp.cfg.getType(screenplay.ACTION).width, data)
+
+    except IOError, (errno, strerror):
+        wx.MessageBox("Error loading file '%s': %s" % (
+                fileName, strerror), "Error", wx.OK, frame)
+
+        return None
+
+    finally:
+        f.close()
+
+# like parseAstx, but for Fountain files. the flags correspond to the
+# import options importFountain asks the user for. actionWidth is the
+# width of action lines, used for centering text.
+def parseFountain(data, importTitles = True, removeMarkdown = True,
+                  importSectSyn = True, actionWidth = 60):
+    return parseFountainFile(StringIO.StringIO(data), importTitles,
+        removeMarkdown, importSectSyn, actionWidth)
+
+# like parseFountain, but read the Fountain file from file object 'f' a
+# line at a time, so that only the resulting Lines are held in memory.
+# 'data' is anything already read from 'f'.
+def parseFountainFile(f, importTitles = True, removeMarkdown = True,
+                      importSectSyn = True, actionWidth = 60, data = ""):
     # regular expressions for fountain markdown.
     # https://github.com/vilcans/screenplain/blob/master/screenplain/richstring.py
     ire = re.compile(
@@ -422,7 +534,7 @@ def importFountain(fileName, frame):
             # finishing with underline
             r'(?<=\S)_'
         )
-    boneyard_re = re.compile('/\\*.*?\\*/', flags=re.DOTALL)
+    scene_re = re.compile(r'(INT|EXT|EST|INT\.?/EXT\.?|I/E)[ .]')
 
     # random magicstring used to escape literal star '\*'
     literalstar = "Aq7RR"
@@ -434,98 +546,55 @@ def importFountain(fileName, frame):
             s = style.sub(r'\1', s)
         return s.replace(literalstar, "*")
 
-    data = util.loadFile(fileName, frame, 1000000)
-
-    if data == None:
-        return None
-
-    if len(data) == 0:
-        wx.MessageBox("File is empty.", "Error", wx.OK, frame)
-        return None
-
-    inf = []
-    inf.append(misc.CheckBoxItem("Import titles as action lines."))
-    inf.append(misc.CheckBoxItem("Remove unsupported formatting markup."))
-    inf.append(misc.CheckBoxItem("Import section/synopsis as notes."))
-
-    dlg = misc.CheckBoxDlg(frame, "Fountain import options", inf,
-        "Import options:", False)
-
-    if dlg.ShowModal() != wx.ID_OK:
-        dlg.Destroy()
-        return None
+    # returns s converted to ISO-8859-1 if it's not ASCII, which case
+    # it's assumed to be UTF-8.
+    def decode(s):
+        try:
+            util.toLatin1(s)
+        except UnicodeError:
+            s = util.cleanInput(s.decode("UTF-8", "ignore"))
+        return s
 
-    importTitles = inf[0].selected
-    removeMarkdown = inf[1].selected
-    importSectSyn = inf[2].selected
+    if not data:
+        data = f.read(1)
 
-    # pre-process data - fix newlines, remove boneyard.
-    data = util.fixNL(data)
-    data = boneyard_re.sub('', data)
-    prelines = data.split("\n")
-    for i in xrange(len(prelines)):
-        try:
-            util.toLatin1(prelines[i])
-        except:
-            prelines[i] = util.cleanInput(u"" + prelines[i].decode('UTF-8', "ignore"))
-    lines = []
+    checkNotEmpty(data)
 
     tabWidth = 4
-    lns = []
-    sceneStartsList = ("INT", "EXT", "EST", "INT./EXT", "INT/EXT", "I/E", "I./E")
     TWOSPACE = "  "
-    skipone = False
 
-    # First check if title lines are present:
-    c = 0
-    while c < len(prelines):
-        if prelines[c] != "":
-            c = c+1
-        else:
+    # pre-process lines - fix newlines, remove boneyard.
+    lines = (decode(s) for s in removeBoneyard(util.iterLines(f, data)))
+
+    # First check if title lines are present. head is the first bunch of
+    # lines, that could be titles, and sep the empty line after them, if
+    # any.
+    head = []
+    sep = []
+    for s in lines:
+        if s == "":
+            sep.append(s)
             break
+        head.append(s)
 
-    # prelines[0:i] are the first bunch of lines, that could be titles.
     # Our check for title is simple:
     #   - the line does not start with 'fade'
     #   - the first line has a single ':'
 
-    if c > 0:
-        l = util.toInputStr(prelines[0].expandtabs(tabWidth).lstrip().lower())
+    if head:
+        l = util.toInputStr(head[0].expandtabs(tabWidth).lstrip().lower())
         if not l.startswith("fade") and l.count(":") == 1:
             # these are title lines. Now do what the user requested.
             if importTitles:
                 # add TWOSPACE to all the title lines.
-                for i in xrange(c):
-                    prelines[i] += TWOSPACE
+                head = [s + TWOSPACE for s in head]
             else:
                 #remove these lines
-                prelines = prelines[c+1:]
-
-    for l in prelines:
-        if l != TWOSPACE:
-            lines.append(util.toInputStr(l.expandtabs(tabWidth)))
-        else:
-            lines.append(TWOSPACE)
-
-    linesLen = len(lines)
+                head = []
+                sep = []
 
-    def isPrevEmpty():
-        if lns and lns[-1].text == "":
-            return True
-        return False
-
-    def isPrevType(ltype):
-        return (lns and lns[-1].lt == ltype)
-
-    # looks ahead to check if next line is not empty
-    def isNextEmpty(i):
-        return  (i+1 < len(lines) and lines[i+1] == "")
-
-    def getPrevType():
-        if lns:
-            return lns[-1].lt
-        else:
-            return screenplay.ACTION
+    lines = (util.toInputStr(s.expandtabs(tabWidth))
+             for s in itertools.chain(head, sep, lines))
 
     def isParen(s):
         return (s.startswith('(') and s.endswith(')'))
@@ -535,12 +604,7 @@ def importFountain(fileName, frame):
             return False
         if s.startswith(".") and not s.startswith(".."):
             return True
-        tmp = s.upper()
-        if (re.match(r'^(INT|EXT|EST)[ .]', tmp) or
-            re.match(r'^(INT\.?/EXT\.?)[ .]', tmp) or
-            re.match(r'^I/E[ .]', tmp)):
-            return True
-        return False
+        return scene_re.match(s.upper()) != None
 
     def isTransition(s):
         return ((s.isupper() and s.endswith("TO:")) or
@@ -561,17 +625,19 @@ def importFountain(fileName, frame):
     def isSynopsis(s):
         return s.startswith("=") and not s.startswith("==")
 
-    # first pass - identify linetypes
-    for i in range(linesLen):
-        if skipone:
-            skipone = False
-            continue
-
-        s = lines[i]
+    # return a Line for line 's', or None if it's to be skipped. prev is
+    # the Line returned for the previous line that wasn't skipped, or None.
+    # isNextEmpty is True if the next line is empty.
+    def parseLine(s, prev, isNextEmpty):
         sl = s.lstrip()
         # mark as ACTION by default.
         line = screenplay.Line(screenplay.LB_FORCED, screenplay.ACTION, s)
 
+        prevType = prev.lt if prev else screenplay.ACTION
+        isPrevEmpty = prev and prev.text == ""
+        isPrevSpeech = prev and prev.lt in (screenplay.CHARACTER,
+            screenplay.DIALOGUE, screenplay.PAREN)
+
         # Start testing lines for element type. Go in order:
         # Scene Character, Paren, Dialog, Transition, Note.
 
@@ -580,7 +646,7 @@ def importFountain(fileName, frame):
             pass
 
         elif s == TWOSPACE:
-            line.lt = getPrevType()
+            line.lt = prevType
 
         elif isScene(s):
             line.lt = screenplay.SCENE
@@ -589,23 +655,21 @@ def importFountain(fileName, frame):
             else:
                 line.text = sl
 
-        elif isTransition(sl) and isPrevEmpty() and isNextEmpty(i):
+        elif isTransition(sl) and isPrevEmpty and isNextEmpty:
             line.lt = screenplay.TRANSITION
             if line.text.startswith('>'):
                 line.text = sl[1:].lstrip()
 
-        elif s.isupper() and isPrevEmpty() and not isNextEmpty(i):
+        elif s.isupper() and isPrevEmpty and not isNextEmpty:
             line.lt = screenplay.CHARACTER
             if s.endswith(TWOSPACE):
                 line.lt = screenplay.ACTION
 
-        elif isParen(sl) and (isPrevType(screenplay.CHARACTER) or
-                                isPrevType(screenplay.DIALOGUE)):
+        elif isParen(sl) and prev and (prev.lt in (screenplay.CHARACTER,
+                                                   screenplay.DIALOGUE)):
             line.lt = screenplay.PAREN
 
-        elif (isPrevType(screenplay.CHARACTER) or
-             isPrevType(screenplay.DIALOGUE) or
-             isPrevType(screenplay.PAREN)):
+        elif isPrevSpeech:
             line.lt = screenplay.DIALOGUE
 
         elif isNote(sl):
@@ -614,9 +678,7 @@ def importFountain(fileName, frame):
 
         elif isSection(s) or isSynopsis(s):
             if not importSectSyn:
-                if isNextEmpty(i):
-                    skipone = True
-                continue
+                return None
 
             line.lt = screenplay.NOTE
             line.text = sl.lstrip('=#')
@@ -632,9 +694,8 @@ def importFountain(fileName, frame):
             # we don't support center align, so simply add required indent.
             if isCentered(tmp):
                 tmp = tmp[1:-1].strip()
-                width = frame.panel.ctrl.sp.cfg.getType(screenplay.ACTION).width
-                if len(tmp) < width:
-                    tmp = ' ' * ((width - len(tmp)) // 2) + tmp
+                if len(tmp) < actionWidth:
+                    tmp = ' ' * ((actionWidth - len(tmp)) // 2) + tmp
             line.text = tmp
 
         if removeMarkdown:
@@ -642,39 +703,93 @@ def importFountain(fileName, frame):
             if line.lt == screenplay.CHARACTER and line.text.endswith('^'):
                 line.text = line.text[:-1]
 
-        lns.append(line)
+        return line
 
     ret = []
+    prev = None
+
+    # identify linetypes a line at a time, looking one line ahead, and
+    # at the same time remove unneeded empty lines and fix the
+    # linebreaks.
+    s = next(lines, None)
+    while s != None:
+        nextLine = next(lines, None)
+        line = parseLine(s, prev, nextLine == "")
+
+        if line:
+            if line.text == '':
+                if ret and ret[-1].lb == screenplay.LB_FORCED:
+                    ret[-1].lb = screenplay.LB_LAST
+                else:
+                    ret.append(line)
 
-    # second pass helper functions.
-    def isLastLBForced():
-        return ret and ret[-1].lb == screenplay.LB_FORCED
-
-    def makeLastLBLast():
-        if ret:
-            ret[-1].lb = screenplay.LB_LAST
-
-    def isRetPrevType(t):
-        return ret and ret[-1].lt == t
+            elif not (ret and ret[-1].lt == line.lt):
+                if ret:
+                    ret[-1].lb = screenplay.LB_LAST
+                ret.append(line)
 
-    # second pass - remove unneeded empty lines, and fix the linebreaks.
-    for ln in lns:
-        if ln.text == '':
-            if isLastLBForced():
-                makeLastLBLast()
             else:
-                ret.append(ln)
+                ret.append(line)
 
-        elif not isRetPrevType(ln.lt):
-            makeLastLBLast()
-            ret.append(ln)
+            prev = line
 
-        else:
-            ret.append(ln)
+        # a skipped section/synopsis takes the empty line after it with it
+        elif nextLine == "":
+            nextLine = next(lines, None)
+
+        s = nextLine
 
-    makeLastLBLast()
+    if ret:
+        ret[-1].lb = screenplay.LB_LAST
     return ret
 
+# return iterator over 'lines' with Fountain boneyard (/* ... */)
+# removed. boneyard can span lines, in which case the text before and
+# after it is joined into one line. an unterminated boneyard is not
+# removed.
+def removeBoneyard(lines):
+    # text before an unterminated "/*", and the lines from that on, while
+    # looking for the "*/"
+    prefix = ""
+    pending = None
+
+    for s in lines:
+        pos = 0
+
+        if pending != None:
+            pending.append(s)
+
+            end = s.find("*/")
+            if end == -1:
+                continue
+
+            pos = len(prefix)
+            s = prefix + s[end + 2:]
+            pending = None
+
+        while True:
+            start = s.find("/*", pos)
+            if start == -1:
+                break
+
+            end = s.find("*/", start + 2)
+            if end == -1:
+                prefix = s[:start]
+                pending = [s[start:]]
+                break
+
+            s = s[:start] + s[end + 2:]
+            pos = start
+
+        if pending == None:
+            yield s
+
+    if pending != None:
+        yield prefix + pending[0]
+
+        for s in pending[1:]:
+            yield s
+
 # import text file from fileName, return list of Line objects for the
 # screenplay or None if something went wrong. returned list always
 # contains at least one line.
@@ -687,11 +802,35 @@ def importTextFile(fileName, frame):
     if data == None:
         return None
 
-    if len(data) == 0:
-        wx.MessageBox("File is empty.", "Error", wx.OK, frame)
+    try:
+        lines, indDict = analyzeText(data)
+    except MiscError, e:
+        wx.MessageBox(str(e), "Error", wx.OK, frame)
 
         return None
 
+    dlg = ImportDlg(frame, indDict.values())
+
+    if dlg.ShowModal() != wx.ID_OK:
+        dlg.Destroy()
+
+        return None
+
+    dlg.Destroy()
+
+    return textToLines(lines, indDict)
+
+# like parseAstx, but for text files. uses the guessed line types for
+# each indent without asking the user, as needed by the batch converter.
+def parseTextFile(data):
+    return textToLines(*analyzeText(data))
+
+# split text file contents 'data' into lines and guess the line type of
+# each indentation level. returns (lines, indDict), where indDict maps
+# indent levels to Indent objects. raises MiscError on errors.
+def analyzeText(data):
+    checkNotEmpty(data)
+
     data = util.fixNL(data)
     lines = data.split("\n")
 
@@ -731,9 +870,7 @@ def importTextFile(fileName, frame):
         lines[i] = s
 
     if len(indDict) == 0:
-        wx.MessageBox("File contains only empty lines.", "Error", wx.OK, frame)
-
-        return None
+        raise MiscError("File contains only empty lines.")
 
     # scene/action indent
     setType(SCENE_ACTION, indDict, lambda v: v.sceneStart)
@@ -771,15 +908,11 @@ def importTextFile(fileName, frame):
         if v.lt == -1:
             v.lt = screenplay.ACTION
 
-    dlg = ImportDlg(frame, indDict.values())
-
-    if dlg.ShowModal() != wx.ID_OK:
-        dlg.Destroy()
-
-        return None
-
-    dlg.Destroy()
+    return (lines, indDict)
 
+# convert lines analyzed by analyzeText to a list of Line objects, using
+# the line types set in indDict.
+def textToLines(lines, indDict):
     ret = []
 
     for i in range(len(lines)):
@@ -1,7 +1,18 @@
+import util
+
 import array
 import collections
+import marshal
+
+# search types for NameArray.search
+BEGINS = 0
+CONTAINS = 1
+ENDS = 2
 
 class NameArray:
+    # version of the index file format, see save
+    INDEX_VERSION = 1
+
     def __init__(self):
         self.maxCount = 205000
         self.count = 0
@@ -23,6 +34,24 @@ class NameArray:
         # type names indexed by their integer id
         self.typeNamesById = []
 
+        # search index, built by buildIndex. lowercase names by id, sorted
+        # lowercase names and their ids, and the same for reversed names.
+        self.lnames = None
+        self.prefixKeys = None
+        self.prefixIds = None
+        self.suffixKeys = None
+        self.suffixIds = None
+
+        # key = three-character substring, value = array of ids of names
+        # containing it, in ascending order
+        self.trigrams = None
+
+        # ids of names shorter than three characters
+        self.shortIds = None
+
+        # key = (type id, sex), value = array of ids of such names
+        self.typeSexIds = None
+
     def append(self, name, type, sex):
         if self.count >= self.maxCount:
             for i in range(1000):
@@ -51,3 +80,189 @@ class NameArray:
             self.typeNamesById.append(type)
 
         return typeId
+
+    # build the search index. must be called after all names have been
+    # appended and before search is called.
+    def buildIndex(self):
+        self.lnames = [util.lower(n) for n in self.name[:self.count]]
+
+        self.prefixIds = array.array("I", sorted(xrange(self.count),
+            key = self.lnames.__getitem__))
+        self.prefixKeys = [self.lnames[i] for i in self.prefixIds]
+
+        rnames = [n[::-1] for n in self.lnames]
+        self.suffixIds = array.array("I", sorted(xrange(self.count),
+            key = rnames.__getitem__))
+        self.suffixKeys = [rnames[i] for i in self.suffixIds]
+
+        trigrams = collections.defaultdict(list)
+        self.shortIds = array.array("I")
+        self.typeSexIds = {}
+
+        for i, name in enumerate(self.lnames):
+            if len(name) < 3:
+                self.shortIds.append(i)
+
+            for g in set([name[j:j + 3] for j in xrange(len(name) - 2)]):
+                trigrams[g].append(i)
+
+            key = (self.type[i], self.sex[i])
+            ids = self.typeSexIds.get(key)
+
+            if ids is None:
+                ids = self.typeSexIds[key] = array.array("I")
+
+            ids.append(i)
+
+        self.trigrams = {}
+
+        for g, ids in trigrams.iteritems():
+            self.trigrams[g] = array.array("I", ids)
+
+    # return list of ids of names matching lowercase string 's' in the way
+    # given by 'mode' (BEGINS / CONTAINS / ENDS), in ascending order. an
+    # empty 's' matches all names. sex is 0 / 1 to only include female /
+    # male names, or None for both. types is a dict of type ids to include,
+    # or None for all types.
+    def search(self, s, mode, sex, types):
+        if not s:
+            if (sex is None) and (types is None):
+                return range(self.count)
+
+            ids = []
+
+            for (typeId, sx), tmp in self.typeSexIds.iteritems():
+                if ((sex is None) or (sx == sex)) and \
+                       ((types is None) or (typeId in types)):
+                    ids.extend(tmp)
+
+            ids.sort()
+
+            return ids
+
+        if mode == BEGINS:
+            lo, hi = util.prefixRange(self.prefixKeys, s)
+            ids = self.prefixIds[lo:hi]
+        elif mode == ENDS:
+            lo, hi = util.prefixRange(self.suffixKeys, s[::-1])
+            ids = self.suffixIds[lo:hi]
+        else:
+            ids = self.findSubstring(s)
+
+        if (sex is not None) or (types is not None):
+            ids = [i for i in ids if ((sex is None) or (self.sex[i] == sex))
+                   and ((types is None) or (self.type[i] in types))]
+
+        return sorted(ids)
+
+    # return ids of names containing lowercase string 's', in no particular
+    # order.
+    def findSubstring(self, s):
+        if len(s) >= 3:
+            postings = []
+
+            for j in xrange(len(s) - 2):
+                ids = self.trigrams.get(s[j:j + 3])
+
+                if ids is None:
+                    return []
+
+                postings.append(ids)
+
+            ids = min(postings, key = len)
+
+            if len(s) == 3:
+                return ids
+
+            lnames = self.lnames
+
+            return [i for i in ids if s in lnames[i]]
+
+        # shorter strings are found from all the trigrams containing them,
+        # plus the names too short to have any
+        ret = set([i for i in self.shortIds if s in self.lnames[i]])
+
+        for g, ids in self.trigrams.iteritems():
+            if s in g:
+                ret.update(ids)
+
+        return ret
+
+    # save the names and the search index to file object 'f'. 'stamp' is
+    # stored along with them, see load.
+    def save(self, f, stamp):
+        f.write(marshal.dumps({
+            "version" : self.INDEX_VERSION,
+            "stamp" : stamp,
+            "itemsize" : self.prefixIds.itemsize,
+            "names" : "\n".join(self.name[:self.count]),
+            "type" : self.type[:self.count].tostring(),
+            "sex" : self.sex[:self.count].tostring(),
+            "typeNamesById" : self.typeNamesById,
+            "typeNamesCnt" : dict(self.typeNamesCnt),
+            "lnames" : "\n".join(self.lnames),
+            "prefixKeys" : "\n".join(self.prefixKeys),
+            "prefixIds" : self.prefixIds.tostring(),
+            "suffixKeys" : "\n".join(self.suffixKeys),
+            "suffixIds" : self.suffixIds.tostring(),
+            "trigrams" : dict([(g, ids.tostring()) for g, ids in
+                               self.trigrams.iteritems()]),
+            "shortIds" : self.shortIds.tostring(),
+            "typeSexIds" : dict([(k, ids.tostring()) for k, ids in
+                                 self.typeSexIds.iteritems()]),
+            }, 2))
+
+    # load NameArray, with its search index, saved by save from file object
+    # 'f'. returns None if the file is not a valid index file or its stamp
+    # is not 'stamp'.
+    @staticmethod
+    def load(f, stamp):
+        try:
+            d = marshal.loads(f.read())
+        except (EOFError, ValueError, TypeError):
+            return None
+
+        if not isinstance(d, dict) or \
+               (d.get("version") != NameArray.INDEX_VERSION) or \
+               (d.get("itemsize") != array.array("I").itemsize) or \
+               (d.get("stamp") != stamp):
+            return None
+
+        def ids(s):
+            return array.array("I", s)
+
+        res = NameArray()
+
+        try:
+            res.name = d["names"].split("\n")
+            res.count = res.maxCount = len(res.name)
+            res.type = array.array("B", d["type"])
+            res.sex = array.array("B", d["sex"])
+            res.typeNamesById = d["typeNamesById"]
+            res.typeNamesCnt.update(d["typeNamesCnt"])
+
+            for i, typeName in enumerate(res.typeNamesById):
+                res.typeId[typeName] = i
+
+            res.lnames = d["lnames"].split("\n")
+            res.prefixKeys = d["prefixKeys"].split("\n")
+            res.prefixIds = ids(d["prefixIds"])
+            res.suffixKeys = d["suffixKeys"].split("\n")
+            res.suffixIds = ids(d["suffixIds"])
+            res.shortIds = ids(d["shortIds"])
+
+            res.trigrams = {}
+            for g, s in d["trigrams"].iteritems():
+                res.trigrams[g] = ids(s)
+
+            res.typeSexIds = {}
+            for k, s in d["typeSexIds"].iteritems():
+                res.typeSexIds[k] = ids(s)
+        except (KeyError, AttributeError, TypeError, ValueError):
+            return None
+
+        if not (res.count == len(res.type) == len(res.sex) ==
+                len(res.lnames) == len(res.prefixIds) == len(res.suffixIds)):
+            return None
+
+        return res
@@ -2,11 +2,18 @@ import misc
 import namearray
 import util
 
+import os
+
 import wx
 
 # NameArray, or None if not loaded
 nameArr = None
 
+# name of the file the name database and its search index are saved in
+# for faster loading. it's written next to names.txt, or if that's not
+# possible, in the configuration directory.
+INDEX_FILE = u"names.idx"
+
 # if not already loaded, read the name database from disk and store it.
 # returns False on errors.
 def readNames(frame):
@@ -17,25 +24,34 @@ def readNames(frame):
         return True
 
     try:
-        data = util.loadMaybeCompressedFile(u"names.txt", frame)
+        fileName = u"names.txt"
+
+        if not util.fileExists(fileName):
+            fileName += u".gz"
+
+        # the index is valid as long as the file it was made from is the
+        # same
+        st = os.stat(misc.toPath(fileName))
+        stamp = (fileName, st.st_size, int(st.st_mtime))
+
+        indexFiles = [INDEX_FILE, os.path.join(misc.confPath, INDEX_FILE)]
+
+        for fn in indexFiles:
+            nameArr = loadIndex(fn, stamp)
+
+            if nameArr:
+                return True
+
+        data = util.loadMaybeCompressedFile(fileName, frame)
         if not data:
             return False
 
-        res = namearray.NameArray()
-        nameType = None
-
-        for line in data.splitlines():
-            ch = line[0]
-            if ch == "#":
-                continue
-            elif ch == "N":
-                nameType = line[1:]
-            elif ch in ("M", "F"):
-                if not nameType:
-                    raise Exception("No name type set before line: '%s'" % line)
-                res.append(line[1:], nameType, ch)
-            else:
-                raise Exception("Unknown linetype for line: '%s'" % line)
+        res = parseNames(data)
+        res.buildIndex()
+
+        for fn in indexFiles:
+            if saveIndex(res, fn, stamp):
+                break
 
         nameArr = res
 
@@ -48,6 +64,62 @@ def readNames(frame):
 
         return False
 
+# parse contents of names.txt and return it as a NameArray, without the
+# search index. raises Exception on errors.
+def parseNames(data):
+    res = namearray.NameArray()
+    nameType = None
+
+    for line in data.splitlines():
+        ch = line[0]
+        if ch == "#":
+            continue
+        elif ch == "N":
+            nameType = line[1:]
+        elif ch in ("M", "F"):
+            if not nameType:
+                raise Exception("No name type set before line: '%s'" % line)
+            res.append(line[1:], nameType, ch)
+        else:
+            raise Exception("Unknown linetype for line: '%s'" % line)
+
+    return res
+
+# load NameArray saved by saveIndex from file 'fileName'. returns None if
+# it can't be read, or isn't for the names file described by 'stamp'.
+def loadIndex(fileName, stamp):
+    try:
+        f = open(misc.toPath(fileName), "rb")
+    except IOError:
+        return None
+
+    try:
+        return namearray.NameArray.load(f, stamp)
+    finally:
+        f.close()
+
+# save NameArray 'res' with its search index to file 'fileName'. returns
+# True on success. the file is only a cache, so errors are not reported.
+def saveIndex(res, fileName, stamp):
+    try:
+        f = open(misc.toPath(fileName), "wb")
+
+        try:
+            res.save(f, stamp)
+        finally:
+            f.close()
+
+        return True
+
+    except (IOError, OSError):
+        # don't leave a partial file around
+        try:
+            os.remove(misc.toPath(fileName))
+        except OSError:
+            pass
+
+        return False
+
 class NamesDlg(wx.Dialog):
     def __init__(self, parent, ctrl):
         wx.Dialog.__init__(self, parent, -1, "Character name database",
@@ -176,8 +248,6 @@ class NamesDlg(wx.Dialog):
             self.ctrl.OnKeyChar(util.MyKeyEvent(ord(ch)))
 
     def OnSearch(self, event = None):
-        l = []
-
         wx.BeginBusyCursor()
 
         s = util.lower(misc.fromGUI(self.searchEntry.GetValue()))
@@ -197,31 +267,12 @@ class NamesDlg(wx.Dialog):
             selTypes[self.typeList.GetItemData(item)] = True
 
         if len(selTypes) == len(nameArr.typeNamesCnt):
-            doTypes = False
-        else:
-            doTypes = True
-
-        for i in xrange(nameArr.count):
-            if (sex != 2) and (sex == nameArr.sex[i]):
-                continue
-
-            if doTypes and nameArr.type[i] not in selTypes:
-                continue
-
-            if s:
-                name = util.lower(nameArr.name[i])
+            selTypes = None
 
-                if nt == 0:
-                    if not name.startswith(s):
-                        continue
-                elif nt == 1:
-                    if name.find(s) == -1:
-                        continue
-                elif nt == 2:
-                    if not name.endswith(s):
-                        continue
+        # the radio box has male first, the name array female
+        sex = (1, 0, None)[sex]
 
-            l.append(i)
+        l = nameArr.search(s, nt, sex, selTypes)
 
         self.list.items = l
         self.list.SetItemCount(len(l))
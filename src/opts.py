@@ -5,7 +5,7 @@ import sys
 # line arguments are UTF-8 for now, and silently ignore any coding errors
 # that may result on Windows in some cases.
 def init():
-    global isTest, conf, filenames
+    global isTest, conf, filenames, profile
 
     # script filenames to load
     filenames = []
@@ -16,6 +16,9 @@ def init():
     # are we in test mode
     isTest = False
 
+    # file to write instrumentation stats to, or None (see instrument.py)
+    profile = None
+
     i = 1
     while i < len(sys.argv):
         arg = sys.argv[i]
@@ -26,6 +29,10 @@ def init():
             if (i + 1) < len(sys.argv):
                 conf = unicode(sys.argv[i + 1], "UTF-8", "ignore")
                 i += 1
+        elif arg == "--profile":
+            if (i + 1) < len(sys.argv):
+                profile = unicode(sys.argv[i + 1], "UTF-8", "ignore")
+                i += 1
         else:
             filenames.append(unicode(arg, "UTF-8", "ignore"))
 
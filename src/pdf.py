@@ -1,7 +1,10 @@
 import fontinfo
+import instrument
 import pml
 import util
 
+import cStringIO
+
 # PDF transform matrixes where key is the angle from x-axis
 # in counter-clockwise direction.
 TRANSFORM_MATRIX = {
@@ -9,10 +12,44 @@ TRANSFORM_MATRIX = {
     90 : (0, 1, -1, 0),
 }
 
-# users should only use this.
-def generate(doc):
+# users should only use this and generateTo. if pool is not None, it is a
+# multiprocessing.Pool used to generate page contents in parallel; the
+# output is identical either way.
+def generate(doc, pool = None):
+    output = cStringIO.StringIO()
+    generateTo(doc, output, pool)
+
+    return output.getvalue()
+
+# like generate, but write the PDF to file object 'output' as it is
+# generated, without holding all of it in memory.
+def generateTo(doc, output, pool = None):
     tmp = PDFExporter(doc)
-    return tmp.generate()
+    tmp.generateTo(output, pool)
+
+# generate page content streams in a worker process, for
+# PDFExporter.iterPageStreams. args is a (docHeight, fontNumbers,
+# firstPageNr, pages) tuple, where fontNumbers maps font flags to the font
+# numbers allocated for them and pages is a list of lists of PML ops.
+# returns a list of the pages' stream objects' contents.
+def genPageStreams(args):
+    h, fontNrs, pageNr, pages = args
+
+    pe = PDFExporter(pml.Document(0, h))
+    pe.fonts = {}
+
+    for flags, nr in fontNrs.iteritems():
+        fi = FontInfo("")
+        fi.number = nr
+        pe.fonts[flags] = fi
+
+    ret = []
+
+    for ops in pages:
+        ret.append(pe.genStream(pe.drawPage(ops, pageNr)))
+        pageNr += 1
+
+    return ret
 
 # An abstract base class for all PDF drawing operations.
 class PDFDrawOp:
@@ -24,9 +61,6 @@ class PDFDrawOp:
 
 class PDFTextOp(PDFDrawOp):
     def draw(self, pmlOp, pageNr, output, pe):
-        if pmlOp.toc:
-            pmlOp.toc.pageObjNr = pe.pageObjs[pageNr].nr
-
         # we need to adjust y position since PDF uses baseline of text as
         # the y pos, but pml uses top of the text as y pos. The Adobe
         # standard Courier family font metrics give 157 units in 1/1000
@@ -168,23 +202,46 @@ class PDFObject:
         # when the object is written out (by the caller of write).
         self.xrefPos = -1
 
-    # write object to output (util.String).
+    # write object to output (util.String or PDFWriter).
     def write(self, output):
         output += "%d 0 obj\n" % self.nr
         output += self.data
         output += "\nendobj\n"
 
+# a wrapper for a file object that the PDF is written to, which keeps track
+# of the current position for the xref table. supports the parts of
+# util.String's interface that PDFExporter.genPDF uses.
+class PDFWriter:
+    def __init__(self, f):
+        self.f = f
+        self.pos = 0
+
+    def __iadd__(self, s):
+        self.f.write(s)
+        self.pos += len(s)
+
+        return self
+
+    def __len__(self):
+        return self.pos
+
 class PDFExporter:
     # see genWidths
     _widthsStr = None
 
+    # how many pages to give a worker process at a time, and the minimum
+    # nr of pages for which to bother with worker processes at all
+    PAGES_PER_TASK = 8
+    MIN_PARALLEL_PAGES = 16
+
     def __init__(self, doc):
         # pml.Document
         self.doc = doc
 
-    # generate PDF document and return it as a string
-    def generate(self):
-        #lsdjflksj = util.TimerDev("generate")
+    # generate PDF document and write it to file object 'output'. pool is
+    # as in the module-level generate.
+    @instrument.timed("PDFExporter.generate")
+    def generateTo(self, output, pool = None):
         doc = self.doc
 
         # fast lookup of font information
@@ -263,7 +320,9 @@ class PDFExporter:
                                              "/Contents %d 0 R\n"
                                              ">>" % (pagesObj.nr,
                                                      self.objectCnt + 1)))
-            self.pageContentObjs.append(self.addObj())
+
+            # the contents are generated when written out, see genPDF
+            self.pageContentObjs.append(self.addObj(None))
 
         if doc.defPage != -1:
             outlinesStr += "/OpenAction [%d 0 R /XYZ null null 0]\n" % (
@@ -274,8 +333,10 @@ class PDFExporter:
                                 "%s"
                                 ">>" % (pagesObj.nr, outlinesStr))
 
+        # allocates font objects and finds out the pages TOC items are on,
+        # which the objects written before the page contents refer to
         for i in xrange(pages):
-            self.genPage(i)
+            self.prepPage(i)
 
         kids = util.String()
         kids += "["
@@ -301,7 +362,7 @@ class PDFExporter:
             for i in xrange(len(doc.tocs)):
                 self.genOutline(i)
 
-        return self.genPDF()
+        self.genPDF(PDFWriter(output), self.iterPageStreams(pool))
 
     def createInfoObj(self):
         version = self.escapeStr(self.doc.version)
@@ -327,19 +388,56 @@ class PDFExporter:
 
         self.widthsObj = self.addObj(self.__class__._widthsStr)
 
-    # generate a single page
-    def genPage(self, pageNr):
-        pg = self.doc.pages[pageNr]
+    # generator that returns the pages' content stream objects' contents
+    # in page order. prepPage must have been called for all pages. if
+    # pool is not None, the pages are drawn and compressed in its worker
+    # processes.
+    def iterPageStreams(self, pool):
+        doc = self.doc
+
+        if not pool or (len(doc.pages) < self.MIN_PARALLEL_PAGES):
+            for i in xrange(len(doc.pages)):
+                yield self.genStream(self.drawPage(doc.pages[i].ops, i))
+
+            return
+
+        fontNrs = {}
+
+        for flags, fi in self.fonts.iteritems():
+            if fi.number != -1:
+                fontNrs[flags] = fi.number
+
+        tasks = []
 
-        # content stream
+        for i in xrange(0, len(doc.pages), self.PAGES_PER_TASK):
+            tasks.append((doc.h, fontNrs, i,
+                [pg.ops for pg in doc.pages[i:i + self.PAGES_PER_TASK]]))
+
+        for streams in pool.imap(genPageStreams, tasks):
+            for s in streams:
+                yield s
+
+    # do the parts of generating a page that modify the document: record
+    # page numbers for TOC items and allocate fonts used by the page.
+    def prepPage(self, pageNr):
+        for op in self.doc.pages[pageNr].ops:
+            if isinstance(op, pml.TextOp):
+                self.getFontNr(op.flags)
+
+                if op.toc:
+                    op.toc.pageObjNr = self.pageObjs[pageNr].nr
+
+    # draw page with the given ops and return its content stream as a
+    # string. fonts used must already be allocated, see prepPage.
+    def drawPage(self, ops, pageNr):
         cont = util.String()
 
         self.currentFont = ""
 
-        for op in pg.ops:
+        for op in ops:
             op.pdfOp.draw(op, pageNr, cont, self)
 
-        self.pageContentObjs[pageNr].data = self.genStream(str(cont))
+        return str(cont)
 
     # generate outline number 'i'
     def genOutline(self, i):
@@ -397,24 +495,30 @@ class PDFExporter:
 
         return obj
 
-    # write out object to 'output' (util.String)
+    # write out object to 'output' (PDFWriter)
     def writeObj(self, output, obj):
         obj.xrefPos = len(output)
         obj.write(output)
 
-    # write a xref table entry to 'output' (util.String), using position
+    # write a xref table entry to 'output' (PDFWriter), using position
     # 'pos, generation 'gen' and type 'typ'.
     def writeXref(self, output, pos, gen = 0, typ = "n"):
         output += "%010d %05d %s \n" % (pos, gen, typ)
 
-    # generate PDF file and return it as a string
-    def genPDF(self):
-        data = util.String()
-
+    # write PDF file to 'data' (PDFWriter). pageStreams is an iterator
+    # over the contents of the page content objects, which are only
+    # generated as they are written out, so only one page's contents are
+    # held in memory at a time.
+    def genPDF(self, data, pageStreams):
         data += "%PDF-1.5\n"
 
         for obj in self.objects:
-            self.writeObj(data, obj)
+            if obj.data is None:
+                obj.data = pageStreams.next()
+                self.writeObj(data, obj)
+                obj.data = ""
+            else:
+                self.writeObj(data, obj)
 
         xrefStartPos = len(data)
 
@@ -434,8 +538,6 @@ class PDFExporter:
 
         data += "startxref\n%d\n%%%%EOF\n" % xrefStartPos
 
-        return str(data)
-
     # get font number to use for given flags. also creates the PDF object
     # for the font if it does not yet exist.
     def getFontNr(self, flags):
@@ -23,23 +23,37 @@ SHOT = 7
 NOTE = 8
 ACTBREAK = 9
 
+# estimated memory, in bytes, undo history is allowed to use. with a
+# journal, older undo objects are moved there instead of being discarded.
+UNDO_MEMORY_LIMIT = 5000000
+
+# number of paragraphs generateFDXTo writes out at a time
+FDX_CHUNK_SIZE = 1000
+
 import autocompletion
 import config
 import error
 import headers
+import instrument
 import locations
 import mypager
 import pdf
 import pml
+import scriptdiff
+import scriptstats
 import spellcheck
 import titles
 import undo
 import util
 
+import array
+import bisect
 import codecs
+import collections
 import copy
-import difflib
+import itertools
 import re
+import StringIO
 import sys
 import time
 
@@ -77,6 +91,34 @@ class Screenplay:
         # time when last paginated
         self.lastPaginated = 0.0
 
+        # lines modified since last pagination, and the lines list,
+        # config, number of header lines and script length the current
+        # pagination was computed with. used by incremental pagination.
+        self.pgDirty = DirtyLines()
+        self.spacingIndex = SpacingIndex()
+        self.pgLines = None
+        self.pgCfg = None
+        self.pgHdrLines = -1
+        self.pgLength = -1
+
+        # element / scene structure of the script
+        self.structure = StructureIndex()
+
+        # texts of auto-completable elements
+        self.completion = CompletionIndex()
+
+        # how many times markLinesChanged has been called
+        self.editCount = 0
+
+        # generated PML pages
+        self.pageCache = PageCache()
+
+        # scriptstats.ScriptStats of the script, or None. see getStats.
+        self.stats = None
+
+        # spell checking results for line texts
+        self.spellCache = spellcheck.LineCache()
+
         # list of active auto-completion strings
         self.acItems = None
 
@@ -104,6 +146,9 @@ class Screenplay:
         # estimated amount of memory used by undo objects, in bytes
         self.undoMemoryUsed = 0
 
+        # journal.Journal the script's changes are written to, or None
+        self.journal = None
+
     def isModified(self):
         if not self.hasChanged:
             return False
@@ -117,6 +162,27 @@ class Screenplay:
     def markChanged(self, state = True):
         self.hasChanged = state
 
+        if state and self.journal:
+            self.journal.changed()
+
+    # write any changes not written yet to the journal, if there is one.
+    # must be called after anything that changes the script without going
+    # through the undo system.
+    def syncJournal(self):
+        if self.journal:
+            self.journal.sync(self)
+
+    # must be called whenever lines are modified, inserted or deleted.
+    # line1 - line2 (inclusive, in the current numbering) is the modified
+    # area; everything before line1 and after line2 must be unchanged
+    # apart from its position. if lines were only deleted, line2 can be
+    # line1 - 1.
+    def markLinesChanged(self, line1, line2):
+        self.editCount += 1
+        self.pgDirty.add(line1, line2, len(self.lines))
+        self.structure.dirty.add(line1, line2, len(self.lines))
+        self.completion.dirty.add(line1, line2, len(self.lines))
+
     def cursorAsMark(self):
         return Mark(self.line, self.column)
 
@@ -156,7 +222,10 @@ class Screenplay:
         sp.titles = copy.deepcopy(self.titles)
         sp.scDict = copy.deepcopy(self.scDict)
 
-        sp.lines = [Line(ln.lb, ln.lt, ln.text) for ln in self.lines]
+        if isinstance(self.lines, LineStore):
+            sp.lines = copy.deepcopy(self.lines)
+        else:
+            sp.lines = [Line(ln.lb, ln.lt, ln.text) for ln in self.lines]
 
         # "open PDF on current page" breaks on scripts we're removing
         # notes from before printing if we don't copy these
@@ -217,21 +286,34 @@ class Screenplay:
     # that this is a static function.
     @staticmethod
     def load(s, cfgGl):
-        if s[0:3] != codecs.BOM_UTF8:
+        return Screenplay.loadFile(StringIO.StringIO(s), cfgGl)
+
+    # like load, but reads the script from file object f. the file is read
+    # in chunks and paragraphs are wrapped as soon as they've been read,
+    # so the file's contents never need to be in memory more than once.
+    #
+    # if progress is not None, it is called as progress(bytesRead, size)
+    # now and then, where size is the file's size; it can raise an
+    # exception to stop the loading.
+    @staticmethod
+    def loadFile(f, cfgGl, progress = None, size = 0):
+        if f.read(3) != codecs.BOM_UTF8:
             raise error.MiscError("File is not a Trelby screenplay.")
 
-        lines = s[3:].splitlines()
+        lines = LineReader(f)
 
         sp = Screenplay(cfgGl)
 
         # remove default empty line
         sp.lines = []
 
-        if len(lines) < 2:
+        s = lines.next()
+
+        if (s is None) or (lines.peek() is None):
             raise error.MiscError("File has too few lines to be a valid\n"
                                   "screenplay file.")
 
-        key, version = Screenplay.parseConfigLine(lines[0])
+        key, version = Screenplay.parseConfigLine(s)
         if not key or (key != "Version"):
             raise error.MiscError("File doesn't seem to be a proper\n"
                                   "screenplay file.")
@@ -243,30 +325,36 @@ class Screenplay:
 
         version = int(version)
 
-        # current position at 'lines'
-        index = 1
-
-        s, index = Screenplay.getConfigPart(lines, "Auto-Completion", index)
+        s = Screenplay.getConfigPart(lines, "Auto-Completion")
         if s:
             sp.autoCompletion.load(s)
 
-        s, index = Screenplay.getConfigPart(lines, "Config", index)
+        s = Screenplay.getConfigPart(lines, "Config")
         if s:
             sp.cfg.load(s)
 
-        s, index = Screenplay.getConfigPart(lines, "Locations", index)
+        s = Screenplay.getConfigPart(lines, "Locations")
         if s:
             sp.locations.load(s)
 
-        s, index = Screenplay.getConfigPart(lines, "Spell-Checker-Dict",
-                                            index)
+        s = Screenplay.getConfigPart(lines, "Spell-Checker-Dict")
         if s:
             sp.scDict.load(s)
 
+        # the saved cursor position is in the file's unwrapped line
+        # numbering, and is adjusted by rewrapPara as paragraphs are
+        # wrapped.
+        if cfgGl.honorSavedPos:
+            sp.line = sp.cfg.cursorLine
+            sp.column = sp.cfg.cursorColumn
+
         # used to keep track that element type only changes after a
         # LB_LAST line.
         prevType = None
 
+        # first line of the paragraph being read
+        paraStart = 0
+
         # did we encounter unknown lb types
         unknownLb = False
 
@@ -280,17 +368,23 @@ class Screenplay:
         # files which didn't have it.
         startSeen = version < 3
 
-        for i in xrange(index, len(lines)):
-            s = lines[i]
+        while 1:
+            s = lines.next()
+
+            if s is None:
+                break
+
+            if progress and ((lines.lineNr % 1000) == 0):
+                progress(lines.bytesRead, size)
 
             if len(s) < 2:
-                raise error.MiscError("Line %d is too short." % (i + 1))
+                raise error.MiscError("Line %d is too short." % lines.lineNr)
 
             if s[0] == "#":
                 key, val = Screenplay.parseConfigLine(s)
                 if not key:
                     raise error.MiscError("Line %d has invalid syntax for\n"
-                                          "config line." % (i + 1))
+                                          "config line." % lines.lineNr)
 
                 if key == "Title-Page":
                     sp.titles.pages.append([])
@@ -339,16 +433,23 @@ class Screenplay:
 
                 if prevType and (lt != prevType):
                     raise error.MiscError("Line %d has invalid element"
-                                          " type." % (i + 1))
+                                          " type." % lines.lineNr)
 
                 line = Line(lb, lt, text)
                 sp.lines.append(line)
 
+                if sp.line == (len(sp.lines) - 1):
+                    sp.column = util.clamp(sp.column, 0, len(text))
+
                 if lb != LB_LAST:
                     prevType = lt
                 else:
                     prevType = None
 
+                if lb in (LB_LAST, LB_FORCED):
+                    sp.rewrapPara(paraStart)
+                    paraStart = len(sp.lines)
+
         if not startSeen:
             raise error.MiscError("Start-Script line not found.")
 
@@ -359,12 +460,7 @@ class Screenplay:
         if sp.lines[-1].lb != LB_LAST:
             raise error.MiscError("Last line doesn't end an element.")
 
-        if cfgGl.honorSavedPos:
-            sp.line = sp.cfg.cursorLine
-            sp.column = sp.cfg.cursorColumn
-            sp.validatePos()
-
-        sp.reformatAll()
+        sp.validatePos()
         sp.paginate()
         sp.titles.sort()
         sp.locations.refresh(sp.getSceneNames())
@@ -387,25 +483,32 @@ class Screenplay:
 
         return (sp, "\n\n".join(msgs))
 
-    # lines is an array of strings. if lines[startIndex] == "Begin-$name
-    # ", this searches for a string of "End-$name ", takes all the strings
-    # between those two, joins the lines into a single string (lines
-    # separated by a "\n") and returns (string,
-    # line-index-after-the-end-line). returns ("", startIndex) if
-    # startIndex does not contain the start line or startIndex is too big
-    # for 'lines'. raises error.MiscError on errors.
+    # lines is a LineReader. if its next line is "Begin-$name ", this reads
+    # lines up to and including a line of "End-$name ", and returns the
+    # lines between those two joined into a single string (lines
+    # separated by a "\n"). returns "" without reading anything if the
+    # next line is not the start line. raises error.MiscError on errors.
     @staticmethod
-    def getConfigPart(lines, name, startIndex):
-        if (startIndex >= len(lines)) or\
-               (lines[startIndex] != ("#Begin-%s " % name)):
-            return ("", startIndex)
+    def getConfigPart(lines, name):
+        if lines.peek() != ("#Begin-%s " % name):
+            return ""
 
-        try:
-            endIndex = lines.index("#End-%s " % name, startIndex)
-        except ValueError:
-            raise error.MiscError("#End-%s not found" % name)
+        lines.next()
+        endLine = "#End-%s " % name
+        ret = []
+
+        while 1:
+            s = lines.next()
+
+            if s is None:
+                raise error.MiscError("#End-%s not found" % name)
+
+            if s == endLine:
+                break
+
+            ret.append(s)
 
-        return ("\n".join(lines[startIndex + 1:endIndex]), endIndex + 1)
+        return "\n".join(ret)
 
     # parse a line containing a config-value in the format detailed in
     # fileformat.txt. line must have newline stripped from the end
@@ -567,8 +670,11 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # Return screenplay as list of tuples of the form (elType, elText).
     # forced linebreaks are represented as \n characters.
     def getElementsAsList(self):
+        return list(self.iterElements())
+
+    # like getElementsAsList, but return an iterator over the elements.
+    def iterElements(self):
         ls = self.lines
-        eleList = []
         curLine = ""
 
         for line in ls:
@@ -581,24 +687,25 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             curLine += lineText
 
             if line.lb == LB_LAST:
-                eleList.append((lineType, curLine))
+                yield (lineType, curLine)
                 curLine = ""
             elif line.lb == LB_SPACE:
                 curLine += " "
             elif line.lb == LB_FORCED:
                 curLine += "\n"
 
-        return eleList
-
     # Generate a Final Draft XML file and return as string.
     def generateFDX(self):
-        eleList = self.getElementsAsList()
-        fd = etree.Element("FinalDraft")
-        fd.set("DocumentType", "Script")
-        fd.set("Template", "No")
-        fd.set("Version", "1")
-        content = etree.SubElement(fd, "Content")
+        output = StringIO.StringIO()
+        self.generateFDXTo(output)
 
+        return output.getvalue()
+
+    # like generateFDX, but write the XML to file object 'output' as it is
+    # generated. the script's elements are converted FDX_CHUNK_SIZE at a
+    # time, each chunk in a tree of its own, so the whole script is never
+    # held as a tree.
+    def generateFDXTo(self, output):
         xmlMap = {
             ACTION : "Action",
             CHARACTER : "Character",
@@ -611,37 +718,85 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             ACTBREAK : "New Act",
         }
 
-        for ele in eleList:
-            typ, txt = ele
-            if typ == NOTE:
-                dummyPara = etree.SubElement(content, "Paragraph")
-                dummyPara.set("Type", xmlMap[typ])
-                scriptnote = etree.SubElement(dummyPara, "ScriptNote")
-                scriptnote.set("ID", "1")
-                para = etree.SubElement(scriptnote, "Paragraph")
+        eleIter = self.iterElements()
+        eleList = list(itertools.islice(eleIter, FDX_CHUNK_SIZE))
+        isFirst = True
+
+        while True:
+            nextList = list(itertools.islice(eleIter, FDX_CHUNK_SIZE))
+            isLast = not nextList
+
+            fd = etree.Element("FinalDraft")
+            fd.set("DocumentType", "Script")
+            fd.set("Template", "No")
+            fd.set("Version", "1")
+            content = etree.SubElement(fd, "Content")
+
+            for ele in eleList:
+                typ, txt = ele
+                if typ == NOTE:
+                    dummyPara = etree.SubElement(content, "Paragraph")
+                    dummyPara.set("Type", xmlMap[typ])
+                    scriptnote = etree.SubElement(dummyPara, "ScriptNote")
+                    scriptnote.set("ID", "1")
+                    para = etree.SubElement(scriptnote, "Paragraph")
+                else:
+                    para = etree.SubElement(content, "Paragraph")
+                    para.set("Type", xmlMap[typ])
+
+                paratxt = etree.SubElement(para, "Text")
+                paratxt.text = unicode(txt, "ISO-8859-1")
+
+            if isLast:
+                # FD does not recognize "New Act" by default. It needs an
+                # ElementSettings element added.
+                eleSet = etree.SubElement(fd, "ElementSettings")
+                eleSet.set("Type", xmlMap[ACTBREAK])
+                eleSetFont = etree.SubElement(eleSet, "FontSpec")
+                eleSetFont.set("Style", "Underline+AllCaps")
+                eleSetPara = etree.SubElement(eleSet, "ParagraphSpec")
+                eleSetPara.set("Alignment","Center")
+
+            s = etree.tostring(
+                fd, xml_declaration=True, encoding='UTF-8', pretty_print=True)
+
+            # write this chunk's part of the document: the start of it
+            # only for the first chunk, and the end of it only for the
+            # last one. chunks other than the last one are never empty,
+            # so they have a "<Content>" start and end tag.
+            if isFirst:
+                start = 0
+            else:
+                start = s.index("<Content>") + len("<Content>")
+
+            if isLast:
+                end = len(s)
             else:
-                para = etree.SubElement(content, "Paragraph")
-                para.set("Type", xmlMap[typ])
+                end = s.rindex("\n  </Content>")
 
-            paratxt = etree.SubElement(para, "Text")
-            paratxt.text = unicode(txt, "ISO-8859-1")
+            output.write(s[start:end])
 
-        # FD does not recognize "New Act" by default. It needs an
-        # ElementSettings element added.
-        eleSet = etree.SubElement(fd, "ElementSettings")
-        eleSet.set("Type", xmlMap[ACTBREAK])
-        eleSetFont = etree.SubElement(eleSet, "FontSpec")
-        eleSetFont.set("Style", "Underline+AllCaps")
-        eleSetPara = etree.SubElement(eleSet, "ParagraphSpec")
-        eleSetPara.set("Alignment","Center")
+            if isLast:
+                break
 
-        return etree.tostring(
-            fd, xml_declaration=True, encoding='UTF-8', pretty_print=True)
+            eleList = nextList
+            isFirst = False
 
     # generate Fountain and return it as a string.
     def generateFountain(self):
-        eleList = self.getElementsAsList()
-        flines = []
+        return "".join(self.iterFountain())
+
+    # like generateFountain, but write the Fountain to file object
+    # 'output' as it is generated, without holding all of it in memory.
+    def generateFountainTo(self, output):
+        for s in self.iterFountain():
+            output.write(s)
+
+    # return iterator over the pieces of the Fountain for the script, one
+    # element at a time.
+    def iterFountain(self):
+        # last line generated
+        prev = None
         TWOSPACE = "  "
         sceneStartsList = ("INT", "EXT", "EST", "INT./EXT", "INT/EXT", "I/E", "I./E")
 
@@ -656,14 +811,21 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
                     break
             return looksGood
 
-        for ele in eleList:
+        for ele in self.iterElements():
             typ, txt = ele
             lns = txt.split("\n")
 
-            #ensure last element of flines is empty for some types.
+            # lines are separated by newlines, so all but the first one
+            # are preceded by one.
+            if prev != None:
+                txt0 = "\n"
+            else:
+                txt0 = ""
+
+            #ensure last line is empty for some types.
             if typ in (SCENE, ACTION, CHARACTER, TRANSITION, SHOT, ACTBREAK, NOTE):
-                if flines and flines[-1] != "":
-                    flines.append("")
+                if prev:
+                    txt0 += "\n"
 
             # special handling of some elements.
             if typ == SCENE:
@@ -703,9 +865,9 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             elif typ == SHOT:
                 txt += TWOSPACE
 
-            flines.append(txt)
+            prev = txt
 
-        return util.toUTF8("\n".join(flines))
+            yield util.toUTF8(txt0 + txt)
 
     # generate RTF and return it as a string.
     def generateRTF(self):
@@ -803,6 +965,10 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     def generatePDF(self, isExport):
         return pdf.generate(self.generatePML(isExport))
 
+    # like generatePDF, but write the PDF to file object 'output'.
+    def generatePDFTo(self, output, isExport):
+        pdf.generateTo(self.generatePML(isExport), output)
+
     # Same arguments as generatePDF, but returns a PML document.
     def generatePML(self, isExport):
         pager = mypager.Pager(self.cfg)
@@ -815,7 +981,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
                                 self.line2page(self.line) - 1
 
         for i in xrange(1, len(self.pages)):
-            pg = self.generatePMLPage(pager, i, True, True)
+            pg = self.getPMLPage(pager, i, True, True)
 
             if pg:
                 pager.doc.add(pg)
@@ -853,6 +1019,34 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         return pager.doc
 
+    # like generatePMLPage, but reuses earlier results for pages whose
+    # contents haven't changed since (see PageCache).
+    def getPMLPage(self, pager, pageNr, forPDF, doExtra):
+        return self.pageCache.getPage(self, pager, pageNr, forPDF, doExtra)
+
+    # return (startLine, endLine) of the given page for generatePMLPage,
+    # or None if the page doesn't exist anymore.
+    def getPMLPageRange(self, pageNr):
+        length = len(self.lines)
+        start = self.pages[pageNr - 1] + 1
+
+        if start >= length:
+            # text has been deleted at end of script and pagination has
+            # not been updated.
+            return None
+
+        # pagination may not be up-to-date, so any overflow text gets
+        # dumped onto the last page which may thus be arbitrarily long.
+        if pageNr == (len(self.pages) - 1):
+            end = length - 1
+        else:
+            # another side-effect is that if text is deleted at the end,
+            # self.pages can point to lines that no longer exist, so we
+            # need to clamp it.
+            end = util.clamp(self.pages[pageNr], maxVal = length - 1)
+
+        return (start, end)
+
     # generate one page of PML data and return it.
     #
     # if forPDF is True, output is meant for PDF generation.
@@ -867,33 +1061,21 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # the given page number doesn't point to a valid page anymore, and the
     # caller should stop calling this since all pages have been generated
     # (assuming 1-to-n calling sequence).
+    @instrument.timed("Screenplay.generatePMLPage")
     def generatePMLPage(self, pager, pageNr, forPDF, doExtra):
-        #lsdjflksj = util.TimerDev("generatePMLPage")
-
         cfg = self.cfg
         ls = self.lines
 
         fs = cfg.fontSize
         chX = util.getTextWidth(" ", pml.COURIER, fs)
         chY = util.getTextHeight(fs)
-        length = len(ls)
 
-        start = self.pages[pageNr - 1] + 1
+        tmp = self.getPMLPageRange(pageNr)
 
-        if start >= length:
-            # text has been deleted at end of script and pagination has
-            # not been updated.
+        if not tmp:
             return None
 
-        # pagination may not be up-to-date, so any overflow text gets
-        # dumped onto the last page which may thus be arbitrarily long.
-        if pageNr == (len(self.pages) - 1):
-            end = length - 1
-        else:
-            # another side-effect is that if text is deleted at the end,
-            # self.pages can point to lines that no longer exist, so we
-            # need to clamp it.
-            end = util.clamp(self.pages[pageNr], maxVal = length - 1)
+        start, end = tmp
 
         pg = pml.Page(pager.doc)
 
@@ -1065,16 +1247,22 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     def setTopLine(self, line):
         self._topLine = util.clamp(line, 0, len(self.lines) - 1)
 
-    def reformatAll(self):
+    # if progress is not None, it is called as progress(line, nrOfLines)
+    # now and then; it can raise an exception to stop the reformatting.
+    @instrument.timed("Screenplay.reformatAll")
+    def reformatAll(self, progress = None):
         # doing a reformatAll while we have undo history will completely
         # break undo, so that can't be allowed.
         assert not self.firstUndo
 
-        #sfdlksjf = util.TimerDev("reformatAll")
-
         line = 0
+        nextProgress = 0
 
         while 1:
+            if progress and (line >= nextProgress):
+                progress(line, len(self.lines))
+                nextProgress = line + 500
+
             line += self.rewrapPara(line)
             if line >= len(self.lines):
                 break
@@ -1084,14 +1272,15 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     def reformatRange(self, par1, par2):
         ls = self.lines
 
-        # add special tag to last paragraph we'll reformat
-        ls[par2].reformatMarker = 0
+        # reformatting a paragraph only changes its own lines, so the last
+        # paragraph we'll reformat is always this many lines from the end
+        # of the script until we get to it
+        fromEnd = len(ls) - par2
         end = False
 
         line = par1
         while 1:
-            if hasattr(ls[line], "reformatMarker"):
-                del ls[line].reformatMarker
+            if line == (len(ls) - fromEnd):
                 end = True
 
             line += self.rewrapPara(line)
@@ -1199,6 +1388,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         tmp = Line(ls[line2].lb, ls[line1].lt, s)
         wrappedLines = self.wrapLine(tmp)
         ls[line1:line2 + 1] = wrappedLines
+        self.markLinesChanged(line1, line1 + len(wrappedLines) - 1)
 
         # adjust cursor position
         if cursorOffset != -1:
@@ -1376,43 +1566,41 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     def getSceneIndexes(self):
         return self.getSceneIndexesFromLine(self.line)
 
-    def getSceneIndexesFromLine(self, line):
-        top, bottom = self.getElemIndexesFromLine(line)
-        ls = self.lines
+    # return the script's StructureIndex, brought up to date.
+    def getStructure(self):
+        self.structure.sync(self)
 
-        while 1:
-            if ls[top].lt in (SCENE, ACTBREAK):
-                break
+        return self.structure
 
-            tmp = top - 1
-            if tmp < 0:
-                break
+    # return the script's scriptstats.ScriptStats, gathering them again
+    # if the script has been modified or repaginated since the last time.
+    def getStats(self):
+        if not (self.stats and self.stats.isCurrent(self)):
+            self.stats = scriptstats.ScriptStats(self)
 
-            top = self.getElemIndexesFromLine(tmp)[0]
+        return self.stats
 
-        while 1:
-            tmp = bottom + 1
-            if tmp >= len(ls):
-                break
+    # return (startLine, endLine) of the scene containing the given line,
+    # where a scene starts at a scene or act break element.
+    def getSceneIndexesFromLine(self, line):
+        sects = self.getStructure().sectStarts
+        i = sects.bisectRight(line)
 
-            if ls[tmp].lt in (SCENE, ACTBREAK):
-                break
+        if i > 0:
+            top = sects.get(i - 1)
+        else:
+            top = 0
 
-            bottom = self.getElemIndexesFromLine(tmp)[1]
+        if i < len(sects):
+            bottom = sects.get(i) - 1
+        else:
+            bottom = len(self.lines) - 1
 
         return (top, bottom)
 
     # return scene number for the given line. if line is -1, return 0.
     def getSceneNumber(self, line):
-        ls = self.lines
-        sc = SCENE
-        scene = 0
-
-        for i in xrange(line + 1):
-            if (ls[i].lt == sc) and self.isFirstLineOfElem(i):
-                scene += 1
-
-        return scene
+        return self.getStructure().sceneStarts.bisectRight(line)
 
     # return how many elements one must advance to get from element
     # containing line1 to element containing line2. line1 must be <=
@@ -1420,18 +1608,9 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # returns 0 if they're in the same element, 1 if they're in
     # consecutive elements, etc.
     def elemsDistance(self, line1, line2):
-        ls = self.lines
-
-        count = 0
-        line = line1
+        elems = self.getStructure().elemStarts
 
-        while line < line2:
-            if ls[line].lb == LB_LAST:
-                count += 1
-
-            line += 1
-
-        return count
+        return elems.bisectRight(line2) - elems.bisectRight(line1)
 
     # returns true if 'line', which must be the last line on a page, needs
     # (MORE) after it and the next page needs a "SOMEBODY (cont'd)".
@@ -1446,47 +1625,109 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # and lb of LAST is found, and return that line's text, possibly
     # upper-cased if CHARACTER's config for export says so.
     def getPrevSpeaker(self, line):
-        ls = self.lines
-
-        while 1:
-            if line < 0:
-                return "UNKNOWN"
-
-            ln = ls[line]
+        speakers = self.getStructure().speakers
+        i = speakers.bisectRight(line) - 1
 
-            if (ln.lt == CHARACTER) and (ln.lb == LB_LAST):
-                s = ln.text
+        if i < 0:
+            return "UNKNOWN"
 
-                if self.cfg.getType(CHARACTER).export.isCaps:
-                    s = util.upper(s)
+        s = self.lines[speakers.get(i)].text
 
-                return s
+        if self.cfg.getType(CHARACTER).export.isCaps:
+            s = util.upper(s)
 
-            line -= 1
+        return s
 
     # return total number of characters in script
     def getCharCount(self):
         return sum([len(ln.text) for ln in self.lines])
 
-    def paginate(self):
-        #sfdlksjf = util.TimerDev("paginate")
+    # paginate the script. if incremental is True and only the lines
+    # have changed since the last pagination, pagination restarts from
+    # the last page break before the first modified line and stops as
+    # soon as the new page breaks line up with the old ones again. the
+    # result is identical to a full pagination either way.
+    #
+    # if progress is not None, it is called as progress(line, nrOfLines)
+    # after every page; it can raise an exception to stop the pagination,
+    # which leaves it in an unusable state.
+    @instrument.timed("Screenplay.paginate")
+    def paginate(self, incremental = False, progress = None):
+        hdrLines = self.headers.getNrOfLines()
+
+        if not incremental or (self.pgLines is not self.lines) or\
+               (self.pgCfg is not self.cfg) or\
+               (self.pgHdrLines != hdrLines):
+            self.pages = [-1]
+            self.pagesNoAdjust = [-1]
+
+            self.spacingIndex.rebuild(self)
+            self.paginateFrom(0, -1, None, progress)
+
+        elif self.pgDirty.isSet():
+            self.paginateChanges(progress)
+
+        self.pgDirty.clear()
+        self.pgLines = self.lines
+        self.pgCfg = self.cfg
+        self.pgHdrLines = hdrLines
+        self.pgLength = len(self.lines)
+
+        self.lastPaginated = time.time()
+
+    # update existing pagination to account for the lines marked as
+    # modified since it was done.
+    def paginateChanges(self, progress):
+        dirty = self.pgDirty
+        length = len(self.lines)
+        oldPages = self.pages
+        oldPagesNA = self.pagesNoAdjust
+
+        # first modified line, and last modified line in the new
+        # numbering
+        first = min(dirty.head, length)
+        lastChanged = length - 1 - dirty.tail
+
+        self.spacingIndex.update(self, dirty.head, dirty.tail,
+                                 self.pgLength)
+
+        # a page break depends on the lines up to one past the unadjusted
+        # break, so find the last page that was computed purely from
+        # unmodified lines. the last page always depends on the script
+        # length and is never kept.
+        k = 0
+        for i in xrange(1, len(oldPages) - 1):
+            if (oldPagesNA[i] + 1) >= first:
+                break
+
+            k = i
+
+        self.pages = oldPages[:k + 1]
+        self.pagesNoAdjust = oldPagesNA[:k + 1]
 
-        self.pages = [-1]
-        self.pagesNoAdjust = [-1]
+        self.paginateFrom(oldPages[k] + 1, oldPages[k],
+            (oldPages, oldPagesNA, length - self.pgLength, lastChanged),
+            progress)
 
+    # paginate starting at line i, whose preceding page break is at
+    # lastBreak, appending to self.pages and self.pagesNoAdjust. if old
+    # is not None, it is a (pages, pagesNoAdjust, lineDelta, lastChanged)
+    # tuple describing the previous pagination, and as soon as a page
+    # break after the modified lines matches an old one, the remaining
+    # old page breaks are reused. progress is as in paginate.
+    def paginateFrom(self, i, lastBreak, old, progress):
         ls = self.lines
         cfg = self.cfg
 
         length = len(ls)
-        lastBreak = -1
 
-        # fast aliases for stuff
-        lbl = LB_LAST
-        ct = cfg.types
+        spi = self.spacingIndex
         hdrLines = self.headers.getNrOfLines()
 
-        i = 0
         while 1:
+            if progress:
+                progress(i, length)
+
             lp = cfg.linesOnPage * 10
 
             if i != 0:
@@ -1509,21 +1750,9 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             if i < length:
                 pageLines = 10
 
-                # advance i until it points to the last line to put on
-                # this page (before adjustments)
-
-                while i < (length - 1):
-
-                    pageLines += 10
-                    if ls[i].lb == lbl:
-                        pageLines += ct[ls[i + 1].lt].beforeSpacing
-                    else:
-                        pageLines += ct[ls[i + 1].lt].intraSpacing
-
-                    if pageLines > lp:
-                        break
-
-                    i += 1
+                # find the last line to put on this page (before
+                # adjustments)
+                i = spi.findPageEnd(i, lp)
 
             if i >= (length - 1):
                 if pageLines != 0:
@@ -1624,9 +1853,20 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             self.pages.append(i)
             lastBreak = i
 
-            i += 1
+            if old and (i > old[3]):
+                oldI = i - old[2]
+                j = bisect.bisect_left(old[0], oldI)
 
-        self.lastPaginated = time.time()
+                # the rest of the pagination only depends on this page
+                # break and the lines after it, which are unchanged.
+                if (j > 0) and (j < len(old[0])) and (old[0][j] == oldI):
+                    self.pages.extend([pg + old[2] for pg in old[0][j + 1:]])
+                    self.pagesNoAdjust.extend(
+                        [pg + old[2] for pg in old[1][j + 1:]])
+
+                    break
+
+            i += 1
 
     def removeDanglingElement(self, line, lt, lastBreak):
         ls = self.lines
@@ -1686,6 +1926,8 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             for i in range(first, last + 1):
                 ls[i].lt = lt
 
+            self.markLinesChanged(first, last)
+
             # if changing empty element to PAREN, add "()"
             if (first == last) and (ls[first].lt == PAREN) and\
                    (len(ls[first].text) == 0):
@@ -1729,6 +1971,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         self.setLineTypes(line + 1, ln.lt)
         del ls[line + 1]
+        self.markLinesChanged(line, line)
 
         self.line = line
         self.column = pos
@@ -1744,6 +1987,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         ln.text = preStr
         ln.lb = LB_FORCED
         self.lines.insert(self.line + 1, newLine)
+        self.markLinesChanged(self.line, self.line + 1)
 
         self.line += 1
         self.column = 0
@@ -1770,6 +2014,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         self.splitLine()
         ls[self.line - 1].lb = LB_LAST
+        self.markLinesChanged(self.line - 1, self.line - 1)
 
         self.convertTypeTo(newType, False)
 
@@ -1785,6 +2030,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     def deleteChar(self, line, column, posCursor = True):
         s = self.lines[line].text
         self.lines[line].text = s[:column] + s[column + 1:]
+        self.markLinesChanged(line, line)
 
         if posCursor:
             self.column = column
@@ -1793,6 +2039,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # set line types from 'line' to the end of the element to 'lt'.
     def setLineTypes(self, line, lt):
         ls = self.lines
+        first = line
 
         while 1:
             ln = ls[line]
@@ -1803,6 +2050,8 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
             line += 1
 
+        self.markLinesChanged(first, line)
+
     def line2page(self, line):
         return self.line2pageReal(line, self.pages)
 
@@ -1848,17 +2097,9 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # is not included in this list. note that the sceneNumber in the
     # returned list is a string, not a number.
     def getSceneLocations(self):
-        ls = self.lines
-        sc = SCENE
-        scene = 0
-        ret = []
+        scenes = self.getStructure().sceneStarts.toList()
 
-        for i in xrange(len(ls)):
-            if (ls[i].lt == sc) and self.isFirstLineOfElem(i):
-                scene += 1
-                ret.append((str(scene), i))
-
-        return ret
+        return [(str(i + 1), scenes[i]) for i in xrange(len(scenes))]
 
     # return a dictionary of all scene names (single-line text elements
     # only, upper-cased, values = None).
@@ -1987,33 +2228,29 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     # get a list of strings (single-line text elements for now) that start
     # with 'text' (not case sensitive) and are of of type 'type'. also
     # mixes in the type's default items from config. ignores current line.
+    #
+    # the closest match before the current line comes first, the rest
+    # are sorted by how many times they occur in the script, most common
+    # first, and then alphabetically.
     def getMatchingText(self, text, lt):
         text = util.upper(text)
         t = self.autoCompletion.getType(lt)
-        ls = self.lines
-        matches = {}
-        last = None
 
-        for i in range(len(ls)):
-            if (ls[i].lt == lt) and (ls[i].lb == LB_LAST):
-                upstr = util.upper(ls[i].text)
-
-                if upstr.startswith(text) and i != self.line:
-                    matches[upstr] = None
-                    if i < self.line:
-                        last = upstr
+        self.completion.sync(self)
+        matches = self.completion.find(text, lt, self.line)
 
         for s in t.items:
             upstr = util.upper(s)
 
             if upstr.startswith(text):
-                matches[upstr] = None
+                matches.setdefault(upstr, 0)
+
+        last = self.completion.findPrev(lt, self.line, matches)
 
         if last:
             del matches[last]
 
-        mlist = matches.keys()
-        mlist.sort()
+        mlist = sorted(matches, key = lambda s: (-matches[s], s))
 
         if last:
             mlist.insert(0, last)
@@ -2123,7 +2360,11 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         if not doDelete:
             return cd
 
-        u = undo.AnyDifference(self)
+        # deleting text joins the first and last marked elements, which
+        # is then rewrapped, but nothing outside them is touched
+        u = undo.AnyDifference(self,
+            self.getElemFirstIndexFromLine(marked[0]),
+            self.getElemLastIndexFromLine(marked[1]))
 
         # range of lines, inclusive, that we need to totally delete
         del1 = sys.maxint
@@ -2194,12 +2435,14 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         # anyway) to that of the first element.
         self.setLineTypes(marked[1], ls[marked[0]].lt)
 
+        self.markLinesChanged(marked[0] - 1, marked[1])
         del ls[del1:del2 + 1]
 
         self.clearMark()
 
         if len(ls) == 0:
             ls.append(Line(LB_LAST, SCENE))
+            self.markLinesChanged(0, 0)
 
         self.line = min(marked[0], len(ls) - 1)
         self.column = min(endCol, len(ls[self.line].text))
@@ -2217,7 +2460,9 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         if len(clines) == 0:
             return
 
-        u = undo.AnyDifference(self)
+        # the new lines are inserted in the current element, and only it
+        # is rewrapped
+        u = undo.AnyDifference(self, *self.getElemIndexesFromLine(self.line))
 
         inLines = []
         i = 0
@@ -2264,6 +2509,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         ln.text = ln.text[:self.column] + inLines[0].text + \
                   ln.text[self.column:]
         self.column += len(inLines[0].text)
+        self.markLinesChanged(self.line, self.line)
 
         if len(inLines) != 1:
 
@@ -2286,6 +2532,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
                 # where that line ends in forced linebreak breaks things.
 
             self.column = len(ls[self.line].text)
+            self.markLinesChanged(wrap1, self.line)
 
         # FIXME: copy/paste, when copying elements containing forced
         # linebreaks, converts them to end of element? this seems like a
@@ -2293,13 +2540,16 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         self.reformatRange(wrap1, self.getParaFirstIndexFromLine(self.line))
 
-        u.setAfter(self)
-        self.addUndo(u)
-
+        # marking the script changed before adding the undo object means
+        # the journal records the paste as an edit instead of having to
+        # write a full copy of the script afterwards
         self.clearMark()
         self.clearAutoComp()
         self.markChanged()
 
+        u.setAfter(self)
+        self.addUndo(u)
+
     # returns true if a character, inserted at current position, would
     # need to be capitalized as a start of a sentence.
     def capitalizeNeeded(self):
@@ -2456,141 +2706,14 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
     # compare this script to sp2 (Screenplay), return a PDF file (as a
     # string) of the differences, or None if the scripts are identical.
+    # use scriptdiff.compare to get the differences as a list instead.
     def compareScripts(self, sp2):
-        s1 = self.generateText(False).split("\n")
-        s2 = sp2.generateText(False).split("\n")
-
-        dltTmp = difflib.unified_diff(s1, s2, lineterm = "")
-
-        # get rid of stupid delta generator object that doesn't allow
-        # subscription or anything else really. also expands hunk
-        # separators into three lines.
-        dlt = []
-        i = 0
-        for s in dltTmp:
-            if i >= 3:
-                if s[0] == "@":
-                    dlt.extend(["1", "2", "3"])
-                else:
-                    dlt.append(s)
-
-            i += 1
+        changes = scriptdiff.compare(self, sp2)
 
-        if len(dlt) == 0:
+        if not changes:
             return None
 
-        dltTmp = dlt
-
-        # now, generate changed-lines for single-line diffs
-        dlt = []
-        for i in xrange(len(dltTmp)):
-            s = dltTmp[i]
-
-            dlt.append(s)
-
-            # this checks that we've just added a sequence of lines whose
-            # first characters are " -+", where " " means '"not -" or
-            # missing line', and that we're either at end of list or next
-            # line does not start with "+".
-
-            if (s[0] == "+") and \
-               (i != 0) and (dltTmp[i - 1][0] == "-") and (
-                (i == 1) or (dltTmp[i - 2][0] != "-")) and (
-                (i == (len(dltTmp) - 1)) or (dltTmp[i + 1][0] != "+")):
-
-                # generate line with "^" character at every position that
-                # the lines differ
-
-                s1 = dltTmp[i - 1]
-                s2 = dltTmp[i]
-
-                minCnt = min(len(s1), len(s2))
-                maxCnt = max(len(s1), len(s2))
-
-                res = "^"
-
-                for i in range(1, minCnt):
-                    if s1[i] != s2[i]:
-                        res += "^"
-                    else:
-                        res += " "
-
-                res += "^" * (maxCnt - minCnt)
-
-                dlt.append(res)
-
-        tmp = ["  Color information:", "1", "-  Deleted lines",
-               "+  Added lines",
-               "^  Positions of single-line changes (marked with ^)", "1",
-               "2", "2", "3"]
-        tmp.extend(dlt)
-        dlt = tmp
-
-        cfg = self.cfg
-        chY = util.getTextHeight(cfg.fontSize)
-
-        doc = pml.Document(cfg.paperWidth, cfg.paperHeight)
-
-        # how many lines put on current page
-        y = 0
-
-        pg = pml.Page(doc)
-
-        # we need to gather text ops for each page into a separate list
-        # and add that list to the page only after all other ops are
-        # added, otherwise the colored bars will be drawn partially over
-        # some characters.
-        textOps = []
-
-        for s in dlt:
-
-            if y >= cfg.linesOnPage:
-                pg.ops.extend(textOps)
-                doc.add(pg)
-
-                pg = pml.Page(doc)
-
-                textOps = []
-                y = 0
-
-            if s[0] == "1":
-                pass
-
-            elif s[0] == "3":
-                pass
-
-            elif s[0] == "2":
-                pg.add(pml.PDFOp("0.75 g"))
-                w = 50.0
-                pg.add(pml.RectOp(doc.w / 2.0 - w / 2.0, cfg.marginTop +
-                    y * chY + chY / 4, w, chY / 2.0))
-                pg.add(pml.PDFOp("0.0 g"))
-
-            else:
-                color = ""
-
-                if s[0] == "-":
-                    color = "1.0 0.667 0.667"
-                elif s[0] == "+":
-                    color = "0.667 1.0 0.667"
-                elif s[0] == "^":
-                    color = "1.0 1.0 0.467"
-
-                if color:
-                    pg.add(pml.PDFOp("%s rg" % color))
-                    pg.add(pml.RectOp(cfg.marginLeft, cfg.marginTop + y * chY,
-                        doc.w - cfg.marginLeft - 5.0, chY))
-                    pg.add(pml.PDFOp("0.0 g"))
-
-                textOps.append(pml.TextOp(s[1:], cfg.marginLeft,
-                    cfg.marginTop + y * chY, cfg.fontSize))
-
-            y += 1
-
-        pg.ops.extend(textOps)
-        doc.add(pg)
-
-        return pdf.generate(doc)
+        return scriptdiff.generateReport(changes, self.cfg)
 
     # move to line,col, and if mark is True, set mark there
     def gotoPos(self, line, col, mark = False):
@@ -2632,6 +2755,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
             lsNew.append(Line(LB_LAST, SCENE))
 
         self.lines = lsNew
+        self.markLinesChanged(0, len(lsNew) - 1)
 
         self.validatePos()
         self.clearMark()
@@ -2666,6 +2790,8 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         # TODO: is this needed?
         self.column = min(self.column, len(self.lines[self.line].text))
 
+        self.syncJournal()
+
         if cs.doAutoComp == cs.AC_DEL:
             self.clearAutoComp()
         elif cs.doAutoComp == cs.AC_REDO:
@@ -2739,6 +2865,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
     def moveLineEndCmd(self, cs):
         if self.acItems:
             self.lines[self.line].text = self.acItems[self.acSel]
+            self.markLinesChanged(self.line, self.line)
         else:
             self.maybeMark(cs.mark)
 
@@ -3109,18 +3236,7 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
                 self.firstUndo = None
                 self.lastUndo = None
 
-            self.currentUndo = None
-
-            # we threw away an unknown number of undo items, so we must go
-            # through all of the remaining ones and recalculate how much
-            # memory is used
-            self.undoMemoryUsed = 0
-
-            tmp = self.firstUndo
-
-            while tmp:
-                self.undoMemoryUsed += tmp.memoryUsed()
-                tmp = tmp.next
+            self.removeRedoHistory()
 
         if not self.lastUndo:
             # no undo history at all yet
@@ -3133,10 +3249,16 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         self.undoMemoryUsed += u.memoryUsed()
 
+        if self.journal:
+            self.journal.addEdit(self, u)
+
+            if self.undoMemoryUsed >= UNDO_MEMORY_LIMIT:
+                self.unloadUndo()
+
         # trim undo history until the estimated memory usage is small
         # enough
         while ((self.firstUndo is not self.lastUndo) and
-               (self.undoMemoryUsed >= 5000000)):
+               (self.undoMemoryUsed >= UNDO_MEMORY_LIMIT)):
 
             tmp = self.firstUndo
             tmp.next.prev = None
@@ -3151,6 +3273,86 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         self.currentUndo = None
 
+    # throw away the undo history from currentUndo onwards, i.e. all the
+    # actions that could be redone.
+    def removeRedoHistory(self):
+        if self.currentUndo.prev:
+            # not at beginning of undo history; cut off the rest
+            self.currentUndo.prev.next = None
+            self.lastUndo = self.currentUndo.prev
+        else:
+            # beginning of undo history; throw everything away
+            self.firstUndo = None
+            self.lastUndo = None
+
+        self.currentUndo = None
+        self.calcUndoMemoryUsed()
+
+    # throw away the undo history up to and including undo object 'u',
+    # which must not be after currentUndo.
+    def removeUndoHistory(self, u):
+        if u.next:
+            u.next.prev = None
+            self.firstUndo = u.next
+            u.next = None
+        else:
+            self.firstUndo = None
+            self.lastUndo = None
+
+        self.calcUndoMemoryUsed()
+
+    # we throw away an unknown number of undo items at times, after which
+    # we must go through all of the remaining ones and recalculate how
+    # much memory is used
+    def calcUndoMemoryUsed(self):
+        self.undoMemoryUsed = 0
+
+        tmp = self.firstUndo
+
+        while tmp:
+            self.undoMemoryUsed += tmp.memoryUsed()
+            tmp = tmp.next
+
+    # replace the oldest undo objects with undo.Stubs that read their
+    # contents from the journal, until the rest fit in half of
+    # UNDO_MEMORY_LIMIT. the newest one is always kept in memory.
+    def unloadUndo(self):
+        # make sure everything is in the file before relying on it
+        self.journal.flush()
+
+        if self.journal.failed:
+            return
+
+        used = self.lastUndo.memoryUsed()
+        u = self.lastUndo.prev
+
+        while u and ((used + u.memoryUsed()) < (UNDO_MEMORY_LIMIT // 2)):
+            used += u.memoryUsed()
+            u = u.prev
+
+        while u:
+            if (u.journalPos is not None) and \
+                   not isinstance(u, undo.Stub):
+                stub = undo.Stub(u, self.journal)
+
+                if stub.prev:
+                    stub.prev.next = stub
+                else:
+                    self.firstUndo = stub
+
+                stub.next.prev = stub
+
+                if self.currentUndo is u:
+                    self.currentUndo = stub
+
+                u.prev = u.next = None
+                u = stub
+
+            used += u.memoryUsed()
+            u = u.prev
+
+        self.undoMemoryUsed = used
+
     def addMergedUndo(self, u):
         assert u is self.lastUndo
 
@@ -3161,6 +3363,9 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
 
         self.undoMemoryUsed += memoryUsedDiff
 
+        if self.journal:
+            self.journal.mergeEdit(self, u)
+
     def undoCmd(self, cs):
         if not self.canUndo():
             return
@@ -3171,22 +3376,51 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
         else:
             u = self.lastUndo
 
-        u.undo(self)
+        editCount = self.editCount
+
+        # undo objects stored in the journal can't be undone if it can't
+        # be read, and neither can anything before them
+        try:
+            u.undo(self)
+        except (error.MiscError, EnvironmentError), e:
+            self.removeUndoHistory(u)
+            cs.errorMsg = "Undo failed: %s\n\nThe undo history up to" \
+                " this point has been removed." % e
+
+            return
+
         self.currentUndo = u
 
         self.clearMark()
         self.markChanged()
 
+        if self.journal:
+            self.journal.addUndo(self, editCount)
+
     def redoCmd(self, cs):
         if not self.canRedo():
             return
 
-        self.currentUndo.redo(self)
+        editCount = self.editCount
+
+        # likewise for redo, for the objects after the failed one
+        try:
+            self.currentUndo.redo(self)
+        except (error.MiscError, EnvironmentError), e:
+            self.removeRedoHistory()
+            cs.errorMsg = "Redo failed: %s\n\nThe redo history from" \
+                " this point on has been removed." % e
+
+            return
+
         self.currentUndo = self.currentUndo.next
 
         self.clearMark()
         self.markChanged()
 
+        if self.journal:
+            self.journal.addRedo(self, editCount)
+
     # check script for internal consistency. raises an AssertionError on
     # errors. ONLY MEANT TO BE USED IN TEST CODE.
     def _validate(self):
@@ -3226,7 +3460,11 @@ Generated with <a href="http://www.trelby.org">Trelby</a>.</p>
                 prevType = ln.lt
 
 # one line in a screenplay
-class Line:
+class Line(object):
+    # scripts can have tens of thousands of these, so don't give each one
+    # a dictionary
+    __slots__ = ("lb", "lt", "text")
+
     def __init__(self, lb = LB_LAST, lt = ACTION, text = ""):
 
         # line break type
@@ -3253,18 +3491,985 @@ class Line:
     def fromStr(s):
         return Line(config.char2lb(s[0]), config.char2lt(s[1]), s[2:])
 
-# used to keep track of selected area. this marks one of the end-points,
-# while the other one is the current position.
-class Mark:
-    def __init__(self, line, column):
-        self.line = line
-        self.column = column
+# a line inside a LineStore. works like a Line, but reads and writes the
+# store's columns directly. it refers to the line by index, so it is only
+# valid until lines are inserted into or deleted from the store before it.
+class StoredLine(object):
+    __slots__ = ("store", "index")
 
-    def __eq__(self, other):
-        return (self.line == other.line) and (self.column == other.column)
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def getLb(self):
+        return self.store.lbs[self.index]
+
+    def setLb(self, lb):
+        self.store.lbs[self.index] = lb
+
+    def getLt(self):
+        return self.store.lts[self.index]
+
+    def setLt(self, lt):
+        self.store.lts[self.index] = lt
+
+    def getText(self):
+        return self.store.texts[self.index]
+
+    def setText(self, text):
+        self.store.texts[self.index] = text
+
+    lb = property(getLb, setLb)
+    lt = property(getLt, setLt)
+    text = property(getText, setText)
+
+    def __str__(self):
+        return config.lb2char(self.lb) + config.lt2char(self.lt)\
+               + self.text
+
+    def __ne__(self, other):
+        return ((self.lt != other.lt) or (self.lb != other.lb) or
+                (self.text != other.text))
+
+# a compact, columnar alternative to a list of Line objects: linebreak and
+# line types are kept in byte arrays and texts in a list, which takes a
+# fraction of the memory and can be copied without creating an object per
+# line. it supports the list operations Screenplay uses on its lines, so
+# code like sp.lines[i].text keeps working; indexing returns a StoredLine,
+# iterating and slicing return Line copies.
+class LineStore(object):
+    def __init__(self, lines = []):
+        self.lbs = array.array("B", [ln.lb for ln in lines])
+        self.lts = array.array("B", [ln.lt for ln in lines])
+        self.texts = [ln.text for ln in lines]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Line(self.lbs[j], self.lts[j], self.texts[j])
+                    for j in xrange(*i.indices(len(self.texts)))]
+
+        if i < 0:
+            i += len(self.texts)
+
+        if (i < 0) or (i >= len(self.texts)):
+            raise IndexError("LineStore index out of range")
+
+        return StoredLine(self, i)
+
+    def __setitem__(self, i, val):
+        # read everything first, in case val contains StoredLines from
+        # this store
+        if isinstance(i, slice):
+            val = [(ln.lb, ln.lt, ln.text) for ln in val]
+
+            self.lbs[i] = array.array("B", [v[0] for v in val])
+            self.lts[i] = array.array("B", [v[1] for v in val])
+            self.texts[i] = [v[2] for v in val]
+        else:
+            lb, lt, text = val.lb, val.lt, val.text
+
+            self.lbs[i] = lb
+            self.lts[i] = lt
+            self.texts[i] = text
+
+    def __delitem__(self, i):
+        del self.lbs[i]
+        del self.lts[i]
+        del self.texts[i]
+
+    def __iter__(self):
+        return itertools.imap(Line, self.lbs, self.lts, self.texts)
+
+    def __deepcopy__(self, memo):
+        ls = LineStore()
+        ls.lbs = array.array("B", self.lbs)
+        ls.lts = array.array("B", self.lts)
+        ls.texts = self.texts[:]
+
+        return ls
+
+    def insert(self, i, ln):
+        self[i:i] = [ln]
+
+    def append(self, ln):
+        self.insert(len(self.texts), ln)
+
+    def extend(self, lines):
+        self[len(self.texts):len(self.texts)] = lines
+
+    # return contents as a list of Line objects.
+    def toLines(self):
+        return list(iter(self))
+
+# a sorted array of integers, used by the indexes below that store line
+# numbers or heights for a screenplay's lines. adding a constant to all
+# values from some position onwards (which is what inserting or deleting
+# lines does to everything after them) is done lazily through a short
+# list of (position, delta) fixups that is folded back into the array once
+# it grows too long.
+class ShiftArray:
+
+    # max nr of pending fixups before they are applied to the array
+    MAX_FIXUPS = 32
+
+    def __init__(self, vals = []):
+        # stored values, without the fixups
+        self.vals = array.array("l", vals)
+
+        # pending fixups, sorted by position
+        self.fixPos = []
+        self.fixDeltas = []
+
+    def __len__(self):
+        return len(self.vals)
+
+    # get value at position i.
+    def get(self, i):
+        v = self.vals[i]
+
+        for j in xrange(len(self.fixPos)):
+            if self.fixPos[j] > i:
+                break
+
+            v += self.fixDeltas[j]
+
+        return v
+
+    # return all values as a list.
+    def toList(self):
+        return [self.get(i) for i in xrange(len(self.vals))]
+
+    # replace values at positions a - (b - 1) with the ones in the list
+    # 'vals', and add 'shift' to all values after them.
+    def replace(self, a, b, vals, shift):
+        delta = len(vals) - (b - a)
+        end = a + len(vals)
+
+        # sum of fixups applying to position a, and of the ones removed
+        # since they are inside the replaced area
+        before = 0
+        removed = 0
+
+        fixPos = []
+        fixDeltas = []
+
+        for i in xrange(len(self.fixPos)):
+            fp = self.fixPos[i]
+            fd = self.fixDeltas[i]
+
+            if fp <= a:
+                before += fd
+                fixPos.append(fp)
+                fixDeltas.append(fd)
+            elif fp < b:
+                removed += fd
+            else:
+                fixPos.append(fp + delta)
+                fixDeltas.append(fd)
+
+        self.vals[a:b] = array.array("l", [v - before for v in vals])
+
+        fix = removed + shift
+
+        if (fix != 0) and (end < len(self.vals)):
+            i = bisect.bisect_right(fixPos, end)
+            fixPos.insert(i, end)
+            fixDeltas.insert(i, fix)
+
+        # drop fixups past the end
+        while fixPos and (fixPos[-1] >= len(self.vals)):
+            fixPos.pop()
+            fixDeltas.pop()
+
+        self.fixPos = fixPos
+        self.fixDeltas = fixDeltas
+
+        if len(fixPos) > self.MAX_FIXUPS:
+            self.applyFixups()
+
+    # fold pending fixups into the array.
+    def applyFixups(self):
+        vals = self.vals
+        fp = self.fixPos + [len(vals)]
+        d = 0
+
+        for i in xrange(len(self.fixDeltas)):
+            d += self.fixDeltas[i]
+
+            for j in xrange(fp[i], fp[i + 1]):
+                vals[j] += d
+
+        self.fixPos = []
+        self.fixDeltas = []
+
+    # like bisect.bisect_right: return the position of the first value
+    # greater than x in positions lo - (hi - 1), or hi if there is none.
+    def bisectRight(self, x, lo = 0, hi = None):
+        vals = self.vals
+        fp = self.fixPos
+
+        if hi is None:
+            hi = len(vals)
+
+        # fixups applying to position lo
+        fi = bisect.bisect_right(fp, lo)
+        d = sum(self.fixDeltas[:fi])
+
+        # search each range of positions with the same fixup separately
+        while lo < hi:
+            if fi < len(fp):
+                segEnd = min(fp[fi], hi)
+            else:
+                segEnd = hi
+
+            i = bisect.bisect_right(vals, x - d, lo, segEnd)
+
+            if i < segEnd:
+                return i
+
+            lo = segEnd
+
+            if fi < len(fp):
+                d += self.fixDeltas[fi]
+                fi += 1
+
+        return hi
+
+# cumulative line heights of a screenplay, used by pagination to find the
+# last line that fits on a page with a binary search instead of walking
+# the lines one by one. heights are in the same units as paginate uses
+# (1 line = 10), and the value for line N is the height from the top of
+# line 0 to the top of line N, assuming no page breaks in between.
+#
+# after edits, only the modified lines are recalculated; the heights of
+# the lines after them are shifted lazily by the ShiftArray.
+class SpacingIndex:
+    def __init__(self):
+        self.heights = ShiftArray()
+
+    # recalculate everything.
+    def rebuild(self, sp):
+        self.heights = ShiftArray(self.calc(sp, 0, len(sp.lines) - 1))
+
+    # update after lines have been modified. head and tail are the number
+    # of unmodified lines at the start and end of the script (see
+    # DirtyLines), and oldLength is the script's length before the
+    # modifications.
+    def update(self, sp, head, tail, oldLength):
+        length = len(sp.lines)
+        delta = length - oldLength
+
+        # a line's height depends on the preceding line's linebreak, so
+        # the line after the modified ones must be recalculated as well.
+        first = min(head, length)
+        last = min(length - 1, length - tail)
+        oldLast = last - delta
+
+        if first > last:
+            # lines were only deleted from the end
+            self.heights.replace(length, oldLength, [], 0)
+
+            return
+
+        # height of the line after the modified ones, before and after
+        # the modifications
+        shift = 0
+        hasTail = (last + 1) < length
+
+        if hasTail:
+            oldHeight = self.heights.get(oldLast)
+
+        vals = self.calc(sp, first, last)
+
+        if hasTail:
+            shift = vals[-1] - oldHeight
+
+        self.heights.replace(first, oldLast + 1, vals, shift)
+
+    # calculate heights for lines first - last (inclusive) and return them
+    # in a list.
+    def calc(self, sp, first, last):
+        ret = []
+
+        if first == 0:
+            h = 0
+            ret.append(0)
+            first = 1
+        else:
+            h = self.getHeight(first - 1)
+
+        if first > last:
+            return ret
+
+        # line heights by type, after LB_LAST and after other linebreaks
+        before = {}
+        intra = {}
+
+        for lt, t in sp.cfg.types.iteritems():
+            before[lt] = 10 + t.beforeSpacing
+            intra[lt] = 10 + t.intraSpacing
+
+        lbl = LB_LAST
+        add = ret.append
+        prevLb = sp.lines[first - 1].lb
+
+        for ln in itertools.islice(sp.lines, first, last + 1):
+            if prevLb == lbl:
+                h += before[ln.lt]
+            else:
+                h += intra[ln.lt]
+
+            add(h)
+            prevLb = ln.lb
+
+        return ret
+
+    # get height for given line.
+    def getHeight(self, line):
+        return self.heights.get(line)
+
+    # return index of the last line that fits on a page starting at line
+    # 'start', when the page has room for 'room' units of lines (counting
+    # the starting line, too).
+    def findPageEnd(self, start, room):
+        hts = self.heights
+
+        return hts.bisectRight(hts.get(start) + room - 10, start + 1) - 1
+
+# index of the element and scene structure of a screenplay, used to
+# answer questions like "which scene is this line in" or "who is speaking
+# here" with a binary search instead of walking the lines. it keeps its
+# own DirtyLines, fed by Screenplay.markLinesChanged, and is brought up to
+# date lazily by sync the next time it's needed after edits.
+class StructureIndex:
+    def __init__(self):
+        self.dirty = DirtyLines()
+
+        # lines list, and its length, that the index is up to date with
+        self.lines = None
+        self.length = -1
+
+        # first lines of all elements, of scene elements, and of scene
+        # and act break elements
+        self.elemStarts = ShiftArray()
+        self.sceneStarts = ShiftArray()
+        self.sectStarts = ShiftArray()
+
+        # character lines that end an element, i.e. speaker names
+        self.speakers = ShiftArray()
+
+    # bring index up to date with sp's lines.
+    def sync(self, sp):
+        ls = sp.lines
+
+        if ls is not self.lines:
+            e, sc, se, spk = self.scan(ls, 0, len(ls) - 1)
+
+            self.elemStarts = ShiftArray(e)
+            self.sceneStarts = ShiftArray(sc)
+            self.sectStarts = ShiftArray(se)
+            self.speakers = ShiftArray(spk)
+
+        elif self.dirty.isSet():
+            self.update(ls)
+
+        self.dirty.clear()
+        self.lines = ls
+        self.length = len(ls)
+
+    # rescan the modified lines.
+    def update(self, ls):
+        length = len(ls)
+        delta = length - self.length
+
+        # whether a line starts an element depends on the preceding
+        # line's linebreak, so the line after the modified ones must be
+        # rescanned as well.
+        first = min(self.dirty.head, length)
+        last = min(length - 1, length - self.dirty.tail)
+        oldLast = last - delta
+
+        vals = self.scan(ls, first, last)
+        arrays = (self.elemStarts, self.sceneStarts, self.sectStarts,
+                  self.speakers)
+
+        for i in xrange(len(arrays)):
+            arr = arrays[i]
+
+            arr.replace(arr.bisectRight(first - 1), arr.bisectRight(oldLast),
+                        vals[i], delta)
+
+    # scan lines first - last (inclusive) and return a (elemStarts,
+    # sceneStarts, sectStarts, speakers) tuple of lists of the matching
+    # lines.
+    def scan(self, ls, first, last):
+        elems = []
+        scenes = []
+        sects = []
+        speakers = []
+
+        if first > last:
+            return (elems, scenes, sects, speakers)
+
+        lbl = LB_LAST
+
+        if first == 0:
+            prevLb = lbl
+        else:
+            prevLb = ls[first - 1].lb
+
+        i = first
+
+        for ln in itertools.islice(ls, first, last + 1):
+            lt = ln.lt
+
+            if prevLb == lbl:
+                elems.append(i)
+
+                if lt == SCENE:
+                    scenes.append(i)
+                    sects.append(i)
+                elif lt == ACTBREAK:
+                    sects.append(i)
+
+            if (lt == CHARACTER) and (ln.lb == lbl):
+                speakers.append(i)
+
+            prevLb = ln.lb
+            i += 1
+
+        return (elems, scenes, sects, speakers)
+
+# texts of the elements auto-completion is done for, kept up to date as
+# the script is edited, so that completions can be found without looking
+# at every line of the script. like getMatchingText used to, this only
+# looks at the last lines of elements.
+class CompletionIndex:
+
+    # max nr of pending shifts before they are applied to all line lists
+    MAX_SHIFTS = 32
 
-# data held in internal clipboard.
-class ClipData:
+    def __init__(self):
+        self.dirty = DirtyLines()
+
+        # lines list, and its length, that the index is up to date with
+        self.lines = None
+        self.length = -1
+
+        # line types that are indexed
+        self.types = {}
+
+        # (lt, uppercase text) for each line that is the last line of an
+        # indexed type of element, None for other lines
+        self.entries = []
+
+        # key = line type, value = CompletionSet
+        self.sets = {}
+
+        # key = entry, value = sorted list of the lines it is on. these
+        # only have the first self.lineVers[entry] shifts of self.shifts
+        # applied to them; use getLines to get an up to date list.
+        self.lineLists = {}
+        self.lineVers = {}
+
+        # (line, delta) for each update that moved lines around, meaning
+        # lines after 'line' were moved by 'delta'
+        self.shifts = []
+
+    # bring index up to date with sp's lines.
+    def sync(self, sp):
+        ls = sp.lines
+
+        if ls is not self.lines:
+            self.types = dict.fromkeys(sp.autoCompletion.types.keys())
+            self.sets = {}
+
+            for lt in self.types:
+                self.sets[lt] = CompletionSet()
+
+            self.entries = self.scan(ls, 0, len(ls) - 1)
+            self.lineLists = {}
+            self.lineVers = {}
+            self.shifts = []
+
+            for i, e in enumerate(self.entries):
+                if e:
+                    self.sets[e[0]].add(e[1])
+                    self.lineLists.setdefault(e, []).append(i)
+                    self.lineVers[e] = 0
+
+        elif self.dirty.isSet():
+            self.update(ls)
+
+        self.dirty.clear()
+        self.lines = ls
+        self.length = len(ls)
+
+    # rescan the modified lines.
+    def update(self, ls):
+        length = len(ls)
+        delta = length - self.length
+
+        # a line's entry depends on its own linebreak only, unlike in
+        # StructureIndex
+        first = min(self.dirty.head, length)
+        last = min(length - 1, length - 1 - self.dirty.tail)
+        oldLast = last - delta
+
+        for i in xrange(first, oldLast + 1):
+            e = self.entries[i]
+
+            if e:
+                self.sets[e[0]].remove(e[1])
+                self.removeLine(e, i)
+
+        if delta != 0:
+            self.shifts.append((oldLast, delta))
+
+        vals = self.scan(ls, first, last)
+
+        for i, e in enumerate(vals):
+            if e:
+                self.sets[e[0]].add(e[1])
+                self.addLine(e, first + i)
+
+        self.entries[first:oldLast + 1] = vals
+
+        if len(self.shifts) > self.MAX_SHIFTS:
+            for e in self.lineLists:
+                self.getLines(e)
+
+            self.shifts = []
+
+            for e in self.lineVers:
+                self.lineVers[e] = 0
+
+    # return the up to date sorted list of lines entry 'e' is on, or None
+    # if it's not on any.
+    def getLines(self, e):
+        lines = self.lineLists.get(e)
+
+        if lines is None:
+            return None
+
+        ver = self.lineVers[e]
+
+        for line, delta in self.shifts[ver:]:
+            i = bisect.bisect_right(lines, line)
+            lines[i:] = [ln + delta for ln in lines[i:]]
+
+        self.lineVers[e] = len(self.shifts)
+
+        return lines
+
+    # add line 'line' to entry 'e's list of lines.
+    def addLine(self, e, line):
+        lines = self.getLines(e)
+
+        if lines is None:
+            self.lineLists[e] = [line]
+            self.lineVers[e] = len(self.shifts)
+        else:
+            bisect.insort(lines, line)
+
+    # remove line 'line' from entry 'e's list of lines.
+    def removeLine(self, e, line):
+        lines = self.getLines(e)
+
+        if len(lines) == 1:
+            del self.lineLists[e]
+            del self.lineVers[e]
+        else:
+            del lines[bisect.bisect_left(lines, line)]
+
+    # return list of entries for lines first - last (inclusive).
+    def scan(self, ls, first, last):
+        ret = []
+        types = self.types
+
+        for ln in itertools.islice(ls, first, last + 1):
+            if (ln.lb == LB_LAST) and (ln.lt in types):
+                ret.append((ln.lt, util.upper(ln.text)))
+            else:
+                ret.append(None)
+
+        return ret
+
+    # return dict of the indexed texts of type 'lt' that start with
+    # (uppercase) 'text', with key = text, value = number of lines with
+    # that text, not counting line 'line'. texts only on that line are
+    # left out.
+    def find(self, text, lt, line):
+        ret = self.sets[lt].find(text)
+
+        e = self.entries[line]
+
+        if e and (e[0] == lt) and (e[1] in ret):
+            if ret[e[1]] > 1:
+                ret[e[1]] -= 1
+            else:
+                del ret[e[1]]
+
+        return ret
+
+    # return the text of the last indexed line of type 'lt' before line
+    # 'line' whose text is in 'texts', or None.
+    def findPrev(self, lt, line, texts):
+        ret = None
+        retLine = -1
+
+        for text in texts:
+            lines = self.getLines((lt, text))
+
+            if lines:
+                i = bisect.bisect_left(lines, line)
+
+                if (i > 0) and (lines[i - 1] > retLine):
+                    ret = text
+                    retLine = lines[i - 1]
+
+        return ret
+
+# multiset of the texts of one element type in CompletionIndex, sorted
+# for quick prefix searches.
+class CompletionSet:
+    def __init__(self):
+        # sorted list of distinct texts
+        self.texts = []
+
+        # key = text, value = number of times it occurs
+        self.counts = {}
+
+    def add(self, text):
+        cnt = self.counts.get(text, 0)
+
+        if cnt == 0:
+            bisect.insort(self.texts, text)
+
+        self.counts[text] = cnt + 1
+
+    def remove(self, text):
+        cnt = self.counts[text]
+
+        if cnt == 1:
+            del self.counts[text]
+            del self.texts[bisect.bisect_left(self.texts, text)]
+        else:
+            self.counts[text] = cnt - 1
+
+    # return dict of texts starting with 'prefix', with key = text, value
+    # = count.
+    def find(self, prefix):
+        lo, hi = util.prefixRange(self.texts, prefix)
+        counts = self.counts
+
+        return dict([(s, counts[s]) for s in self.texts[lo:hi]])
+
+# keeps track of which lines of a screenplay have been modified since the
+# last time someone (e.g. pagination) processed them. the modified area
+# is stored as the number of untouched lines at the start and at the end
+# of the script, which stays correct no matter how many lines are
+# inserted or deleted inside it.
+class DirtyLines:
+    def __init__(self):
+        # nr of unmodified lines at the start / end of the script
+        self.head = 0
+        self.tail = 0
+
+        # True if anything has been modified
+        self.dirty = True
+
+    # add lines line1 - line2 (inclusive) of a script that is now
+    # 'length' lines long to the modified area.
+    def add(self, line1, line2, length):
+        self.head = min(self.head, max(line1, 0))
+        self.tail = min(self.tail, max(length - 1 - line2, 0))
+        self.dirty = True
+
+    # mark everything as unmodified
+    def clear(self):
+        self.head = sys.maxint
+        self.tail = sys.maxint
+        self.dirty = False
+
+    def isSet(self):
+        return self.dirty
+
+# LRU cache of pages generated by Screenplay.generatePMLPage. a page is
+# looked up by everything its contents depend on: the lines on it and
+# their positions, the neighboring lines that decide things like (MORE)
+# and (cont'd), the config and headers objects, and the Pager state
+# going in. edits and repagination thus never return stale pages, and
+# pages that are no longer current just age out of the cache.
+#
+# the Pager state changes a page makes (scene numbers, TOC entries) are
+# recorded and replayed on cache hits, and callers get a new pml.Page
+# with a copy of the ops list, so they're free to add ops to it.
+class PageCache:
+
+    # max nr of pages to keep
+    MAX_PAGES = 150
+
+    def __init__(self):
+        # key = see getKey, value = (ops, tocItems, pagerScene,
+        # pagerSceneContNr), where the last two are the Pager state
+        # after the page
+        self.pages = collections.OrderedDict()
+
+    # return key for the given page, or None if the page doesn't exist.
+    def getKey(self, sp, pager, pageNr, forPDF, doExtra):
+        tmp = sp.getPMLPageRange(pageNr)
+
+        if not tmp:
+            return None
+
+        start, end = tmp
+        ls = sp.lines
+
+        lines = tuple([(ln.lb, ln.lt, ln.text) for ln in
+                       itertools.islice(ls, start, end + 1)])
+
+        if start > 0:
+            prev = (ls[start - 1].lb, ls[start - 1].lt)
+        else:
+            prev = None
+
+        if (end + 1) < len(ls):
+            nextLt = ls[end + 1].lt
+        else:
+            nextLt = None
+
+        if doExtra:
+            if sp.needsMore(start - 1):
+                speaker = sp.getPrevSpeaker(start)
+            else:
+                speaker = None
+
+            extra = (pageNr, speaker, pager.scene, pager.sceneContNr)
+        else:
+            extra = (pageNr == 1)
+
+        return (sp.cfg, sp.headers, forPDF, doExtra, start, prev, nextLt,
+                extra, lines)
+
+    def getPage(self, sp, pager, pageNr, forPDF, doExtra):
+        key = self.getKey(sp, pager, pageNr, forPDF, doExtra)
+
+        if key is None:
+            return None
+
+        val = self.pages.pop(key, None)
+
+        if val is None:
+            tocCount = len(pager.doc.tocs)
+            pg = sp.generatePMLPage(pager, pageNr, forPDF, doExtra)
+
+            val = (pg.ops, pager.doc.tocs[tocCount:], pager.scene,
+                   pager.sceneContNr)
+
+            if len(self.pages) >= self.MAX_PAGES:
+                self.pages.popitem(False)
+        else:
+            for toc in val[1]:
+                pager.doc.addTOC(toc)
+
+            pager.scene = val[2]
+            pager.sceneContNr = val[3]
+
+        self.pages[key] = val
+
+        pg = pml.Page(pager.doc)
+        pg.ops = val[0][:]
+
+        return pg
+
+    # remove all pages.
+    def clear(self):
+        self.pages.clear()
+
+# reformats and/or paginates a copy of a screenplay, so that the work can
+# be done in a separate thread (see util.BackgroundTask) while the
+# original stays untouched. run does the work, and apply, which must be
+# called from the thread that owns the screenplay, copies the results
+# back to it.
+class LayoutJob:
+
+    # sp is the screenplay to lay out. if reformat is True, all of it is
+    # reformatted and paginated from scratch, otherwise its pagination
+    # is brought up to date. if cfg is not None, it is a new config to
+    # apply to the screenplay, which always reformats it.
+    def __init__(self, sp, reformat, cfg = None):
+        self.sp = sp
+        self.reformat = reformat or (cfg is not None)
+        self.newCfg = cfg is not None
+
+        # state of sp when the job was created
+        self.lines = sp.lines
+        self.cfg = sp.cfg
+        self.editCount = sp.editCount
+
+        c = copy.deepcopy(sp)
+
+        if cfg:
+            c.cfg = copy.deepcopy(cfg)
+            c.cfg.recalc()
+
+        elif not self.reformat:
+            # carry over the current pagination so it can be updated
+            # incrementally
+            c.pages = sp.pages[:]
+            c.pagesNoAdjust = sp.pagesNoAdjust[:]
+            c.spacingIndex = copy.deepcopy(sp.spacingIndex)
+            c.pgDirty = copy.deepcopy(sp.pgDirty)
+            c.pgHdrLines = sp.pgHdrLines
+            c.pgLength = sp.pgLength
+
+            if sp.pgLines is sp.lines:
+                c.pgLines = c.lines
+
+            if sp.pgCfg is sp.cfg:
+                c.pgCfg = c.cfg
+
+        self.copy = c
+
+    # do the work. progress is as in Screenplay.paginate, and is called
+    # with (0, 1) - (1, 1) spanning the whole job.
+    def run(self, progress = None):
+        c = self.copy
+
+        if not self.reformat:
+            c.paginate(True, progress)
+
+            return
+
+        if progress:
+            # first half for reformatting, second for pagination
+            def half(part):
+                return lambda done, total: progress(
+                    part * total + done, 2 * total)
+        else:
+            def half(part):
+                return None
+
+        c.reformatAll(half(0))
+        c.paginate(False, half(1))
+
+    # copy the results to the screenplay, unless it has been modified
+    # since the job was created. returns True if the results were used.
+    def apply(self):
+        sp = self.sp
+        c = self.copy
+
+        if (sp.lines is not self.lines) or (sp.cfg is not self.cfg) or\
+               (sp.editCount != self.editCount):
+            return False
+
+        if self.newCfg:
+            # see Screenplay.applyCfg
+            sp.firstUndo = None
+            sp.lastUndo = None
+            sp.currentUndo = None
+            sp.undoMemoryUsed = 0
+
+            sp.cfg = c.cfg
+            sp.markChanged()
+
+        if self.reformat:
+            sp.lines = c.lines
+            sp.line = c.line
+            sp.column = c.column
+
+        sp.pages = c.pages
+        sp.pagesNoAdjust = c.pagesNoAdjust
+        sp.spacingIndex = c.spacingIndex
+        sp.pgDirty = c.pgDirty
+        sp.pgLines = sp.lines
+        sp.pgCfg = sp.cfg
+        sp.pgHdrLines = c.pgHdrLines
+        sp.pgLength = c.pgLength
+        sp.lastPaginated = c.lastPaginated
+
+        return True
+
+# reads lines from a file object in chunks, splitting them the same way
+# str.splitlines does and removing the line endings.
+class LineReader:
+
+    # how many bytes to read at a time
+    CHUNK_SIZE = 65536
+
+    def __init__(self, f):
+        self.f = f
+        self.lines = self.readLines()
+
+        # nr of lines returned by next so far, i.e. the 1-based number of
+        # the last one
+        self.lineNr = 0
+
+        # line returned by peek but not yet by next
+        self.peeked = None
+
+        # nr of bytes read from the file so far
+        self.bytesRead = 0
+
+    # generator returning the lines of the file.
+    def readLines(self):
+        rest = ""
+
+        while 1:
+            chunk = self.f.read(self.CHUNK_SIZE)
+
+            if not chunk:
+                break
+
+            self.bytesRead += len(chunk)
+            parts = (rest + chunk).splitlines(True)
+            rest = parts.pop()
+
+            # a line ending in "\r" may still get a "\n" from the next
+            # chunk, so only a "\n" ending is known to be final.
+            if rest.endswith("\n"):
+                parts.append(rest)
+                rest = ""
+
+            for s in parts:
+                yield s.rstrip("\r\n")
+
+        if rest:
+            yield rest.rstrip("\r\n")
+
+    # return next line, or None at end of file.
+    def next(self):
+        s = self.peek()
+        self.peeked = None
+
+        if s is not None:
+            self.lineNr += 1
+
+        return s
+
+    # return next line without consuming it, or None at end of file.
+    def peek(self):
+        if self.peeked is None:
+            self.peeked = next(self.lines, None)
+
+        return self.peeked
+
+# used to keep track of selected area. this marks one of the end-points,
+# while the other one is the current position.
+class Mark:
+    def __init__(self, line, column):
+        self.line = line
+        self.column = column
+
+    def __eq__(self, other):
+        return (self.line == other.line) and (self.column == other.column)
+
+# data held in internal clipboard.
+class ClipData:
     def __init__(self):
 
         # list of Line objects
@@ -3292,14 +4497,22 @@ class CommandState:
         # True if we need to make current line visible
         self.needsVisifying = True
 
+        # error message to show to the user, or None
+        self.errorMsg = None
+
 # keeps a collection of page numbers from a given screenplay, and allows
 # formatting of the list intelligently, e.g. "4-7, 9, 11-16".
 class PageList:
-    def __init__(self, allPages):
+    # 'indexes' is None, or a dictionary of page number -> index in
+    # allPages, which can be given to save building one each time the
+    # list is formatted when there are lots of PageLists.
+    def __init__(self, allPages, indexes = None):
         # list of all pages in the screenplay, in the format returned by
         # Screenplay.getPageNumbers().
         self.allPages = allPages
 
+        self.indexes = indexes
+
         # key = page number (str), value = unused
         self.pages = {}
 
@@ -3320,41 +4533,30 @@ class PageList:
     # return textual representation of pages where consecutive pages are
     # formatted as "x-y". example: "3, 5-8, 11".
     def __str__(self):
-        # one entry for each page from above, containing True if that page
-        # is contained in this PageList object
-        hasPage = []
-
-        for p in self.allPages:
-            hasPage.append(p in self.pages.keys())
+        indexes = self.indexes
 
-        # finished string
-        s = ""
+        if indexes is None:
+            indexes = dict([(p, i) for i, p in enumerate(self.allPages)])
 
-        # start index of current range, or -1 if no range in progress
-        rangeStart = -1
+        # indexes of our pages in allPages, in order
+        tmp = sorted([indexes[p] for p in self.pages if p in indexes])
 
-        for i in xrange(len(self.allPages)):
-            if rangeStart != -1:
-                if not hasPage[i]:
+        # list of "x" or "x-y"
+        ranges = []
 
-                    # range ends
+        i = 0
+        while i < len(tmp):
+            j = i
 
-                    if i != (rangeStart + 1):
-                        s += "-%s" % self.allPages[i - 1]
+            while ((j + 1) < len(tmp)) and (tmp[j + 1] == (tmp[j] + 1)):
+                j += 1
 
-                    rangeStart = -1
+            if j == i:
+                ranges.append(self.allPages[tmp[i]])
             else:
-                if hasPage[i]:
-                    if s:
-                        s += ", "
-
-                    s += self.allPages[i]
-                    rangeStart = i
+                ranges.append("%s-%s" % (self.allPages[tmp[i]],
+                                         self.allPages[tmp[j]]))
 
-        last = len(self.allPages) - 1
+            i = j + 1
 
-        # finish last range if needed
-        if (rangeStart != -1) and (rangeStart != last):
-            s += "-%s" % self.allPages[last]
-
-        return s
+        return ", ".join(ranges)
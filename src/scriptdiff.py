@@ -0,0 +1,609 @@
+# comparing two versions of a script. scripts are compared element by
+# element, each element being identified by its type and text, so that
+# changes in line wrapping or pagination don't show up as differences.
+# elements that changed are further compared word by word. the result is
+# a list of Changes, which can be used as is or turned into a PDF report.
+#
+# the sequences are diffed by first stripping their common prefix and
+# suffix, then matching elements that occur exactly once in both (the
+# "patience diff" algorithm), and then using Myers' O(ND) algorithm on the
+# gaps between those. for typical edits the time taken depends mostly on
+# the amount of changes, not on the length of the script.
+
+import pml
+import pdf
+import screenplay
+import util
+
+import re
+
+# kinds of changes
+ADDED, DELETED, CHANGED = range(3)
+
+# tags of opcodes / word segments
+EQUAL = "="
+DELETE = "-"
+INSERT = "+"
+REPLACE = "!"
+
+# maximum edit distance Myers' algorithm is run to on a single gap. gaps
+# differing more than that are treated as entirely replaced, to keep the
+# time and memory taken reasonable when diffing unrelated texts.
+MAX_EDIT_DISTANCE = 1000
+
+# how similar (see getSimilarity) two elements of the same type at the same
+# place must be to be shown as one changed element, instead of one being
+# deleted and the other added
+MIN_SIMILARITY = 0.5
+
+# colors used in the report: backgrounds of deleted / added lines, and of
+# the words that differ in changed elements
+COLOR_DELETED = "1.0 0.667 0.667"
+COLOR_ADDED = "0.667 1.0 0.667"
+COLOR_DELETED_WORD = "1.0 0.4 0.4"
+COLOR_ADDED_WORD = "0.3 0.85 0.3"
+
+# one added, deleted or changed element.
+class Change:
+    def __init__(self, kind, lt, oldIndex, newIndex, oldText, newText):
+        self.kind = kind
+
+        # element type
+        self.lt = lt
+
+        # indexes of the element in the old / new script's element lists,
+        # None for elements that only exist in the other one. for
+        # deleted elements, newIndex is where the element would be in the
+        # new script.
+        self.oldIndex = oldIndex
+        self.newIndex = newIndex
+
+        # text of the element in the old / new script, None if missing
+        self.oldText = oldText
+        self.newText = newText
+
+        # number of the scene in the new script the change is in, 0 if it
+        # is before the first scene, and the scene's heading
+        self.scene = 0
+        self.sceneName = ""
+
+        # for CHANGED elements, the texts split into (tag, text) segments,
+        # tag being EQUAL, DELETE or INSERT, so that joining the EQUAL and
+        # DELETE segments gives oldText and joining the EQUAL and INSERT
+        # ones gives newText. None for other kinds of changes.
+        self.words = None
+
+    def __str__(self):
+        if self.kind == ADDED:
+            return "+ %s" % self.newText
+        elif self.kind == DELETED:
+            return "- %s" % self.oldText
+        else:
+            return "! %s" % "".join(
+                ["[%s%s]" % (tag, s) if tag != EQUAL else s
+                 for tag, s in self.words])
+
+# return list of (i, j) index pairs of matching items in sequences a and b,
+# in increasing order. items must be hashable.
+def getMatches(a, b):
+    # replace items with small integers, which are faster to compare
+    ids = {}
+    a = [ids.setdefault(x, len(ids)) for x in a]
+    b = [ids.setdefault(x, len(ids)) for x in b]
+
+    ret = []
+    _match(a, 0, len(a), b, 0, len(b), ret)
+
+    return ret
+
+# add matches of a[alo:ahi] and b[blo:bhi] to 'out'.
+def _match(a, alo, ahi, b, blo, bhi, out):
+    while (alo < ahi) and (blo < bhi) and (a[alo] == b[blo]):
+        out.append((alo, blo))
+        alo += 1
+        blo += 1
+
+    tail = []
+
+    while (alo < ahi) and (blo < bhi) and (a[ahi - 1] == b[bhi - 1]):
+        ahi -= 1
+        bhi -= 1
+        tail.append((ahi, bhi))
+
+    if (alo < ahi) and (blo < bhi):
+        anchors = _getAnchors(a, alo, ahi, b, blo, bhi)
+
+        if anchors:
+            i1, j1 = alo, blo
+
+            for i, j in anchors:
+                _match(a, i1, i, b, j1, j, out)
+                out.append((i, j))
+
+                i1, j1 = i + 1, j + 1
+
+            _match(a, i1, ahi, b, j1, bhi, out)
+        else:
+            _myers(a, alo, ahi, b, blo, bhi, out)
+
+    tail.reverse()
+    out.extend(tail)
+
+# return the longest increasing sequence of (i, j) pairs of items that
+# occur exactly once in both a[alo:ahi] and b[blo:bhi].
+def _getAnchors(a, alo, ahi, b, blo, bhi):
+    # key = item, value = [count in a, index in a, count in b, index in b]
+    counts = {}
+
+    for i in xrange(alo, ahi):
+        c = counts.get(a[i])
+
+        if c:
+            c[0] += 1
+        else:
+            counts[a[i]] = [1, i, 0, 0]
+
+    for j in xrange(blo, bhi):
+        c = counts.get(b[j])
+
+        if c:
+            c[2] += 1
+            c[3] = j
+
+    pairs = [(c[1], c[3]) for c in counts.itervalues()
+             if (c[0] == 1) and (c[2] == 1)]
+
+    if not pairs:
+        return []
+
+    pairs.sort()
+
+    # patience sorting. tops[k] is the index in 'pairs' of the pair with
+    # the smallest j ending an increasing sequence of length k + 1, and
+    # prev links each pair to the one before it in its sequence.
+    tops = []
+    topJs = []
+    prev = [None] * len(pairs)
+
+    for n, (i, j) in enumerate(pairs):
+        k = _bisect(topJs, j)
+
+        if k > 0:
+            prev[n] = tops[k - 1]
+
+        if k == len(tops):
+            tops.append(n)
+            topJs.append(j)
+        else:
+            tops[k] = n
+            topJs[k] = j
+
+    ret = []
+    n = tops[-1]
+
+    while n is not None:
+        ret.append(pairs[n])
+        n = prev[n]
+
+    ret.reverse()
+
+    return ret
+
+# return index of first item in sorted list 'seq' that is >= x.
+def _bisect(seq, x):
+    lo = 0
+    hi = len(seq)
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+
+        if seq[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo
+
+# Myers' algorithm: add matches of the shortest edit script between
+# a[alo:ahi] and b[blo:bhi] to 'out'.
+def _myers(a, alo, ahi, b, blo, bhi, out):
+    n = ahi - alo
+    m = bhi - blo
+
+    # key = diagonal k, value = furthest x reached on it
+    v = { 1 : 0 }
+
+    # v as it was before each round
+    trace = []
+
+    for d in xrange(min(n + m, MAX_EDIT_DISTANCE) + 1):
+        trace.append(v.copy())
+
+        for k in xrange(-d, d + 1, 2):
+            if (k == -d) or ((k != d) and (v[k - 1] < v[k + 1])):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+
+            y = x - k
+
+            while (x < n) and (y < m) and (a[alo + x] == b[blo + y]):
+                x += 1
+                y += 1
+
+            v[k] = x
+
+            if (x >= n) and (y >= m):
+                _myersBacktrack(trace, n, m, alo, blo, out)
+
+                return
+
+    # too different, nothing matches
+
+# walk back the path found by _myers and add its diagonals to 'out'.
+def _myersBacktrack(trace, x, y, alo, blo, out):
+    ret = []
+
+    for d in xrange(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+
+        if (k == -d) or ((k != d) and (v[k - 1] < v[k + 1])):
+            prevK = k + 1
+        else:
+            prevK = k - 1
+
+        prevX = v[prevK]
+        prevY = prevX - prevK
+
+        while (x > prevX) and (y > prevY):
+            x -= 1
+            y -= 1
+            ret.append((alo + x, blo + y))
+
+        x = prevX
+        y = prevY
+
+    ret.reverse()
+    out.extend(ret)
+
+# return a list of (tag, i1, i2, j1, j2) opcodes, like
+# difflib.SequenceMatcher.get_opcodes, describing how to turn sequence a
+# into sequence b.
+def getOpcodes(a, b):
+    ret = []
+    i1 = j1 = 0
+
+    for i, j in getMatches(a, b) + [(len(a), len(b))]:
+        if (i > i1) and (j > j1):
+            ret.append((REPLACE, i1, i, j1, j))
+        elif i > i1:
+            ret.append((DELETE, i1, i, j1, j))
+        elif j > j1:
+            ret.append((INSERT, i1, i, j1, j))
+
+        if i < len(a):
+            if ret and (ret[-1][0] == EQUAL):
+                ret[-1] = (EQUAL, ret[-1][1], i + 1, ret[-1][3], j + 1)
+            else:
+                ret.append((EQUAL, i, i + 1, j, j + 1))
+
+        i1, j1 = i + 1, j + 1
+
+    return ret
+
+# split text into words, runs of whitespace, and punctuation characters.
+def splitWords(s):
+    return re.findall(r"\w+|\s+|[^\w\s]", s)
+
+# compare texts s1 and s2 word by word, and return a list of (tag, text)
+# segments, as described in Change.words.
+def diffWords(s1, s2):
+    w1 = splitWords(s1)
+    w2 = splitWords(s2)
+
+    ret = []
+
+    def add(tag, words):
+        s = "".join(words)
+
+        if not s:
+            return
+
+        if ret and (ret[-1][0] == tag):
+            ret[-1] = (tag, ret[-1][1] + s)
+        else:
+            ret.append((tag, s))
+
+    for tag, i1, i2, j1, j2 in getOpcodes(w1, w2):
+        if tag == EQUAL:
+            add(EQUAL, w1[i1:i2])
+        else:
+            add(DELETE, w1[i1:i2])
+            add(INSERT, w2[j1:j2])
+
+    return ret
+
+# return how similar the texts whose word diff is 'words' are, from 0.0
+# (nothing in common) to 1.0 (identical).
+def getSimilarity(words):
+    same = 0
+    total = 0
+
+    for tag, s in words:
+        if tag == EQUAL:
+            same += 2 * len(s)
+            total += 2 * len(s)
+        else:
+            total += len(s)
+
+    return float(same) / max(1, total)
+
+# compare two screenplays, and return a list of Changes needed to turn
+# sp1 into sp2, in the order they occur in sp2. the list is empty if the
+# scripts are identical.
+def compare(sp1, sp2):
+    els1 = sp1.getElementsAsList()
+    els2 = sp2.getElementsAsList()
+
+    changes = []
+
+    for tag, i1, i2, j1, j2 in getOpcodes(els1, els2):
+        if tag == EQUAL:
+            continue
+
+        old = els1[i1:i2]
+        new = els2[j1:j2]
+
+        # within a replaced block, elements of the same type that line up
+        # are treated as the same element having been changed
+        for tag2, k1, k2, l1, l2 in getOpcodes([lt for lt, s in old],
+                                               [lt for lt, s in new]):
+            if tag2 == EQUAL:
+                for k, l in zip(xrange(k1, k2), xrange(l1, l2)):
+                    lt, s1 = old[k]
+                    s2 = new[l][1]
+
+                    if s1 == s2:
+                        continue
+
+                    words = diffWords(s1, s2)
+
+                    if getSimilarity(words) >= MIN_SIMILARITY:
+                        ch = Change(CHANGED, lt, i1 + k, j1 + l, s1, s2)
+                        ch.words = words
+                        changes.append(ch)
+                    else:
+                        changes.append(
+                            Change(DELETED, lt, i1 + k, j1 + l, s1, None))
+                        changes.append(
+                            Change(ADDED, lt, None, j1 + l, None, s2))
+            else:
+                for k in xrange(k1, k2):
+                    lt, s = old[k]
+                    changes.append(
+                        Change(DELETED, lt, i1 + k, j1 + l1, s, None))
+
+                for l in xrange(l1, l2):
+                    lt, s = new[l]
+                    changes.append(
+                        Change(ADDED, lt, None, j1 + l, None, s))
+
+    # find out which scene of sp2 each change is in
+    scene = 0
+    sceneName = ""
+    el = 0
+
+    for ch in changes:
+        # a deleted element's scene is the one its predecessor is in
+        if ch.kind == DELETED:
+            end = ch.newIndex
+        else:
+            end = ch.newIndex + 1
+
+        while el < end:
+            lt, s = els2[el]
+
+            if lt == screenplay.SCENE:
+                scene += 1
+                sceneName = s
+
+            el += 1
+
+        ch.scene = scene
+        ch.sceneName = sceneName
+
+    return changes
+
+# return list of (start, end) offsets of the lines text s is split into
+# when wrapped to 'width' characters. forced line breaks ("\n") are
+# honored.
+def wrapOffsets(s, width):
+    ret = []
+    start = 0
+
+    for para in s.split("\n"):
+        end = start + len(para)
+
+        while (end - start) > width:
+            i = s.rfind(" ", start, start + width + 1)
+
+            if i > start:
+                ret.append((start, i))
+                start = i + 1
+            else:
+                ret.append((start, start + width))
+                start += width
+
+        ret.append((start, end))
+        start = end + 1
+
+    return ret
+
+# report line types
+LINE_TEXT, LINE_SEPARATOR = range(2)
+
+# one line of the report
+class ReportLine:
+    def __init__(self, typ, text = "", indent = 0, color = None,
+                 flags = pml.NORMAL):
+        self.typ = typ
+        self.text = text
+        self.indent = indent
+
+        # background color, or None
+        self.color = color
+
+        self.flags = flags
+
+        # list of (startColumn, endColumn, color) to highlight
+        self.highlights = []
+
+# return list of ReportLines showing one side of a change. segments is a
+# list of (tag, text); text in segments tagged 'hlTag' is highlighted with
+# 'hlColor'.
+def getChangeLines(tcfg, segments, color, hlTag, hlColor):
+    s = "".join([text for tag, text in segments])
+
+    # per-character highlight flags
+    hl = []
+
+    for tag, text in segments:
+        hl.extend([tag == hlTag] * len(text))
+
+    ret = []
+
+    for start, end in wrapOffsets(s, tcfg.width):
+        rl = ReportLine(LINE_TEXT, s[start:end], tcfg.indent, color)
+
+        i = start
+
+        while i < end:
+            if hl[i]:
+                j = i
+
+                while (j < end) and hl[j]:
+                    j += 1
+
+                rl.highlights.append((i - start, j - start, hlColor))
+
+                i = j
+            else:
+                i += 1
+
+        ret.append(rl)
+
+    return ret
+
+# return list of ReportLines for report of 'changes'.
+def getReportLines(changes, cfg):
+    ret = [ReportLine(LINE_TEXT, "Color information:"),
+           ReportLine(LINE_TEXT),
+           ReportLine(LINE_TEXT, "Deleted text", color = COLOR_DELETED),
+           ReportLine(LINE_TEXT, "Added text", color = COLOR_ADDED),
+           ReportLine(LINE_TEXT, "Changed words in modified elements")]
+
+    ret[-1].highlights.append((0, 7, COLOR_DELETED_WORD))
+    ret[-1].highlights.append((8, 13, COLOR_ADDED_WORD))
+
+    scene = None
+
+    for ch in changes:
+        if ch.scene != scene:
+            scene = ch.scene
+
+            ret.append(ReportLine(LINE_TEXT))
+            ret.append(ReportLine(LINE_SEPARATOR))
+            ret.append(ReportLine(LINE_TEXT))
+
+            if scene == 0:
+                s = "Before the first scene"
+            else:
+                s = "Scene %d: %s" % (scene, ch.sceneName.replace("\n", " "))
+
+            ret.append(ReportLine(LINE_TEXT, s, flags = pml.BOLD))
+
+        ret.append(ReportLine(LINE_TEXT))
+
+        tcfg = cfg.getType(ch.lt)
+
+        if ch.kind == CHANGED:
+            old = [(tag, s) for tag, s in ch.words if tag != INSERT]
+            new = [(tag, s) for tag, s in ch.words if tag != DELETE]
+        else:
+            old = [(EQUAL, ch.oldText or "")]
+            new = [(EQUAL, ch.newText or "")]
+
+        if ch.kind != ADDED:
+            ret.extend(getChangeLines(tcfg, old, COLOR_DELETED, DELETE,
+                                      COLOR_DELETED_WORD))
+
+        if ch.kind != DELETED:
+            ret.extend(getChangeLines(tcfg, new, COLOR_ADDED, INSERT,
+                                      COLOR_ADDED_WORD))
+
+    return ret
+
+# generate a PDF report of 'changes', laid out using 'cfg', and return it
+# as a string.
+def generateReport(changes, cfg):
+    fs = cfg.fontSize
+    chX = util.getTextWidth(" ", pml.COURIER, fs)
+    chY = util.getTextHeight(fs)
+
+    doc = pml.Document(cfg.paperWidth, cfg.paperHeight)
+
+    # how many lines put on current page
+    y = 0
+
+    pg = pml.Page(doc)
+
+    # we need to gather text ops for each page into a separate list and
+    # add that list to the page only after all other ops are added,
+    # otherwise the colored bars will be drawn partially over some
+    # characters.
+    textOps = []
+
+    for rl in getReportLines(changes, cfg):
+        if y >= cfg.linesOnPage:
+            pg.ops.extend(textOps)
+            doc.add(pg)
+
+            pg = pml.Page(doc)
+
+            textOps = []
+            y = 0
+
+        ly = cfg.marginTop + y * chY
+        lx = cfg.marginLeft + rl.indent * chX
+
+        if rl.typ == LINE_SEPARATOR:
+            pg.add(pml.PDFOp("0.75 g"))
+            w = 50.0
+            pg.add(pml.RectOp(doc.w / 2.0 - w / 2.0, ly + chY / 4, w,
+                              chY / 2.0))
+            pg.add(pml.PDFOp("0.0 g"))
+
+        else:
+            if rl.color:
+                pg.add(pml.PDFOp("%s rg" % rl.color))
+                pg.add(pml.RectOp(cfg.marginLeft, ly,
+                    doc.w - cfg.marginLeft - 5.0, chY))
+
+            for c1, c2, color in rl.highlights:
+                pg.add(pml.PDFOp("%s rg" % color))
+                pg.add(pml.RectOp(lx + c1 * chX, ly, (c2 - c1) * chX, chY))
+
+            if rl.color or rl.highlights:
+                pg.add(pml.PDFOp("0.0 g"))
+
+            if rl.text:
+                textOps.append(pml.TextOp(rl.text, lx, ly, fs,
+                                          rl.flags | pml.COURIER))
+
+        y += 1
+
+    pg.ops.extend(textOps)
+    doc.add(pg)
+
+    return pdf.generate(doc)
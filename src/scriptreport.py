@@ -4,7 +4,6 @@ import gutil
 import pdf
 import pml
 import scenereport
-import screenplay
 import util
 
 def genScriptReport(mainFrame, sp):
@@ -23,15 +22,15 @@ class ScriptReport:
         tf = pml.TextFormatter(self.sp.cfg.paperWidth,
                                self.sp.cfg.paperHeight, 15.0, 12)
 
-        ls = self.sp.lines
+        stats = self.sp.getStats()
 
-        total = len(ls)
+        total = stats.getLineCount()
         tf.addText("Total lines in script: %5d" % total)
 
         tf.addSpace(2.0)
 
         for t in config.getTIs():
-            cnt = sum([1 for line in ls if line.lt == t.lt])
+            cnt = stats.typeCounts.get(t.lt, 0)
             tf.addText("        %13s:  %4d (%d%%)" % (t.name, cnt,
                                                       util.pct(cnt, total)))
 
@@ -52,28 +51,7 @@ class ScriptReport:
             self.sr.longestScene, self.sr.avgScene))
 
         # lengths of action elements
-        actions = []
-
-        # length of current action element
-        curLen = 0
-
-        for ln in ls:
-            if curLen > 0:
-                if ln.lt == screenplay.ACTION:
-                    curLen += 1
-
-                    if ln.lb == screenplay.LB_LAST:
-                        actions.append(curLen)
-                        curLen = 0
-                else:
-                    actions.append(curLen)
-                    curLen = 0
-            else:
-                if ln.lt == screenplay.ACTION:
-                    curLen = 1
-
-        if curLen > 0:
-            actions.append(curLen)
+        actions = stats.actionLengths
 
         tf.addSpace(4.0)
 
@@ -0,0 +1,259 @@
+# statistics about a script's contents, gathered in a single pass over
+# its lines. all the reports are built from these. Screenplay.getStats
+# caches them until the script is next modified or repaginated, so
+# generating several reports in a row only goes through the script once.
+
+import screenplay
+import util
+
+import array
+
+class ScriptStats:
+    def __init__(self, sp):
+        # what the stats were gathered from, see isCurrent
+        self.lines = sp.lines
+        self.editCount = sp.editCount
+        self.pages = sp.pages[:]
+
+        # page numbers as returned by Screenplay.getPageNumbers, and their
+        # indexes in that, shared by all the PageLists created from these
+        self.pageNumbers = sp.getPageNumbers()
+        self.pageIndexes = dict([(p, i) for i, p in
+                                 enumerate(self.pageNumbers)])
+
+        # information for each line: type, page number, index of scene in
+        # self.scenes, index of speaker in self.speakers (for dialogue and
+        # parenthetical lines of speeches, -1 for other lines), and number
+        # of words and characters in those words
+        self.lineTypes = array.array("b")
+        self.linePages = array.array("i")
+        self.lineScenes = array.array("i")
+        self.lineSpeakers = array.array("i")
+        self.lineWords = array.array("i")
+        self.lineWordChars = array.array("i")
+
+        # key = line type, value = number of lines of that type
+        self.typeCounts = {}
+
+        # lengths of action elements, in lines
+        self.actionLengths = []
+
+        # SceneStats for each scene. a new scene starts at each scene and
+        # act break element, and any lines before the first of those are a
+        # scene of their own.
+        self.scenes = []
+
+        # SpeakerStats for each character speaking, in order of first
+        # appearance
+        self.speakers = []
+
+        self.scan()
+
+    # return True if these are still valid for sp.
+    def isCurrent(self, sp):
+        return (sp.lines is self.lines) and \
+               (sp.editCount == self.editCount) and (sp.pages == self.pages)
+
+    def scan(self):
+        ls = self.lines
+        pages = self.pages
+        lastPage = len(pages) - 1
+
+        lineTypes = self.lineTypes
+        linePages = self.linePages
+        lineScenes = self.lineScenes
+        lineSpeakers = self.lineSpeakers
+        lineWords = self.lineWords
+        lineWordChars = self.lineWordChars
+        typeCounts = self.typeCounts
+
+        # key = speaker name, value = index in self.speakers
+        speakerIndexes = {}
+
+        page = 1
+        scene = None
+        inHeading = False
+        speaker = -1
+        si = None
+        isSpeechStart = False
+        actionLen = 0
+        prevLb = screenplay.LB_LAST
+
+        i = 0
+
+        for ln in ls:
+            lt = ln.lt
+            lb = ln.lb
+
+            while (page < lastPage) and (i > pages[page]):
+                page += 1
+
+            isElemStart = prevLb == screenplay.LB_LAST
+
+            if (scene is None) or (isElemStart and
+                    lt in (screenplay.SCENE, screenplay.ACTBREAK)):
+                scene = SceneStats(self, i, page, scene)
+                self.scenes.append(scene)
+                inHeading = True
+
+            if inHeading and (lt != screenplay.SCENE):
+                inHeading = False
+
+            if not inHeading:
+                scene.addLine(lt, page)
+
+            if (lt == screenplay.CHARACTER) and (lb == screenplay.LB_LAST):
+                name = util.upper(ln.text)
+                speaker = speakerIndexes.get(name, -1)
+
+                if speaker == -1:
+                    speaker = len(self.speakers)
+                    speakerIndexes[name] = speaker
+                    self.speakers.append(SpeakerStats(self, name))
+
+                si = self.speakers[speaker]
+                isSpeechStart = True
+
+            elif lt not in (screenplay.DIALOGUE, screenplay.PAREN):
+                speaker = -1
+
+            words = util.splitToWords(ln.text)
+            wordCnt = len(words)
+            wordCharCnt = sum([len(w) for w in words])
+
+            if (speaker != -1) and (lt != screenplay.CHARACTER):
+                si.addLine(lt, page, scene, isSpeechStart, wordCnt,
+                           wordCharCnt)
+                isSpeechStart = False
+
+                lineSpeakers.append(speaker)
+            else:
+                lineSpeakers.append(-1)
+
+            if lt == screenplay.ACTION:
+                actionLen += 1
+
+                if lb == screenplay.LB_LAST:
+                    self.actionLengths.append(actionLen)
+                    actionLen = 0
+
+            elif actionLen:
+                self.actionLengths.append(actionLen)
+                actionLen = 0
+
+            lineTypes.append(lt)
+            linePages.append(page)
+            lineScenes.append(len(self.scenes) - 1)
+            lineWords.append(wordCnt)
+            lineWordChars.append(wordCharCnt)
+            typeCounts[lt] = typeCounts.get(lt, 0) + 1
+
+            prevLb = lb
+            i += 1
+
+        if actionLen:
+            self.actionLengths.append(actionLen)
+
+    # return number of lines in the script.
+    def getLineCount(self):
+        return len(self.lineTypes)
+
+    # return a new, empty PageList.
+    def newPageList(self):
+        return screenplay.PageList(self.pageNumbers, self.pageIndexes)
+
+# statistics about one scene
+class SceneStats:
+    # the scene starts at line 'start', on page 'page', of the script
+    # that 'stats' are being gathered for. 'prev' is the SceneStats of the
+    # previous scene, or None.
+    def __init__(self, stats, start, page, prev):
+        ls = stats.lines
+
+        self.start = start
+
+        # scene number, as returned by Screenplay.getSceneNumber
+        self.number = prev.number if prev else 0
+
+        # scene name, e.g. "INT. MOTEL ROOM - NIGHT"
+        # TODO: handle multi-line scene names
+        if ls[start].lt == screenplay.SCENE:
+            self.number += 1
+
+            s = util.upper(ls[start].text)
+
+            if len(s.strip()) == 0:
+                self.name = "(EMPTY SCENE NAME)"
+            else:
+                self.name = s
+        else:
+            self.name = "(NO SCENE NAME)"
+
+        # total lines, excluding the scene headings
+        self.lines = 0
+
+        # action lines
+        self.actionLines = 0
+
+        # page numbers
+        self.pages = stats.newPageList()
+        self.pages.addPage(page)
+
+        # last page added to self.pages
+        self.lastPage = page
+
+        # key = character name (upper cased), value = number of dialogue
+        # lines
+        self.chars = {}
+
+    def addLine(self, lt, page):
+        self.lines += 1
+
+        if lt == screenplay.ACTION:
+            self.actionLines += 1
+
+        if page != self.lastPage:
+            self.pages.addPage(page)
+            self.lastPage = page
+
+# statistics about one speaking character
+class SpeakerStats:
+    def __init__(self, stats, name):
+        # upper-cased name
+        self.name = name
+
+        # number of speeches, dialogue lines, words in those lines and
+        # characters in those words
+        self.speechCnt = 0
+        self.lineCnt = 0
+        self.wordCnt = 0
+        self.wordCharCnt = 0
+
+        # key = scene name, value = number of dialogue and parenthetical
+        # lines in those scenes
+        self.scenes = {}
+
+        # pages with dialogue or parentheticals
+        self.pages = stats.newPageList()
+
+        # last page added to self.pages
+        self.lastPage = None
+
+    def addLine(self, lt, page, scene, isSpeechStart, wordCnt,
+                wordCharCnt):
+        if isSpeechStart:
+            self.speechCnt += 1
+
+        self.scenes[scene.name] = self.scenes.get(scene.name, 0) + 1
+
+        if lt == screenplay.DIALOGUE:
+            self.lineCnt += 1
+            self.wordCnt += wordCnt
+            self.wordCharCnt += wordCharCnt
+
+            name = self.name or "(EMPTY CHARACTER NAME)"
+            scene.chars[name] = scene.chars.get(name, 0) + 1
+
+        if page != self.lastPage:
+            self.pages.addPage(page)
+            self.lastPage = page
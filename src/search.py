@@ -0,0 +1,314 @@
+# finding and replacing text in a script. searches are done with compiled
+# regular expressions over whole paragraphs, so matches can span the
+# lines a paragraph is wrapped into. Replace All does every replacement in
+# one pass over the script, rewrapping each affected paragraph once and
+# storing a single undo object for the lot.
+#
+# a match is a (line, start, end) tuple, where line is the first line of
+# the paragraph the match is in, and start / end are the match's offsets
+# in the paragraph's text as returned by getParaText.
+
+from error import *
+import config
+import screenplay
+import undo
+import util
+
+import re
+import sys
+
+# return (text, lastLine) of the paragraph starting at 'line', the
+# lines' texts being joined the same way rewrapPara does it.
+def getParaText(sp, line):
+    ls = sp.lines
+
+    ln = ls[line]
+    tmp = [ln.text]
+
+    while ln.lb not in (screenplay.LB_LAST, screenplay.LB_FORCED):
+        tmp.append(config.lb2str(ln.lb))
+
+        line += 1
+        ln = ls[line]
+        tmp.append(ln.text)
+
+    return ("".join(tmp), line)
+
+# return offset of position (line, col) in the text of the paragraph
+# starting at line 'first'.
+def pos2offset(sp, first, line, col):
+    ls = sp.lines
+    offset = col
+
+    for i in xrange(first, line):
+        offset += len(ls[i].text) + len(config.lb2str(ls[i].lb))
+
+    return offset
+
+# return (line, col) of 'offset' in the text of the paragraph starting at
+# line 'first'.
+def offset2pos(sp, first, offset):
+    ls = sp.lines
+    line = first
+
+    while (offset > len(ls[line].text)) and \
+              (ls[line].lb not in (screenplay.LB_LAST, screenplay.LB_FORCED)):
+        offset -= len(ls[line].text) + len(config.lb2str(ls[line].lb))
+        line += 1
+
+    return (line, min(offset, len(ls[line].text)))
+
+def toUnicode(s):
+    return unicode(s, "ISO-8859-1")
+
+class Search:
+    # 'text' is the text to search for, or a regular expression if isRegex
+    # is True. if matchWhole is True, matches must start and end at word
+    # boundaries (see util.isWordBoundary). 'elements' is None to search
+    # in all elements, or a collection of the element types to search
+    # in. raises MiscError if 'text' is not a valid regular expression.
+    def __init__(self, text, matchCase = False, matchWhole = False,
+                 isRegex = False, elements = None):
+        self.isRegex = isRegex
+        self.elements = elements
+
+        if isRegex:
+            pattern = text
+        else:
+            pattern = re.escape(text)
+
+        if matchWhole:
+            # word characters are letters, digits and "'"
+            pattern = r"(?<![^\W_])(?<!')(?:%s)(?![^\W_]|')" % pattern
+
+        flags = re.UNICODE
+
+        if not matchCase:
+            flags |= re.IGNORECASE
+
+        try:
+            self.regex = re.compile(toUnicode(pattern), flags)
+        except re.error, e:
+            raise MiscError("Invalid regular expression: %s." % e)
+
+    # return True if elements of type 'lt' are searched in.
+    def isIncluded(self, lt):
+        return (self.elements is None) or (lt in self.elements)
+
+    # return iterator over the non-empty matches in unicode string 'us'
+    # starting at offsets 'pos' or later, in order. matches can overlap.
+    def iterMatches(self, us, pos = 0):
+        while pos <= len(us):
+            m = self.regex.search(us, pos)
+
+            if not m:
+                break
+
+            if m.end() > m.start():
+                yield m
+
+            pos = m.start() + 1
+
+    # return the first match starting at position (line, col) or after it
+    # if 'forward' is True, or the last one starting at it or before it
+    # otherwise. returns None if there's no such match before the end
+    # (start) of the script.
+    def find(self, sp, line, col, forward = True):
+        first = sp.getParaFirstIndexFromLine(line)
+
+        return self.findFrom(sp, first, pos2offset(sp, first, line, col),
+                             forward)
+
+    # like find, but starts at 'offset' in the text of the paragraph
+    # starting at line 'first'. the offset can be outside the text, in
+    # which case the search starts at the next (previous) paragraph.
+    def findFrom(self, sp, first, offset, forward = True):
+        ls = sp.lines
+
+        while True:
+            s, last = getParaText(sp, first)
+
+            if self.isIncluded(ls[first].lt):
+                res = None
+
+                if forward:
+                    for m in self.iterMatches(toUnicode(s), offset):
+                        res = m
+
+                        break
+                else:
+                    for m in self.iterMatches(toUnicode(s)):
+                        if m.start() > offset:
+                            break
+
+                        res = m
+
+                if res:
+                    return (first, res.start(), res.end())
+
+            if forward:
+                if (last + 1) >= len(ls):
+                    return None
+
+                first = last + 1
+                offset = 0
+            else:
+                if first == 0:
+                    return None
+
+                first = sp.getParaFirstIndexFromLine(first - 1)
+                offset = sys.maxint
+
+    # return a list of all non-overlapping matches in the script.
+    def findAll(self, sp):
+        ls = sp.lines
+        ret = []
+
+        line = 0
+        while line < len(ls):
+            s, last = getParaText(sp, line)
+
+            if self.isIncluded(ls[line].lt):
+                for m in self.regex.finditer(toUnicode(s)):
+                    if m.end() > m.start():
+                        ret.append((line, m.start(), m.end()))
+
+            line = last + 1
+
+        return ret
+
+    # return the replacement (unicode) for match 'm' of our regex. 'repl' is
+    # the replacement text (unicode), which for regular expression
+    # searches can refer to groups of the match. raises MiscError if it
+    # refers to groups that don't exist.
+    def getReplacement(self, m, repl):
+        if not self.isRegex:
+            return repl
+
+        try:
+            return m.expand(repl)
+        except (re.error, IndexError), e:
+            raise MiscError("Invalid replacement text: %s." % e)
+
+    # replace 'match' with 'repl', storing an undo object for it. returns
+    # the offset of the end of the replacement in the paragraph, or None
+    # if the match is no longer there.
+    def replace(self, sp, match, repl):
+        first, start, end = match
+
+        s, last = getParaText(sp, first)
+        us = toUnicode(s)
+
+        m = self.regex.match(us, start)
+
+        if not m or (m.end() != end) or \
+               not self.isIncluded(sp.lines[first].lt):
+            return None
+
+        rs = self.getReplacement(m, toUnicode(repl))
+        text = util.toInputStr((us[:start] + rs + us[end:]).encode(
+            "ISO-8859-1"))
+
+        u = undo.SinglePara(sp, undo.CMD_MISC, first)
+
+        self.setPara(sp, first, last, text)
+
+        sp.line, sp.column = offset2pos(sp, first, start + len(rs))
+        sp.clearMark()
+        sp.markChanged()
+
+        u.setAfter(sp)
+        sp.addUndo(u)
+
+        return start + len(rs)
+
+    # replace all matches in the script with 'repl', storing a single undo
+    # object for them, and return how many were replaced. the cursor is
+    # moved to the end of the last replacement.
+    def replaceAll(self, sp, repl):
+        ls = sp.lines
+        repl = toUnicode(repl)
+
+        # list of (firstLine, lastLine, newText) for paragraphs to change
+        paras = []
+
+        count = 0
+
+        # figure out all the new texts first, so that nothing gets
+        # modified if the replacement text is invalid
+        line = 0
+        while line < len(ls):
+            s, last = getParaText(sp, line)
+
+            if self.isIncluded(ls[line].lt):
+                us = toUnicode(s)
+
+                # pieces of the new text, and its length so far
+                tmp = []
+                newLen = 0
+
+                pos = 0
+
+                for m in self.regex.finditer(us):
+                    if m.end() == m.start():
+                        continue
+
+                    rs = self.getReplacement(m, repl)
+
+                    tmp.append(us[pos:m.start()])
+                    tmp.append(rs)
+                    newLen += m.start() - pos + len(rs)
+
+                    pos = m.end()
+                    count += 1
+
+                if tmp:
+                    tmp.append(us[pos:])
+                    paras.append((line, last, util.toInputStr(
+                        "".join(tmp).encode("ISO-8859-1"))))
+
+                    # end of the last replacement in its paragraph
+                    lastEnd = newLen
+
+            line = last + 1
+
+        if not paras:
+            return 0
+
+        start = paras[0][0]
+        end = paras[-1][1]
+
+        u = undo.AnyDifference(sp, start, end)
+
+        newLines = []
+        prev = start
+
+        for first, last, text in paras:
+            newLines.extend(ls[prev:first])
+
+            lastFirst = start + len(newLines)
+            newLines.extend(sp.wrapLine(
+                screenplay.Line(ls[last].lb, ls[first].lt, text)))
+
+            prev = last + 1
+
+        ls[start:end + 1] = newLines
+        sp.markLinesChanged(start, start + len(newLines) - 1)
+
+        sp.line, sp.column = offset2pos(sp, lastFirst, lastEnd)
+        sp.clearMark()
+        sp.markChanged()
+
+        u.setAfter(sp)
+        sp.addUndo(u)
+
+        return count
+
+    # replace the text of the paragraph spanning lines first - last with
+    # 'text', rewrapping it.
+    def setPara(self, sp, first, last, text):
+        ls = sp.lines
+
+        lines = sp.wrapLine(screenplay.Line(ls[last].lb, ls[first].lt, text))
+        ls[first:last + 1] = lines
+        sp.markLinesChanged(first, first + len(lines) - 1)
@@ -1,50 +1,291 @@
+from error import *
+import misc
 import mypickle
 import util
 
+import bisect
+import mmap
+import re
+import struct
+
 import wx
 
-# PY2.4: use a Set object
-# dict of words loaded from dict_en.dat. key = word, value = None.
+# words of the global dictionary, a WordTable once loadDict has been
+# called. all that is needed of this is "word in gdict" and len(gdict).
 gdict = {}
 
-# PY2.4: use a Set object
-# key = util.getWordPrefix(word), value = dict of words beginning with
-# that prefix (only words in gdict)
-prefixDict = {}
+# SuggestionIndex of the words in gdict
+gindex = None
 
 # load word dictionary. returns True on success or if it's already loaded,
 # False on errors.
 def loadDict(frame):
+    global gdict, gindex
+
     if gdict:
         return True
 
-    s = util.loadMaybeCompressedFile(u"dict_en.dat", frame)
-    if not s:
-        return False
+    # the precompiled version is normally there, but fall back on the
+    # word list it's generated from (see tools/add_words.py)
+    try:
+        gdict = WordTable.load(u"dict_en.bin")
+    except (EnvironmentError, ValueError, MiscError):
+        s = util.loadMaybeCompressedFile(u"dict_en.dat", frame)
+        if not s:
+            return False
+
+        # theoretically, we should do util.lower(util.toInputStr(it)) for
+        # each word, but users aren't supposed to modify the file
+        gdict = WordTable(WordTable.generate(s.splitlines()))
 
-    lines = s.splitlines()
+    gindex = SuggestionIndex(gdict, True)
 
-    chars = "abcdefghijklmnopqrstuvwxyz"
+    return True
 
-    for ch1 in chars:
-        for ch2 in chars:
-            prefixDict[ch1 + ch2] = {}
+# a sorted table of words in a binary format that can be used directly
+# from a memory-mapped file, so loading it takes no time, and only the
+# parts that are actually looked at are ever read into memory. the
+# format is:
+#
+# -MAGIC
+# -nr of words (n), as a little-endian 32-bit unsigned integer
+# -(n + 1) offsets of the words in the text that follows, in the same
+#  format. word i is text[offset[i]:offset[i + 1]].
+# -text: the words, in sorted order, concatenated together
+#
+# supports len(), indexing by word number and "word in table".
+class WordTable:
+    MAGIC = "TRELBYW1"
+
+    # max nr of lookup results to remember
+    MAX_CACHED = 20000
+
+    # data is the table contents as a string or mmap. raises MiscError if
+    # it's not valid.
+    def __init__(self, data):
+        hdrLen = len(self.MAGIC) + 4
+
+        if (len(data) < hdrLen) or (data[:len(self.MAGIC)] != self.MAGIC):
+            raise MiscError("Invalid word table.")
+
+        self.data = data
+
+        # nr of words
+        self.count = struct.unpack_from("<I", data, len(self.MAGIC))[0]
+
+        # positions of the offsets and the text
+        self.offsetsPos = hdrLen
+        self.textPos = hdrLen + (self.count + 1) * 4
+
+        if (self.textPos > len(data)) or \
+               ((self.textPos + self.getOffset(self.count)) != len(data)):
+            raise MiscError("Invalid word table.")
+
+        # results of recent lookups. key = word, value = bool. scripts
+        # contain the same words over and over, and a binary search in
+        # Python costs about as much as 20 dict lookups.
+        self.cache = {}
+
+    # return WordTable loaded from given file. raises EnvironmentError if
+    # the file can't be read, ValueError if it's empty, or MiscError if
+    # it's not a valid word table.
+    @staticmethod
+    def load(filename):
+        f = open(misc.toPath(filename), "rb")
+
+        try:
+            data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        return WordTable(data)
+
+    # return words (any iterable) as a word table, as a string. duplicates
+    # are removed.
+    @staticmethod
+    def generate(words):
+        words = sorted(set(words))
+
+        offsets = [0]
 
-    gwp = util.getWordPrefix
+        for w in words:
+            offsets.append(offsets[-1] + len(w))
+
+        return "".join([WordTable.MAGIC, struct.pack("<I", len(words)),
+                        struct.pack("<%dI" % len(offsets), *offsets)] +
+                       words)
+
+    def __len__(self):
+        return self.count
+
+    # return offset of word i in the text.
+    def getOffset(self, i):
+        return struct.unpack_from("<I", self.data, self.offsetsPos + i * 4)[0]
+
+    # return word i.
+    def __getitem__(self, i):
+        if (i < 0) or (i >= self.count):
+            raise IndexError("word table index out of range")
+
+        start, end = struct.unpack_from("<2I", self.data,
+                                        self.offsetsPos + i * 4)
+
+        return self.data[self.textPos + start:self.textPos + end]
+
+    def __contains__(self, word):
+        ret = self.cache.get(word)
+
+        if ret is None:
+            i = bisect.bisect_left(self, word)
+            ret = (i < self.count) and (self[i] == word)
+
+            if len(self.cache) >= self.MAX_CACHED:
+                self.cache = {}
+
+            self.cache[word] = ret
+
+        return ret
+
+# return up to 'count' words closest to 'word' (lowercased) in Levenshtein
+# distance, but at most 'maxDist' edits away, from the global dictionary
+# (if loaded) and the Dicts in list 'dicts'. returns a list of (distance,
+# word) tuples, closest first.
+def getSuggestions(word, dicts, count = 5, maxDist = 3):
+    indexes = [d.index for d in dicts]
+
+    if gindex:
+        indexes.append(gindex)
+
+    # search with increasing distances until we have enough words. each
+    # step is several times slower than the previous one (a few ms for
+    # distance 1, tens of ms for 2, hundreds for 3), so distances above 2
+    # are only searched if nothing at all was found before them.
+    for dist in xrange(maxDist + 1):
+        # key = word, value = distance
+        found = {}
+
+        for index in indexes:
+            for d, w in index.find(word, dist):
+                found[w] = d
+
+        if (len(found) >= count) or (found and (dist >= 2)):
+            break
+
+    # prefer words that start the same way and are of similar length
+    tmp = [(d, w[:1] != word[:1], abs(len(w) - len(word)), w)
+           for w, d in found.iteritems()]
+    tmp.sort()
+
+    return [(t[0], t[3]) for t in tmp[:count]]
+
+# an index for finding the words closest to a given word. the words are
+# kept in a sorted list, which is searched as if it were a trie: adjacent
+# words share prefixes, so the rows of the edit distance matrix computed
+# for a prefix are reused for all words having it, and once a prefix is
+# too far from the word, all words having it are skipped with a binary
+# search.
+class SuggestionIndex:
+    # if isSorted is True, 'words' is an already sorted sequence (e.g. a
+    # WordTable) that is used as is, and add can't be used.
+    def __init__(self, words = (), isSorted = False):
+        # sorted sequence of words
+        if isSorted:
+            self.words = words
+        else:
+            self.words = sorted(words)
+
+    # add word, if it isn't already in the index.
+    def add(self, word):
+        i = bisect.bisect_left(self.words, word)
 
-    for it in lines:
-        # theoretically, we should do util.lower(util.toInputStr(it)), but:
-        #
-        #  -user's aren't supposed to modify the file
-        #
-        #  -it takes 1.35 secs, compared to 0.56 secs if we don't, on an
-        #   1.33GHz Athlon
-        gdict[it] = None
+        if (i == len(self.words)) or (self.words[i] != word):
+            self.words.insert(i, word)
 
-        if len(it) > 2:
-            prefixDict[gwp(it)][it] = None
+    # return a list of (distance, word) tuples for all words at most
+    # maxDist edits away from 'word', in alphabetical order.
+    def find(self, word, maxDist):
+        words = self.words
+        cnt = len(words)
+        n = len(word)
 
-    return True
+        # distances larger than maxDist are all stored as this
+        big = maxDist + 1
+
+        # rows[k] is the edit distance row for the first k characters of
+        # the word last looked at. only the cells at most maxDist away from
+        # the diagonal are computed; the rest can't be <= maxDist.
+        rows = [[min(j, big) for j in xrange(n + 1)]]
+
+        prev = ""
+        ret = []
+        i = 0
+
+        while i < cnt:
+            w = words[i]
+            wl = len(w)
+
+            # reuse the rows for the prefix shared with the previous word
+            k = 0
+            tmp = min(wl, len(prev), len(rows) - 1)
+
+            while (k < tmp) and (w[k] == prev[k]):
+                k += 1
+
+            del rows[k + 1:]
+            prev = w
+
+            while k < wl:
+                ch = w[k]
+                pr = rows[k]
+
+                row = [big] * (n + 1)
+
+                if k < maxDist:
+                    row[0] = k + 1
+
+                best = row[0]
+
+                for j in xrange(max(1, k + 1 - maxDist),
+                                min(n, k + 1 + maxDist) + 1):
+                    d = row[j - 1] + 1
+                    d2 = pr[j] + 1
+
+                    if d2 < d:
+                        d = d2
+
+                    d2 = pr[j - 1] + (word[j - 1] != ch)
+
+                    if d2 < d:
+                        d = d2
+
+                    if d > big:
+                        d = big
+
+                    row[j] = d
+
+                    if d < best:
+                        best = d
+
+                if best > maxDist:
+                    # no word starting with w[:k + 1] can be close enough
+                    if ch != "\xff":
+                        i = bisect.bisect_left(words,
+                            w[:k] + chr(ord(ch) + 1), i + 1)
+                    else:
+                        i += 1
+
+                    break
+
+                rows.append(row)
+                k += 1
+
+            else:
+                if rows[wl][n] <= maxDist:
+                    ret.append((rows[wl][n], w))
+
+                i += 1
+
+        return ret
 
 # dictionary, a list of known words that the user has specified.
 class Dict:
@@ -68,6 +309,9 @@ class Dict:
         # key = word, lowercased, value = None
         self.words = {}
 
+        # SuggestionIndex of words
+        self.index = SuggestionIndex()
+
     # load from string 's'. does not throw any exceptions and silently
     # ignores any errors.
     def load(self, s):
@@ -97,6 +341,7 @@ class Dict:
                 ww[w] = None
 
         self.words = ww
+        self.index = SuggestionIndex(ww.iterkeys())
 
     # returns True if word is known
     def isKnown(self, word):
@@ -108,10 +353,12 @@ class Dict:
 
         if word:
             self.words[word] = None
+            self.index.add(word)
 
     # set words from a list
     def set(self, words):
         self.words = {}
+        self.index = SuggestionIndex()
 
         for w in words:
             self.add(w)
@@ -133,6 +380,62 @@ class Dict:
 
         return word[0]
 
+# matches words, as defined by util.isWordBoundary
+_word_re = None
+
+# return list of (column, word) tuples for the words in 's' that are not
+# in the global dictionary and are not numbers.
+def findUnknownWords(s):
+    global _word_re
+
+    if not _word_re:
+        _word_re = re.compile("[%s]+" % "".join([re.escape(chr(i))
+            for i in xrange(256) if not util.isWordBoundary(chr(i))]))
+
+    ret = []
+
+    for m in _word_re.finditer(s):
+        word = m.group()
+
+        if not ((util.lower(word) in gdict) or word.isdigit()):
+            ret.append((m.start(), word))
+
+    return ret
+
+# cache of the findUnknownWords results for line texts, so that checking a
+# script again only has to look at the lines that have changed. words in
+# the user's dictionaries and character names aren't filtered out here,
+# since those change far more often than the global dictionary and only
+# a few words per line get that far anyway.
+class LineCache:
+
+    # max nr of line texts to keep
+    MAX_LINES = 50000
+
+    def __init__(self):
+        # key = line text, value = findUnknownWords result for it
+        self.lines = {}
+
+        # size of global dictionary when the results were computed
+        self.dictSize = 0
+
+    # return findUnknownWords(s), from the cache if possible.
+    def get(self, s):
+        if self.dictSize != len(gdict):
+            self.lines = {}
+            self.dictSize = len(gdict)
+
+        ret = self.lines.get(s)
+
+        if ret is None:
+            if len(self.lines) >= self.MAX_LINES:
+                self.lines = {}
+
+            ret = findUnknownWords(s)
+            self.lines[s] = ret
+
+        return ret
+
 # spell check a script
 class SpellChecker:
     def __init__(self, sp, gScDict):
@@ -168,31 +471,57 @@ class SpellChecker:
         self.line = 0
         self.col = 0
 
-        while 1:
-            word, line, col = self.sp.getWord(line, col)
+        ls = self.sp.lines
+
+        while line < len(ls):
+            for wcol, word in self.findInLine(line):
+                if wcol >= col:
+                    self.word = word
+                    self.line = line
+                    self.col = wcol
+
+                    return True
+
+            line += 1
+            col = 0
 
-            if not word:
-                return False
+        return False
+
+    # return list of (line, column, word) tuples for all possibly
+    # misspelled words in the script.
+    def findAll(self):
+        ret = []
 
-            if not self.isKnown(word):
-                self.word = word
-                self.line = line
-                self.col = col
+        for i in xrange(len(self.sp.lines)):
+            for col, word in self.findInLine(i):
+                ret.append((i, col, word))
 
-                return True
+        return ret
 
-            col += len(word)
+    # return list of (column, word) tuples for possibly misspelled words
+    # on the given line.
+    def findInLine(self, line):
+        return [(col, word) for col, word in
+                self.sp.spellCache.get(self.sp.lines[line].text)
+                if not self.isUserKnown(word)]
 
     # return True if word is a known word.
     def isKnown(self, word):
         word = util.lower(word)
 
         return word in gdict or \
-               word in self.cnames or \
-               self.sp.scDict.isKnown(word) or \
-               self.gScDict.isKnown(word) or \
+               self.isUserKnown(word) or \
                word.isdigit()
 
+    # return True if word is a character name or in the user's
+    # dictionaries.
+    def isUserKnown(self, word):
+        word = util.lower(word)
+
+        return word in self.cnames or \
+               self.sp.scDict.isKnown(word) or \
+               self.gScDict.isKnown(word)
+
 # Calculates the Levenshtein distance between a and b.
 def lev(a, b):
     n, m = len(a), len(b)
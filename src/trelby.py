@@ -12,6 +12,8 @@ import dialoguechart
 import finddlg
 import gutil
 import headersdlg
+import instrument
+import journal
 import locationreport
 import locationsdlg
 import misc
@@ -34,6 +36,7 @@ import watermarkdlg
 
 import copy
 import datetime
+import itertools
 import os
 import os.path
 import signal
@@ -213,6 +216,13 @@ class MyCtrl(wx.Control):
         wx.EVT_MOUSEWHEEL(self, self.OnMouseWheel)
         wx.EVT_CHAR(self, self.OnKeyChar)
 
+        self.sp = None
+
+        # (key, strings, dpages, extras, frame, rows) describing what is
+        # on screen, for the current state as given by getPaintKey; see
+        # describeScreen. None if not known.
+        self.paintState = None
+
         self.createEmptySp()
         self.updateScreen(redraw = False)
 
@@ -237,17 +247,36 @@ class MyCtrl(wx.Control):
         self.findDlgReplaceText = ""
         self.findDlgMatchWholeWord= False
         self.findDlgMatchCase = False
+        self.findDlgRegex = False
         self.findDlgDirUp = False
         self.findDlgUseExtra = False
         self.findDlgElements = None
 
     def createEmptySp(self):
+        self.closeJournal()
         self.clearVars()
         self.sp = screenplay.Screenplay(cfgGl)
         self.sp.titles.addDefaults()
         self.sp.headers.addDefaults()
         self.setFile(None)
         self.refreshCache()
+        self.startJournal()
+
+    # start journaling changes to the current script. if the journal can't
+    # be created, the script just can't be recovered after a crash.
+    def startJournal(self):
+        try:
+            self.sp.journal = journal.Journal(journal.getDir(), self.sp,
+                                              self.fileName)
+        except EnvironmentError:
+            self.sp.journal = None
+
+    # stop journaling changes to the current script and delete the
+    # journal.
+    def closeJournal(self):
+        if self.sp and self.sp.journal:
+            self.sp.journal.close()
+            self.sp.journal = None
 
     # update stuff that depends on configuration / view mode etc.
     def refreshCache(self):
@@ -267,12 +296,27 @@ class MyCtrl(wx.Control):
         return cfgGui
 
     def loadFile(self, fileName):
-        s = util.loadFile(fileName, mainFrame)
-        if s == None:
+        try:
+            f = open(misc.toPath(fileName), "rb")
+
+            try:
+                size = os.fstat(f.fileno()).st_size
+
+                (sp, msg) = self.runTask(util.BackgroundTask(
+                    lambda progress: screenplay.Screenplay.loadFile(
+                        f, cfgGl, progress, size)), "Loading")
+            finally:
+                f.close()
+
+        except IOError, (errno, strerror):
+            wx.MessageBox("Error loading file '%s': %s" % (
+                    fileName, strerror), "Error", wx.OK, mainFrame)
+
+            return
+
+        except CancelledError:
             return
 
-        try:
-            (sp, msg) = screenplay.Screenplay.load(s, cfgGl)
         except TrelbyError, e:
             wx.MessageBox("Error loading file:\n\n%s" % e, "Error",
                           wx.OK, mainFrame)
@@ -282,10 +326,17 @@ class MyCtrl(wx.Control):
         if msg:
             misc.showText(mainFrame, msg, "Warning")
 
+        self.useScript(sp, fileName)
+
+    # replace the current script with Screenplay 'sp', stored in
+    # 'fileName'.
+    def useScript(self, sp, fileName):
+        self.closeJournal()
         self.clearVars()
         self.sp = sp
         self.setFile(fileName)
         self.refreshCache()
+        self.startJournal()
 
         # saved cursor position might be anywhere, so we can't just
         # display the first page
@@ -300,6 +351,9 @@ class MyCtrl(wx.Control):
             self.sp.markChanged(False)
             gd.mru.add(fileName)
 
+            if self.sp.journal:
+                self.sp.journal.saved(self.sp, fileName)
+
             return True
         else:
             return False
@@ -324,10 +378,57 @@ class MyCtrl(wx.Control):
         self.createEmptySp()
 
         self.sp.lines = lines
-        self.sp.reformatAll()
-        self.sp.paginate()
+
+        if not self.runLayoutJob(screenplay.LayoutJob(self.sp, True),
+                                 "Importing"):
+            self.createEmptySp()
+
+            return
+
         self.sp.markChanged(True)
 
+    # run util.BackgroundTask 'task', showing a progress dialog with a
+    # cancel button if it takes more than a moment, and return its
+    # result. raises CancelledError if the user cancels it, or whatever
+    # the task itself raised.
+    def runTask(self, task, title):
+        task.start()
+
+        if not task.wait(0.3):
+            dlg = wx.ProgressDialog(title, "Please wait...", 100, mainFrame,
+                wx.PD_APP_MODAL | wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+
+            try:
+                while not task.wait(0.05):
+                    cont = dlg.Update(int(task.fraction * 100))
+
+                    # newer wxPythons return a (continue, skip) tuple
+                    if isinstance(cont, tuple):
+                        cont = cont[0]
+
+                    if not cont:
+                        task.cancel()
+            finally:
+                dlg.Destroy()
+
+        return task.getResult()
+
+    # run screenplay.LayoutJob 'job' in the background and apply its
+    # results. returns False if the user cancelled it.
+    def runLayoutJob(self, job, title):
+        try:
+            self.runTask(util.BackgroundTask(job.run), title)
+        except CancelledError:
+            return False
+
+        return job.apply()
+
+    # bring pagination up to date, in the background if it's slow.
+    # returns False if the user cancelled it.
+    def paginate(self):
+        return self.runLayoutJob(screenplay.LayoutJob(self.sp, False),
+                                 "Paginating")
+
     # generate exportable text from given screenplay, or None.
     def getExportText(self, sp):
         inf = []
@@ -441,13 +542,14 @@ class MyCtrl(wx.Control):
             return True
 
     def updateScreen(self, redraw = True, setCommon = True):
+        self.sp.syncJournal()
         self.adjustScrollBar()
 
         if setCommon:
             self.updateCommon()
 
         if redraw:
-            self.Refresh(False)
+            self.refreshChanged()
 
     # update GUI elements shared by all scripts, like statusbar etc
     def updateCommon(self):
@@ -476,7 +578,9 @@ class MyCtrl(wx.Control):
 
     # apply per-script config
     def applyCfg(self, newCfg):
-        self.sp.applyCfg(newCfg)
+        if not self.runLayoutJob(screenplay.LayoutJob(self.sp, True, newCfg),
+                                 "Reformatting"):
+            return
 
         self.refreshCache()
         self.makeLineVisible(self.sp.line)
@@ -544,7 +648,7 @@ class MyCtrl(wx.Control):
             sp = copy.deepcopy(self.sp)
             sp.removeElementTypes({screenplay.NOTE : None}, False)
 
-        sp.paginate()
+        sp.paginate(True)
 
         return sp
 
@@ -628,7 +732,7 @@ class MyCtrl(wx.Control):
         self.updateScreen()
 
     def OnPaginate(self):
-        self.sp.paginate()
+        self.sp.paginate(True)
         self.makeLineVisible(self.sp.line)
         self.updateScreen()
 
@@ -688,24 +792,24 @@ class MyCtrl(wx.Control):
         dlg.Destroy()
 
     def OnReportDialogueChart(self):
-        self.sp.paginate()
-        dialoguechart.genDialogueChart(mainFrame, self.sp)
+        if self.paginate():
+            dialoguechart.genDialogueChart(mainFrame, self.sp)
 
     def OnReportCharacter(self):
-        self.sp.paginate()
-        characterreport.genCharacterReport(mainFrame, self.sp)
+        if self.paginate():
+            characterreport.genCharacterReport(mainFrame, self.sp)
 
     def OnReportLocation(self):
-        self.sp.paginate()
-        locationreport.genLocationReport(mainFrame, self.sp)
+        if self.paginate():
+            locationreport.genLocationReport(mainFrame, self.sp)
 
     def OnReportScene(self):
-        self.sp.paginate()
-        scenereport.genSceneReport(mainFrame, self.sp)
+        if self.paginate():
+            scenereport.genSceneReport(mainFrame, self.sp)
 
     def OnReportScript(self):
-        self.sp.paginate()
-        scriptreport.genScriptReport(mainFrame, self.sp)
+        if self.paginate():
+            scriptreport.genScriptReport(mainFrame, self.sp)
 
     def OnCompareScripts(self):
         if mainFrame.tabCtrl.getPageCount() < 2:
@@ -801,17 +905,24 @@ class MyCtrl(wx.Control):
             self.updateScreen()
 
     def OnUndo(self):
-        self.sp.cmd("undo")
-        self.sp.paginate()
-        self.makeLineVisible(self.sp.line)
-        self.updateScreen()
+        self.undoOrRedo(self.sp.undoCmd)
 
     def OnRedo(self):
-        self.sp.cmd("redo")
-        self.sp.paginate()
+        self.undoOrRedo(self.sp.redoCmd)
+
+    # run func, which is either sp.undoCmd or sp.redoCmd.
+    def undoOrRedo(self, func):
+        cs = screenplay.CommandState()
+        func(cs)
+        self.sp.cmdPost(cs)
+
+        self.sp.paginate(True)
         self.makeLineVisible(self.sp.line)
         self.updateScreen()
 
+        if cs.errorMsg:
+            wx.MessageBox(cs.errorMsg, "Error", wx.OK, mainFrame)
+
     # returns True if something was deleted
     def OnCut(self, doUpdate = True, doDelete = True, copyToClip = True):
         marked = self.sp.getMarkedLines()
@@ -931,7 +1042,7 @@ class MyCtrl(wx.Control):
         self.updateScreen()
 
     def OnGotoScene(self):
-        self.sp.paginate()
+        self.sp.paginate(True)
         self.clearAutoComp()
 
         scenes = self.sp.getSceneLocations()
@@ -959,7 +1070,7 @@ class MyCtrl(wx.Control):
         self.updateScreen()
 
     def OnGotoPage(self):
-        self.sp.paginate()
+        self.sp.paginate(True)
         self.clearAutoComp()
 
         pages = self.sp.getPageNumbers()
@@ -1083,7 +1194,7 @@ class MyCtrl(wx.Control):
             return
 
         self.sp.removeElementTypes(tdict, True)
-        self.sp.paginate()
+        self.sp.paginate(True)
         self.makeLineVisible(self.sp.line)
         self.updateScreen()
 
@@ -1131,19 +1242,19 @@ class MyCtrl(wx.Control):
 
             choice = dlg.GetFilterIndex()
             if choice == 0:
-                data = sp.generatePDF(True)
+                data = lambda f: sp.generatePDFTo(f, True)
                 suffix = ".pdf"
             elif choice == 1:
                 data = sp.generateRTF()
                 suffix = ".rtf"
             elif choice == 2:
-                data = sp.generateFDX()
+                data = lambda f: sp.generateFDXTo(f)
                 suffix = ".fdx"
             elif choice == 3:
                 data = self.getExportHtml(sp)
                 suffix = ".html"
             elif choice == 4:
-                data = sp.generateFountain()
+                data = lambda f: sp.generateFountainTo(f)
                 suffix = ".fountain"
             else:
                 data = self.getExportText(sp)
@@ -1161,8 +1272,8 @@ class MyCtrl(wx.Control):
         if not sp:
             return
 
-        s = sp.generatePDF(False)
-        gutil.showTempPDF(s, cfgGl, mainFrame)
+        gutil.showTempPDF(lambda f: sp.generatePDFTo(f, False), cfgGl,
+                          mainFrame)
 
     def OnSettings(self):
         dlg = cfgdlg.CfgDlg(mainFrame, copy.deepcopy(cfgGl),
@@ -1390,7 +1501,7 @@ class MyCtrl(wx.Control):
             now = time.time()
 
             if (now - self.sp.lastPaginated) >= cfgGl.paginateInterval:
-                self.sp.paginate()
+                self.sp.paginate(True)
 
                 cs.needsVisifying = True
 
@@ -1399,22 +1510,170 @@ class MyCtrl(wx.Control):
 
         self.updateScreen()
 
-    def OnPaint(self, event):
-        #ldkjfldsj = util.TimerDev("paint")
+    # return a key that changes whenever anything OnPaint draws might
+    # change.
+    def getPaintKey(self):
+        sp = self.sp
+
+        if sp.mark:
+            mark = (sp.mark.line, sp.mark.column)
+        else:
+            mark = None
+
+        if sp.acItems:
+            ac = (tuple(sp.acItems), sp.acSel)
+        else:
+            ac = None
+
+        return (sp, sp.pages, sp.pagesNoAdjust, sp.editCount,
+                sp.getTopLine(), sp.line, sp.column, mark, ac,
+                tuple(self.GetClientSizeTuple()), gd.vm, cfgGui, sp.cfg,
+                self.pageW, self.chY, mainFrame.showFormatting, cfgGl.pbi,
+                cfgGl.useCustomElemColors)
+
+    # return a description of what OnPaint draws for screen contents
+    # (strings, dpages), as returned by ViewMode.getScreen. returns
+    # (frame, extras, rows), where frame describes everything not related
+    # to any single line, extras has for each TextString in strings
+    # either None or a tuple of (lt, note, markedColumns, formatting,
+    # pagebreakNoAdjust, pagebreak, cursorColumn) describing what is
+    # drawn for the script line besides its text, and rows is a dict
+    # mapping y coordinates to a list of everything drawn at that y.
+    def describeScreen(self, strings, dpages):
+        sp = self.sp
+        ls = sp.lines
+        marked = sp.getMarkedLines()
+
+        if dpages:
+            pageRects = tuple([(dp.x1, dp.y1, dp.x2, dp.y2)
+                               for dp in dpages])
+        else:
+            pageRects = None
+
+        if sp.acItems:
+            ac = (tuple(sp.acItems), sp.acSel, sp.line, sp.column)
+        else:
+            ac = None
+
+        frame = (tuple(self.GetClientSizeTuple()), pageRects, ac, gd.vm,
+                 cfgGui, sp.cfg, self.pageW, self.chY,
+                 mainFrame.showFormatting, cfgGl.pbi,
+                 cfgGl.useCustomElemColors)
+
+        # draft mode pagebreak indicators
+        pbNoAdjust = not dpages and (cfgGl.pbi == config.PBI_REAL_AND_UNADJ)
+        pbReal = not dpages and (cfgGl.pbi in (config.PBI_REAL,
+                                               config.PBI_REAL_AND_UNADJ))
+
+        # key = line, value = line2page(line). consecutive lines share
+        # their lookups through this.
+        pages = {}
+
+        def line2page(i):
+            pg = pages.get(i)
+
+            if pg is None:
+                pg = sp.line2page(i)
+                pages[i] = pg
+
+            return pg
 
-        ls = self.sp.lines
+        extras = []
+        rows = {}
 
+        for t in strings:
+            i = t.line
+            ex = None
+
+            if i != -1:
+                l = ls[i]
+
+                note = None
+                if l.lt == screenplay.NOTE:
+                    note = (sp.isFirstLineOfElem(i), sp.isLastLineOfElem(i))
+
+                markCols = None
+                if marked and sp.isLineMarked(i, marked):
+                    markCols = sp.getMarkedColumns(i, marked)
+
+                fmt = None
+                if mainFrame.showFormatting:
+                    fmt = (l.lb, sp.needsExtraParenIndent(i))
+
+                ex = (l.lt, note, markCols, fmt,
+                      pbNoAdjust and (sp.line2pageNoAdjust(i) !=
+                                      sp.line2pageNoAdjust(i + 1)),
+                      pbReal and (line2page(i) != line2page(i + 1)),
+                      sp.column if (i == sp.line) else None)
+
+            extras.append(ex)
+            rows.setdefault(t.y, []).append(
+                (t.x, t.text, t.fi, t.isUnderlined, ex))
+
+        return (frame, extras, rows)
+
+    # redraw the parts of the screen that have changed since it was last
+    # drawn.
+    def refreshChanged(self):
+        key = self.getPaintKey()
+        strings, dpages = gd.vm.getScreen(self, True, True)
+        frame, extras, rows = self.describeScreen(strings, dpages)
+
+        old = self.paintState
+        self.paintState = (key, strings, dpages, extras, frame, rows)
+
+        if not old or (old[4] != frame):
+            self.Refresh(False)
+
+            return
+
+        oldRows = old[5]
+        changed = [y for y in set(oldRows) | set(rows)
+                   if oldRows.get(y) != rows.get(y)]
+
+        if changed:
+            # note boxes extend one pixel above and below their lines
+            y1 = min(changed) - 1
+            y2 = max(changed) + gd.vm.getLineHeight(self) + 1
+
+            self.RefreshRect(wx.Rect(0, y1, self.GetClientSize().width,
+                                     y2 - y1 + 1), False)
+
+    @instrument.timed("MyCtrl.OnPaint")
+    def OnPaint(self, event):
         if misc.doDblBuf:
             dc = wx.BufferedPaintDC(self, self.screenBuf)
         else:
             dc = wx.PaintDC(self)
 
         size = self.GetClientSize()
-        marked = self.sp.getMarkedLines()
         lineh = gd.vm.getLineHeight(self)
         posX = -1
         cursorY = -1
 
+        # only the update region is shown on screen, so only the lines
+        # touching it need to be drawn
+        upd = self.GetUpdateRegion().GetBox()
+        dc.SetClippingRegion(upd.x, upd.y, upd.width, upd.height)
+
+        # use the screen refreshChanged prepared for this paint if
+        # nothing has changed since
+        key = self.getPaintKey()
+        st = self.paintState
+
+        if st and (st[0] == key):
+            strings, dpages, extras = st[1:4]
+        else:
+            strings, dpages = gd.vm.getScreen(self, True, True)
+            frame, extras, rows = self.describeScreen(strings, dpages)
+
+            # the screen now shows this only if all of it was drawn
+            if (upd.y <= 0) and ((upd.y + upd.height) >= size.height):
+                self.paintState = (key, strings, dpages, extras, frame,
+                                   rows)
+            else:
+                self.paintState = None
+
         # auto-comp FontInfo
         acFi = None
 
@@ -1426,8 +1685,6 @@ class MyCtrl(wx.Control):
         ulines = []
         ulinesHdr = []
 
-        strings, dpages = gd.vm.getScreen(self, True, True)
-
         dc.SetBrush(cfgGui.workspaceBrush)
         dc.SetPen(cfgGui.workspacePen)
         dc.DrawRectangle(0, 0, size.width, size.height)
@@ -1462,21 +1719,29 @@ class MyCtrl(wx.Control):
                 dc.DrawLine(dp.x1 + 1, dp.y2 + 1, dp.x2 + 1, dp.y2 + 1)
                 dc.DrawLine(dp.x2 + 1, dp.y1 + 1, dp.x2 + 1, dp.y2 + 2)
 
-        for t in strings:
-            i = t.line
+        updTop = upd.y - lineh - 1
+        updBottom = upd.y + upd.height + 1
+
+        for t, ex in itertools.izip(strings, extras):
             y = t.y
+
+            # the cursor line is needed for auto-completion, wherever it is
+            if ((y < updTop) or (y > updBottom)) and \
+                   (t.line != self.sp.line):
+                continue
+
             fi = t.fi
             fx = fi.fx
 
-            if i != -1:
-                l = ls[i]
+            if ex:
+                lt, note, markCols, fmt, pbNoAdjust, pbReal, cursorCol = ex
 
-                if l.lt == screenplay.NOTE:
+                if note:
                     dc.SetPen(cfgGui.notePen)
                     dc.SetBrush(cfgGui.noteBrush)
 
                     nx = t.x - 5
-                    nw = self.sp.cfg.getType(l.lt).width * fx + 10
+                    nw = self.sp.cfg.getType(lt).width * fx + 10
 
                     dc.DrawRectangle(nx, y, nw, lineh)
 
@@ -1484,15 +1749,15 @@ class MyCtrl(wx.Control):
                     util.drawLine(dc, nx - 1, y, 0, lineh)
                     util.drawLine(dc, nx + nw, y, 0, lineh)
 
-                    if self.sp.isFirstLineOfElem(i):
+                    if note[0]:
                         util.drawLine(dc, nx - 1, y - 1, nw + 2, 0)
 
-                    if self.sp.isLastLineOfElem(i):
+                    if note[1]:
                         util.drawLine(dc, nx - 1, y + lineh,
                                       nw + 2, 0)
 
-                if marked and self.sp.isLineMarked(i, marked):
-                    c1, c2 = self.sp.getMarkedColumns(i, marked)
+                if markCols:
+                    c1, c2 = markCols
 
                     dc.SetPen(cfgGui.selectedPen)
                     dc.SetBrush(cfgGui.selectedBrush)
@@ -1500,44 +1765,37 @@ class MyCtrl(wx.Control):
                     dc.DrawRectangle(t.x + c1 * fx, y, (c2 - c1 + 1) * fx,
                         lineh)
 
-                if mainFrame.showFormatting:
+                if fmt:
+                    lb, extraIndent = fmt
+
                     dc.SetPen(cfgGui.bluePen)
                     util.drawLine(dc, t.x, y, 0, lineh)
 
-                    extraIndent = 1 if self.sp.needsExtraParenIndent(i) else 0
+                    extraIndent = 1 if extraIndent else 0
 
                     util.drawLine(dc,
-                        t.x + (self.sp.cfg.getType(l.lt).width - extraIndent) * fx,
+                        t.x + (self.sp.cfg.getType(lt).width - extraIndent) * fx,
                         y, 0, lineh)
 
                     dc.SetTextForeground(cfgGui.redColor)
                     dc.SetFont(cfgGui.fonts[pml.NORMAL].font)
-                    dc.DrawText(config.lb2char(l.lb), t.x - 10, y)
-
-                if not dpages:
-                    if cfgGl.pbi == config.PBI_REAL_AND_UNADJ:
-                        if self.sp.line2pageNoAdjust(i) != \
-                               self.sp.line2pageNoAdjust(i + 1):
-                            dc.SetPen(cfgGui.pagebreakNoAdjustPen)
-                            util.drawLine(dc, 0, y + lineh - 1,
-                                size.width, 0)
-
-                    if cfgGl.pbi in (config.PBI_REAL,
-                                   config.PBI_REAL_AND_UNADJ):
-                        thisPage = self.sp.line2page(i)
-
-                        if thisPage != self.sp.line2page(i + 1):
-                            dc.SetPen(cfgGui.pagebreakPen)
-                            util.drawLine(dc, 0, y + lineh - 1,
-                                size.width, 0)
-
-                if i == self.sp.line:
+                    dc.DrawText(config.lb2char(lb), t.x - 10, y)
+
+                if pbNoAdjust:
+                    dc.SetPen(cfgGui.pagebreakNoAdjustPen)
+                    util.drawLine(dc, 0, y + lineh - 1, size.width, 0)
+
+                if pbReal:
+                    dc.SetPen(cfgGui.pagebreakPen)
+                    util.drawLine(dc, 0, y + lineh - 1, size.width, 0)
+
+                if cursorCol is not None:
                     posX = t.x
                     cursorY = y
                     acFi = fi
                     dc.SetPen(cfgGui.cursorPen)
                     dc.SetBrush(cfgGui.cursorBrush)
-                    dc.DrawRectangle(t.x + self.sp.column * fx, y, fx, fi.fy)
+                    dc.DrawRectangle(t.x + cursorCol * fx, y, fx, fi.fy)
 
             if len(t.text) != 0:
                 tl = texts.get(fi.font)
@@ -1547,16 +1805,16 @@ class MyCtrl(wx.Control):
 
                 tl[0].append(t.text)
                 tl[1].append((t.x, y))
-                if t.line != -1:
+                if ex:
                     if cfgGl.useCustomElemColors:
-                        tl[2].append(cfgGui.lt2textColor(ls[t.line].lt))
+                        tl[2].append(cfgGui.lt2textColor(ex[0]))
                     else:
                         tl[2].append(cfgGui.textColor)
                 else:
                     tl[2].append(cfgGui.textHdrColor)
 
                 if t.isUnderlined:
-                    if t.line != -1:
+                    if ex:
                         uli = ulines
                     else:
                         uli = ulinesHdr
@@ -2183,6 +2441,35 @@ class MyFrame(wx.Frame):
         self.panel.ctrl.updateScreen()
         gd.mru.add(filename)
 
+    # offer to recover unsaved changes from journals left behind by
+    # previous runs of the program that didn't exit cleanly.
+    def recoverScripts(self):
+        for path in journal.findOrphans(journal.getDir()):
+            try:
+                res = journal.recover(path, cfgGl)
+            except (EnvironmentError, TrelbyError):
+                res = None
+
+            if res:
+                sp, fileName = res
+
+                if wx.MessageBox("Unsaved changes to script '%s' were\n"
+                        "found from a previous session that did not\n"
+                        "exit cleanly. Recover them?" % (
+                            fileName or u"untitled"), "Recover",
+                        wx.YES_NO | wx.YES_DEFAULT, self) == wx.YES:
+
+                    if not self.panel.ctrl.isUntouched():
+                        self.panel = self.createNewPanel()
+
+                    self.panel.ctrl.useScript(sp, fileName)
+                    self.panel.ctrl.updateScreen()
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
     def checkFonts(self):
         names = ["Normal", "Bold", "Italic", "Bold-Italic"]
         failed = []
@@ -2298,6 +2585,7 @@ class MyFrame(wx.Frame):
             return
 
         if self.tabCtrl.getPageCount() > 1:
+            self.panel.ctrl.closeJournal()
             self.tabCtrl.deletePage(self.tabCtrl.getSelectedPageIndex())
         else:
             self.panel.ctrl.createEmptySp()
@@ -2575,6 +2863,9 @@ class MyFrame(wx.Frame):
                 doExit = False
 
         if doExit:
+            for c in self.getCtrls():
+                c.closeJournal()
+
             util.writeToFile(gd.stateFilename, gd.save(), self)
             util.removeTempFiles(misc.tmpPrefix)
             self.Destroy()
@@ -2672,6 +2963,8 @@ class MyApp(wx.App):
 
         mainFrame.Show(True)
 
+        mainFrame.recoverScripts()
+
         # windows needs this for some reason
         mainFrame.panel.ctrl.SetFocus()
 
@@ -2691,6 +2984,9 @@ def main():
 
     opts.init()
 
+    if opts.profile:
+        instrument.enable(opts.profile)
+
     myApp = MyApp(0)
     myApp.MainLoop()
 
@@ -38,6 +38,9 @@ import zlib
 # this figure does not need to be very accurate.
 BASE_MEMORY_USAGE = 1500
 
+# the same for undo.Stub, which doesn't store any differences at all
+STUB_MEMORY_USAGE = 300
+
 # possible command types. only used for possibly merging consecutive
 # edits.
 (CMD_ADD_CHAR,
@@ -113,6 +116,13 @@ class Base:
         self.prev = None
         self.next = None
 
+        # sp.editCount before the action
+        self.editCount = sp.editCount
+
+        # position of the action's record in sp's journal, or None if it
+        # has none
+        self.journalPos = None
+
     # set cursor position after the action
     def setEndPos(self, sp):
         self.endPos = sp.cursorAsMark()
@@ -120,6 +130,12 @@ class Base:
     def getType(self):
         return self.cmdType
 
+    # return (line, linesBefore, linesAfter) describing the change: lines
+    # from 'line' onwards, in lines2storage format, before / after it.
+    # can be overridden by subclasses that store it differently.
+    def getDelta(self):
+        return (self.elemStartLine, self.linesBefore, self.linesAfter)
+
     # rough estimate of how much memory is used by this undo object. can
     # be overridden by subclasses that need something different.
     def memoryUsed(self):
@@ -133,6 +149,8 @@ class Base:
 
         sp.lines[self.elemStartLine : self.elemStartLine + self.linesAfter[0]] = \
             storage2lines(self.linesBefore)
+        sp.markLinesChanged(self.elemStartLine,
+                            self.elemStartLine + self.linesBefore[0] - 1)
 
     # default implementation for redo. can be overridden by subclasses
     # that need something different.
@@ -141,33 +159,8 @@ class Base:
 
         sp.lines[self.elemStartLine : self.elemStartLine + self.linesBefore[0]] = \
             storage2lines(self.linesAfter)
-
-# stores a full copy of the screenplay before/after the action. used by
-# actions that modify the screenplay globally.
-#
-# we store the line data as compressed text, not as a list of Line
-# objects, because it takes much less memory to do so. figures from a
-# 32-bit machine (a 64-bit machine wastes even more space storing Line
-# objects) from speedTest for a 120-page screenplay (Casablanca):
-#
-#   -Line objects:         1,737 KB, 0.113s
-#   -text, not compressed:   267 KB, 0.076s
-#   -text, zlib fastest(1):  127 KB, 0.090s
-#   -text, zlib medium(6):   109 KB, 0.115s
-#   -text, zlib best(9):     107 KB, 0.126s
-#   -text, bz2 best(9):       88 KB, 0.147s
-class FullCopy(Base):
-    def __init__(self, sp):
-        Base.__init__(self, sp, CMD_MISC)
-
-        self.elemStartLine = 0
-        self.linesBefore = lines2storage(sp.lines)
-
-    # called after editing action is over to snapshot the "after" state
-    def setAfter(self, sp):
-        self.linesAfter = lines2storage(sp.lines)
-        self.setEndPos(sp)
-
+        sp.markLinesChanged(self.elemStartLine,
+                            self.elemStartLine + self.linesAfter[0] - 1)
 
 # stores a single modified paragraph
 class SinglePara(Base):
@@ -231,18 +224,35 @@ class ManyElems(Base):
         self.setEndPos(sp)
 
 # stores a single block of changed lines by diffing before/after states of
-# a screenplay
+# a part of a screenplay. lines firstLine - lastLine (inclusive) are the
+# only ones the action is allowed to modify, delete, or insert new lines
+# among; everything outside them must stay as it is. only that range is
+# copied and diffed, so the cost depends on the size of the edit, not of
+# the script.
 class AnyDifference(Base):
-    def __init__(self, sp):
+    def __init__(self, sp, firstLine, lastLine):
         Base.__init__(self, sp, CMD_MISC)
 
-        self.linesBefore = [screenplay.Line(ln.lb, ln.lt, ln.text) for ln in sp.lines]
+        self.firstLine = firstLine
+        self.lenBefore = len(sp.lines)
+
+        self.linesBefore = [screenplay.Line(ln.lb, ln.lt, ln.text) for ln in
+                            sp.lines[firstLine : lastLine + 1]]
 
     def setAfter(self, sp):
-        self.a, self.b, self.x, self.y = mySequenceMatcher(self.linesBefore, sp.lines)
+        first = self.firstLine
+
+        # the range's end after the action
+        end = first + len(self.linesBefore) + len(sp.lines) - self.lenBefore
+        linesAfter = sp.lines[first : end]
+
+        a, b, x, y = mySequenceMatcher(self.linesBefore, linesAfter)
+
+        self.removed = lines2storage(self.linesBefore[a : b])
+        self.inserted = lines2storage(linesAfter[x : y])
 
-        self.removed = lines2storage(self.linesBefore[self.a : self.b])
-        self.inserted = lines2storage(sp.lines[self.x : self.y])
+        self.a, self.b, self.x, self.y = first + a, first + b, first + x, \
+            first + y
 
         self.setEndPos(sp)
 
@@ -252,16 +262,94 @@ class AnyDifference(Base):
         return (BASE_MEMORY_USAGE + memoryUsed(self.removed) +
                 memoryUsed(self.inserted))
 
+    def getDelta(self):
+        return (self.a, self.removed, self.inserted)
+
     def undo(self, sp):
         sp.line, sp.column = self.startPos.line, self.startPos.column
 
         sp.lines[self.x : self.y] = storage2lines(self.removed)
+        sp.markLinesChanged(self.x, self.x + self.removed[0] - 1)
 
     def redo(self, sp):
         sp.line, sp.column = self.endPos.line, self.endPos.column
 
         sp.lines[self.a : self.b] = storage2lines(self.inserted)
+        sp.markLinesChanged(self.a, self.a + self.inserted[0] - 1)
+
+# used by actions that modify the screenplay globally. a full copy of the
+# screenplay is taken before the action, but only the block of lines that
+# actually changed is kept after it.
+#
+# we store the full copy as compressed text, not as a list of Line
+# objects, because it takes much less memory to do so. figures from a
+# 32-bit machine (a 64-bit machine wastes even more space storing Line
+# objects) from speedTest for a 120-page screenplay (Casablanca):
+#
+#   -Line objects:         1,737 KB, 0.113s
+#   -text, not compressed:   267 KB, 0.076s
+#   -text, zlib fastest(1):  127 KB, 0.090s
+#   -text, zlib medium(6):   109 KB, 0.115s
+#   -text, zlib best(9):     107 KB, 0.126s
+#   -text, bz2 best(9):       88 KB, 0.147s
+class FullCopy(AnyDifference):
+    def __init__(self, sp):
+        Base.__init__(self, sp, CMD_MISC)
+
+        self.firstLine = 0
+        self.lenBefore = len(sp.lines)
+        self.storage = lines2storage(sp.lines)
+
+    # called after editing action is over to find out what changed
+    def setAfter(self, sp):
+        self.linesBefore = storage2lines(self.storage)
+        del self.storage
+
+        AnyDifference.setAfter(self, sp)
+
+# stands in for an undo object whose changes are stored in the script's
+# journal (see journal.py) instead of memory. they are read back from
+# there when needed.
+class Stub(Base):
+    # u is the undo object to replace, which must have been written to
+    # journal 'jnl'.
+    def __init__(self, u, jnl):
+        self.startPos = u.startPos
+        self.endPos = u.endPos
+        self.cmdType = u.cmdType
+        self.prev = u.prev
+        self.next = u.next
+        self.editCount = u.editCount
+        self.journalPos = u.journalPos
+
+        self.journal = jnl
+
+    def memoryUsed(self):
+        return STUB_MEMORY_USAGE
+
+    def undo(self, sp):
+        self.load()
+
+        try:
+            Base.undo(self, sp)
+        finally:
+            self.unload()
+
+    def redo(self, sp):
+        self.load()
+
+        try:
+            Base.redo(self, sp)
+        finally:
+            self.unload()
+
+    # raises MiscError or EnvironmentError if the journal can't be read.
+    def load(self):
+        self.elemStartLine, self.linesBefore, self.linesAfter = \
+            self.journal.readDelta(self.journalPos)
 
+    def unload(self):
+        del self.elemStartLine, self.linesBefore, self.linesAfter
 
 # Our own implementation of difflib.SequenceMatcher, since the actual one
 # is too slow for our custom needs.
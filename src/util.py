@@ -2,13 +2,18 @@
 
 from error import *
 
+import bisect
+import codecs
 import datetime
 import glob
 import gzip
 import misc
 import os
 import re
+import shutil
+import sys
 import tempfile
+import threading
 import time
 
 import StringIO
@@ -59,6 +64,10 @@ _normalize_tbl = ""
 # identity table that maps each character to itself. used by deleteChars.
 _identity_tbl = ""
 
+# translate table that converts word boundary characters (see
+# isWordBoundary) to spaces and keeps the rest. used by splitToWords.
+_word_tbl = ""
+
 # map some fancy unicode characters to their nearest ASCII/Latin-1
 # equivalents so when people import text it's not mangled to uselessness
 _fancy_unicode_map = {
@@ -75,7 +84,14 @@ permDc = None
 
 def init(doWX = True):
     global _to_upper, _to_lower, _input_tbl, _normalize_tbl, _identity_tbl, \
-           permDc
+           _word_tbl, permDc
+
+    # the tables are built from scratch, so calling this again (e.g. in
+    # a forked worker process) is harmless
+    _to_upper = ""
+    _to_lower = ""
+    _input_tbl = ""
+    _normalize_tbl = ""
 
     # setup ISO-8859-1 case-conversion stuff
     tmpUpper = []
@@ -115,6 +131,9 @@ def init(doWX = True):
 
     _identity_tbl = "".join([chr(i) for i in range(256)])
 
+    _word_tbl = "".join([" " if isWordBoundary(chr(i)) else chr(i)
+                         for i in range(256)])
+
     if doWX:
         # dunno if the bitmap needs to be big enough to contain the text
         # we're measuring...
@@ -165,10 +184,21 @@ def toInputStr(s):
 def removeFancyUnicode(s):
     return s.translate(_fancy_unicode_map)
 
+# encoding error handler replacing fancy unicode characters with their
+# ASCII/Latin1 equivalents, and discarding other characters that can't be
+# encoded.
+def _fancyReplace(e):
+    return (u"".join([_fancy_unicode_map.get(ord(c), u"")
+                      for c in e.object[e.start:e.end]]), e.end)
+
+codecs.register_error("trelby-fancy", _fancyReplace)
+
 # transform external input (unicode) into a form suitable for having in a
-# script
+# script. same as toInputStr(toLatin1(removeFancyUnicode(s))), but only
+# goes through the characters one at a time in Python if there are some
+# that aren't in ISO-8859-1.
 def cleanInput(s):
-    return toInputStr(toLatin1(removeFancyUnicode(s)))
+    return toInputStr(s.encode("ISO-8859-1", "trelby-fancy"))
 
 # replace s[start:start + width] with toInputStr(new) and return s
 def replace(s, new, start, width):
@@ -183,6 +213,34 @@ def deleteChars(s, chars):
 def fixNL(s):
     return s.replace("\r\n", "\n").replace("\r", "\n")
 
+# return iterator over the lines of file object 'f', with newlines fixed
+# as in fixNL and not included in the lines, i.e. what
+# fixNL(data + f.read()).split("\n") would return, but reading 'f' a
+# chunk at a time. 'data' is anything already read from 'f'.
+def iterLines(f, data = "", chunkSize = 65536):
+    rest = ""
+    s = data + f.read(chunkSize)
+
+    while s:
+        # a "\r" at the end might be the first half of a "\r\n"
+        while s.endswith("\r"):
+            tmp = f.read(1)
+
+            if not tmp:
+                break
+
+            s += tmp
+
+        lines = fixNL(rest + s).split("\n")
+        rest = lines.pop()
+
+        for ln in lines:
+            yield ln
+
+        s = f.read(chunkSize)
+
+    yield rest
+
 # clamps the given value to a specific range. both limits are optional.
 def clamp(val, minVal = None, maxVal = None):
     ret = val
@@ -513,21 +571,29 @@ def ensureEndsIn(s, suffix):
 
 # return string 's' split into words (as a list), using isWordBoundary.
 def splitToWords(s):
-    tmp = ""
-
-    for c in s:
-        if isWordBoundary(c):
-            tmp += " "
-        else:
-            tmp += c
-
-    return tmp.split()
+    return s.translate(_word_tbl).split()
 
 # return two-character prefix of s, using characters a-z only. len(s) must
 # be at least 2.
 def getWordPrefix(s):
     return s[:2].translate(_normalize_tbl)
 
+# return (lo, hi) such that keys[lo:hi] are the items of sorted list
+# 'keys' that start with 's'.
+def prefixRange(keys, s):
+    lo = bisect.bisect_left(keys, s)
+
+    # the first string greater than all strings starting with s is s with
+    # its last character incremented, after removing trailing "\xff"s
+    end = s.rstrip("\xff")
+
+    if not end:
+        return (lo, len(keys))
+
+    end = end[:-1] + chr(ord(end[-1]) + 1)
+
+    return (lo, bisect.bisect_left(keys, end, lo))
+
 # return count of how many 'ch' characters 's' begins with.
 def countInitial(s, ch):
     cnt = 0
@@ -883,6 +949,19 @@ def loadFile(filename, frame, maxSize = -1):
 
     return ret
 
+# open file 'filename' for reading and return the file object. if it
+# can't be opened, shows an error message in a message box with 'frame'
+# as its parent, and returns None.
+def openFile(filename, frame):
+    try:
+        return open(misc.toPath(filename), "rb")
+
+    except IOError, (errno, strerror):
+        wx.MessageBox("Error loading file '%s': %s" % (
+                filename, strerror), "Error", wx.OK, frame)
+
+        return None
+
 # like loadFile, but if file doesn't exist, tries to load a .gz compressed
 # version of it.
 def loadMaybeCompressedFile(filename, frame):
@@ -914,24 +993,100 @@ def loadMaybeCompressedFile(filename, frame):
         return None
 
 # write 'data' to 'filename', popping up a messagebox using 'frame' as
-# parent on errors. returns True on success.
+# parent on errors. 'data' can also be a function, which is called with
+# the opened file object to write the data itself. returns True on
+# success.
 def writeToFile(filename, data, frame):
     try:
-        f = open(misc.toPath(filename), "wb")
+        # data that has to be generated first could fail half way
+        # through, so that's written to a temporary file first
+        if callable(data):
+            writeFileSafely(filename, data)
+        else:
+            f = open(misc.toPath(filename), "wb")
 
-        try:
-            f.write(data)
-        finally:
-            f.close()
+            try:
+                f.write(data)
+            finally:
+                f.close()
 
         return True
 
-    except IOError, (errno, strerror):
+    except (IOError, OSError), (errno, strerror):
         wx.MessageBox("Error writing file '%s': %s" % (
                 filename, strerror), "Error", wx.OK, frame)
 
         return False
 
+# create 'filename' by calling 'func' with a file object to write the
+# data to. the data is written to a temporary file in the same directory,
+# which only replaces 'filename' once it has all been written, so that an
+# error doesn't leave a partial file behind or destroy an existing one.
+# symlinks are followed and the old file's permissions kept. if the
+# temporary file can't be created, the file is written in place.
+# exceptions are passed on to the caller.
+def writeFileSafely(filename, func):
+    path = os.path.realpath(misc.toPath(filename))
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+
+    try:
+        f = open(tmpPath, "wb")
+    except IOError:
+        f = open(path, "wb")
+
+        try:
+            func(f)
+        finally:
+            f.close()
+
+        return
+
+    try:
+        try:
+            func(f)
+
+            # make sure the data is on disk before the old file is gone
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+        if os.path.exists(path):
+            shutil.copymode(path, tmpPath)
+
+        replaceFile(tmpPath, path)
+    except:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+
+        raise
+
+# rename file 'src' to 'dst', replacing 'dst' if it exists.
+def replaceFile(src, dst):
+    # rename doesn't replace existing files on Windows, so move the old
+    # file out of the way first, and put it back if the rename fails
+    if not (misc.isWindows and os.path.exists(dst)):
+        os.rename(src, dst)
+
+        return
+
+    backup = "%s.%d.bak" % (dst, os.getpid())
+    os.rename(dst, backup)
+
+    try:
+        os.rename(src, dst)
+    except:
+        os.rename(backup, dst)
+
+        raise
+
+    try:
+        os.remove(backup)
+    except OSError:
+        pass
+
 def removeTempFiles(prefix):
     files = glob.glob(tempfile.gettempdir() + "/%s*" % prefix)
 
@@ -982,6 +1137,62 @@ def findFileInPath(filename):
 
     return findFile(filename, dirs)
 
+# runs func(progress) in a separate thread. func should call
+# progress(done, total) now and then, which records how far along it is
+# and is also where cancelling takes effect: once cancel has been called,
+# progress raises CancelledError. the task's state can be polled from
+# other threads.
+class BackgroundTask:
+    def __init__(self, func):
+        self.func = func
+        self.thread = None
+
+        # how far along the task is, 0.0 - 1.0
+        self.fraction = 0.0
+
+        self.cancelled = False
+
+        # func's return value, or sys.exc_info() of the exception it
+        # raised
+        self.result = None
+        self.excInfo = None
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.result = self.func(self.progress)
+        except:
+            self.excInfo = sys.exc_info()
+
+    def progress(self, done, total):
+        if self.cancelled:
+            raise CancelledError()
+
+        if total > 0:
+            self.fraction = clamp(float(done) / total, 0.0, 1.0)
+
+    def cancel(self):
+        self.cancelled = True
+
+    # wait at most timeout seconds (forever if None) for the task to
+    # finish, and return True if it has.
+    def wait(self, timeout = None):
+        self.thread.join(timeout)
+
+        return not self.thread.isAlive()
+
+    # return func's return value, or re-raise the exception it raised.
+    # only valid after the task has finished.
+    def getResult(self):
+        if self.excInfo:
+            raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+
+        return self.result
+
 # simple timer class for use during development only
 class TimerDev:
 
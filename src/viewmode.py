@@ -5,6 +5,8 @@ import mypager
 import pml
 import util
 
+import collections
+import re
 import wx
 
 # Number of lines the smooth scroll will try to search. 15-20 is a good
@@ -42,23 +44,31 @@ class DisplayPage:
         self.x2 = x2
         self.y2 = y2
 
-# caches pml.Pages for operations that repeatedly construct them over and
-# over again without the page contents changing.
-class PageCache:
-    def __init__(self, ctrl):
-        self.ctrl = ctrl
+# LRU cache of rendered bitmaps. render(*key) is called to create the
+# bitmap for a key not in the cache.
+class BitmapCache:
 
-        # cached pages. key = pageNr, value = pml.Page
-        self.pages = {}
+    # max nr of bitmaps to keep
+    MAX_BITMAPS = 2000
 
-    def getPage(self, pager, pageNr):
-        pg = self.pages.get(pageNr)
+    def __init__(self, render):
+        self.render = render
 
-        if not pg:
-            pg = self.ctrl.sp.generatePMLPage(pager, pageNr, False, False)
-            self.pages[pageNr] = pg
+        # key = key, value = bitmap
+        self.bitmaps = collections.OrderedDict()
 
-        return pg
+    def get(self, key):
+        if key in self.bitmaps:
+            bmp = self.bitmaps.pop(key)
+        else:
+            bmp = self.render(*key)
+
+            if len(self.bitmaps) >= self.MAX_BITMAPS:
+                self.bitmaps.popitem(False)
+
+        self.bitmaps[key] = bmp
+
+        return bmp
 
 # View Mode, i.e. a way of displaying the script on screen. this is an
 # abstract superclass.
@@ -68,16 +78,14 @@ class ViewMode:
     # (texts, dpages), where texts = [TextString, ...], dpages =
     # [DisplayPage, ...]. dpages is None if draft mode is in use or
     # doExtra is False. doExtra has same meaning as for generatePMLPage
-    # otherwise. pageCache, if given, is used in layout mode to cache PML
-    # pages. it should only be given when doExtra = False as the cached
-    # pages aren't accurate down to that level.
+    # otherwise.
     #
     # partial lines (some of the the text is clipped off-screen) are only
     # included in the results if 'partials' is True.
     #
     # lines in 'texts' have to be in monotonically increasing order, and
     # this has to always return at least one line.
-    def getScreen(self, ctrl, doExtra, partials = False, pageCache = None):
+    def getScreen(self, ctrl, doExtra, partials = False):
         raise Exception("getScreen not implemented")
 
     # return height for one line on screen
@@ -175,14 +183,12 @@ class ViewMode:
             else:
                 ctrl.sp.line = tl
 
-                pc = PageCache(ctrl)
-
                 while 1:
                     tl = ctrl.sp.getTopLine()
                     if tl == 0:
                         break
 
-                    texts = self.getScreen(ctrl, False, False, pc)[0]
+                    texts = self.getScreen(ctrl, False, False)[0]
                     lastLine = texts[-1].line
 
                     if ctrl.sp.line > lastLine:
@@ -198,7 +204,7 @@ class ViewMode:
 # background.
 class ViewModeDraft(ViewMode):
 
-    def getScreen(self, ctrl, doExtra, partials = False, pageCache = None):
+    def getScreen(self, ctrl, doExtra, partials = False):
         cfg = ctrl.sp.cfg
         cfgGui = ctrl.getCfgGui()
 
@@ -267,7 +273,7 @@ class ViewModeDraft(ViewMode):
 # have.
 class ViewModeLayout(ViewMode):
 
-    def getScreen(self, ctrl, doExtra, partials = False, pageCache = None):
+    def getScreen(self, ctrl, doExtra, partials = False):
         cfgGui = ctrl.getCfgGui()
         textOp = pml.TextOp
 
@@ -293,12 +299,9 @@ class ViewModeLayout(ViewMode):
             pager.scene = ctrl.sp.getSceneNumber(
                 ctrl.sp.page2lines(pageNr)[0] - 1)
 
-        # find out starting place (if something bugs, generatePMLPage
+        # find out starting place (if something bugs, getPMLPage
         # below could return None, but it shouldn't happen...)
-        if pageCache:
-            pg = pageCache.getPage(pager, pageNr)
-        else:
-            pg = ctrl.sp.generatePMLPage(pager, pageNr, False, doExtra)
+        pg = ctrl.sp.getPMLPage(pager, pageNr, False, doExtra)
 
         topOfPage = True
         for op in pg.ops:
@@ -333,11 +336,7 @@ class ViewModeLayout(ViewMode):
                 # so disable it altogether.
                 pager.sceneContNr = 0
 
-                if pageCache:
-                    pg = pageCache.getPage(pager, pageNr)
-                else:
-                    pg = ctrl.sp.generatePMLPage(pager, pageNr, False,
-                                                 doExtra)
+                pg = ctrl.sp.getPMLPage(pager, pageNr, False, doExtra)
                 if not pg:
                     break
 
@@ -405,7 +404,7 @@ class ViewModeLayout(ViewMode):
 # only, in a single row.
 class ViewModeSideBySide(ViewMode):
 
-    def getScreen(self, ctrl, doExtra, partials = False, pageCache = None):
+    def getScreen(self, ctrl, doExtra, partials = False):
         cfgGui = ctrl.getCfgGui()
         textOp = pml.TextOp
 
@@ -442,11 +441,7 @@ class ViewModeSideBySide(ViewMode):
             # altogether.
             pager.sceneContNr = 0
 
-            if pageCache:
-                pg = pageCache.getPage(pager, pageNr)
-            else:
-                pg = ctrl.sp.generatePMLPage(pager, pageNr, False,
-                                             doExtra)
+            pg = ctrl.sp.getPMLPage(pager, pageNr, False, doExtra)
             if not pg:
                 break
 
@@ -538,7 +533,10 @@ class ViewModeOverview(ViewMode):
         # each character is size x size pixels.
         self.size = size
 
-    def getScreen(self, ctrl, doExtra, partials = False, pageCache = None):
+        # bitmaps of texts, keyed by (text, (r, g, b))
+        self.bitmaps = BitmapCache(self.renderText)
+
+    def getScreen(self, ctrl, doExtra, partials = False):
         cfgGui = ctrl.getCfgGui()
         textOp = pml.TextOp
 
@@ -570,11 +568,7 @@ class ViewModeOverview(ViewMode):
             if (pagesDone >= pageCnt) or (pageNr >= len(ctrl.sp.pages)):
                 break
 
-            if pageCache:
-                pg = pageCache.getPage(pager, pageNr)
-            else:
-                pg = ctrl.sp.generatePMLPage(pager, pageNr, False,
-                                             doExtra)
+            pg = ctrl.sp.getPMLPage(pager, pageNr, False, doExtra)
             if not pg:
                 break
 
@@ -609,18 +603,44 @@ class ViewModeOverview(ViewMode):
 
     def drawTexts(self, ctrl, dc, tl):
         for i in xrange(len(tl[1][0])):
-            dc.SetPen(wx.Pen(tl[1][2][i]))
+            bmp = self.bitmaps.get((tl[1][0][i], tl[1][2][i].Get()))
+
+            if bmp:
+                sx, sy = tl[1][1][i]
+                dc.DrawBitmap(bmp, sx, sy, True)
+
+    # return a bitmap of text 's' drawn in colour 'color', an (r, g, b)
+    # tuple, with each character other than a space being a block of size
+    # x size pixels. returns None if there is nothing to draw.
+    def renderText(self, s, color):
+        size = self.size
+        runs = [m.span() for m in re.finditer("[^ \xa0]+", s)]
+
+        if not runs:
+            return None
+
+        bmp = wx.EmptyBitmap(len(s) * size, size)
+
+        if color == (0, 0, 0):
+            bg = wx.WHITE
+        else:
+            bg = wx.BLACK
+
+        c = wx.Colour(*color)
+
+        dc = wx.MemoryDC(bmp)
+        dc.SetBackground(wx.Brush(bg))
+        dc.Clear()
+        dc.SetPen(wx.Pen(c))
+        dc.SetBrush(wx.Brush(c))
 
-            s = tl[1][0][i]
-            sx, sy = tl[1][1][i]
+        for start, end in runs:
+            dc.DrawRectangle(start * size, 0, (end - start) * size, size)
 
-            for j in xrange(len(s)):
-                if s[j] not in (" ", ""):
-                    off = sx + j * self.size
+        dc.SelectObject(wx.NullBitmap)
+        bmp.SetMask(wx.Mask(bmp, bg))
 
-                    for x in range(self.size):
-                        for y in range(self.size):
-                            dc.DrawPoint(off + x, sy + y)
+        return bmp
 
     # since the cursor is basically invisible anyway, we just return
     # (line, 0) where line = first line on the clicked page.
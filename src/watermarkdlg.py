@@ -3,8 +3,46 @@ import pml
 import random
 import util
 
+import copy
+
 import wx
 
+# return a copy of PML document 'doc' with a watermark added to each page.
+# cfg is the script's config, 'common' and 'mark' are the texts to add
+# ('common' can be empty), and fontsize is their size. the pages' ops
+# lists are new, but the ops in them are shared with 'doc'.
+def addWatermark(doc, cfg, common, mark, fontsize):
+    ops = []
+
+    # almost-not-there gray
+    ops.append(pml.PDFOp("0.85 g"))
+
+    if common:
+        wm = pml.TextOp(
+            util.cleanInput(common),
+            cfg.marginLeft + 20, cfg.paperHeight * 0.45,
+            fontsize, pml.BOLD, angle = 45)
+        ops.append(wm)
+
+    wm = pml.TextOp(
+        util.cleanInput(mark),
+        cfg.marginLeft + 20, cfg.paperHeight * 0.6,
+        fontsize, pml.BOLD, angle = 45)
+    ops.append(wm)
+
+    # ...and back to black
+    ops.append(pml.PDFOp("0.0 g"))
+
+    ret = copy.copy(doc)
+    ret.pages = []
+
+    for page in doc.pages:
+        pg = pml.Page(ret)
+        pg.ops = ops + page.ops
+        ret.pages.append(pg)
+
+    return ret
+
 # The watermark tool dialog.
 class WatermarkDlg(wx.Dialog):
     # sp - screenplay object, from which to generate PDF
@@ -101,6 +139,9 @@ class WatermarkDlg(wx.Dialog):
 
         count = 0
 
+        # the script is the same for every copy, so only generate it once
+        basedoc = self.sp.generatePML(True)
+
         for item in watermarks:
             s = item.strip()
 
@@ -109,37 +150,12 @@ class WatermarkDlg(wx.Dialog):
 
             basename = item.replace(" ", "-")
             fn = directory + "/" + fnprefix + '-' + basename + ".pdf"
-            pmldoc = self.sp.generatePML(True)
-
-            ops = []
-
-            # almost-not-there gray
-            ops.append(pml.PDFOp("0.85 g"))
-
-            if common:
-                wm = pml.TextOp(
-                    util.cleanInput(common),
-                    self.sp.cfg.marginLeft + 20, self.sp.cfg.paperHeight * 0.45,
-                    fontsize, pml.BOLD, angle = 45)
-                ops.append(wm)
-
-            wm = pml.TextOp(
-                util.cleanInput(s),
-                self.sp.cfg.marginLeft + 20, self.sp.cfg.paperHeight * 0.6,
-                fontsize, pml.BOLD, angle = 45)
-            ops.append(wm)
-
-            # ...and back to black
-            ops.append(pml.PDFOp("0.0 g"))
-
-            for page in pmldoc.pages:
-                page.addOpsToFront(ops)
 
+            pmldoc = addWatermark(basedoc, self.sp.cfg, common, s, fontsize)
             pmldoc.uniqueId = self.getUniqueId(usedIds)
 
-            pdfdata = pdf.generate(pmldoc)
-
-            if not util.writeToFile(fn, pdfdata, self):
+            if not util.writeToFile(fn,
+                    lambda f: pdf.generateTo(pmldoc, f), self):
                 wx.MessageBox("PDF generation aborted.", "Error", wx.OK, self)
                 return
             else:
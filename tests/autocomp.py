@@ -0,0 +1,119 @@
+import screenplay as scr
+import u
+import util
+
+# tests for the auto-completion index
+
+# what getMatchingText used to do, except for the ordering.
+def matchSlow(sp, text, lt):
+    text = util.upper(text)
+    ls = sp.lines
+    counts = {}
+    last = None
+
+    for i in xrange(len(ls)):
+        if (ls[i].lt == lt) and (ls[i].lb == scr.LB_LAST):
+            upstr = util.upper(ls[i].text)
+
+            if upstr.startswith(text) and i != sp.line:
+                counts[upstr] = counts.get(upstr, 0) + 1
+
+                if i < sp.line:
+                    last = upstr
+
+    for s in sp.autoCompletion.getType(lt).items:
+        if s.startswith(text):
+            counts.setdefault(s, 0)
+
+    return (last, counts)
+
+# check getMatchingText for all completable types with a few prefixes on
+# a few lines of sp.
+def check(sp):
+    line = sp.line
+
+    for i in (0, len(sp.lines) // 3, len(sp.lines) - 1, line):
+        sp.line = i
+
+        for lt in (scr.SCENE, scr.CHARACTER, scr.TRANSITION, scr.SHOT):
+            for text in ("", "a", "b", "int. ", "c", "cut", "ex", "x"):
+                last, counts = matchSlow(sp, text, lt)
+                res = sp.getMatchingText(text, lt)
+
+                assert sorted(res) == sorted(counts)
+
+                if last:
+                    assert res[0] == last
+                    res = res[1:]
+
+                assert res == sorted(res, key = lambda s: (-counts[s], s))
+
+    sp.line = line
+
+def testMatches():
+    sp = u.load("../sample.trelby")
+
+    check(sp)
+
+def testRanking():
+    sp = u.new()
+
+    names = ["BOB", "ALICE", "bob", "BEN", "CAROL", "ALICE", "BOB", "BEN",
+             "ALICE", "CAROL", "DAVE"]
+    sp.lines = [scr.Line(scr.LB_LAST, scr.CHARACTER, s) for s in names]
+
+    sp.line = len(names) - 1
+    assert sp.getMatchingText("", scr.CHARACTER) == \
+           ["CAROL", "ALICE", "BOB", "BEN"]
+    assert sp.getMatchingText("b", scr.CHARACTER) == ["BEN", "BOB"]
+
+    # the current line doesn't count
+    sp.line = 4
+    assert sp.getMatchingText("", scr.CHARACTER) == \
+           ["BEN", "ALICE", "BOB", "CAROL", "DAVE"]
+
+    sp.lines[0].text = "CAROL"
+    sp.lines[2].text = "CAROL"
+    sp.markLinesChanged(0, 2)
+    assert sp.getMatchingText("", scr.CHARACTER) == \
+           ["BEN", "ALICE", "CAROL", "BOB", "DAVE"]
+
+    # the config's items are included after the ones in the script
+    sp.line = 0
+    res = sp.getMatchingText("", scr.TRANSITION)
+    assert res == sorted(sp.autoCompletion.getType(scr.TRANSITION).items)
+
+def testEdits():
+    sp = u.load("../sample.trelby")
+    sp.getMatchingText("", scr.SCENE)
+
+    u.randomEdits(sp, 3, 200, lambda sp: None)
+    check(sp)
+
+    u.randomEdits(sp, 4, 30, check)
+
+# check that the index's lists of lines match its entries.
+def checkLines(sp):
+    ci = sp.completion
+    ci.sync(sp)
+
+    lines = {}
+
+    for i, e in enumerate(ci.entries):
+        if e:
+            lines.setdefault(e, []).append(i)
+
+    assert sorted(ci.lineLists.keys()) == sorted(lines.keys())
+
+    for e in lines:
+        assert ci.getLines(e) == lines[e]
+
+def testLineLists():
+    sp = u.load("../sample.trelby")
+    checkLines(sp)
+
+    # enough edits between checks to go past MAX_SHIFTS
+    u.randomEdits(sp, 5, 100, lambda sp: sp.completion.sync(sp))
+    checkLines(sp)
+
+    u.randomEdits(sp, 6, 30, checkLines)
@@ -0,0 +1,258 @@
+import StringIO
+import os
+import shutil
+import sys
+import tempfile
+
+import batch
+import error
+import myimport
+import screenplay as scr
+import u
+
+# tests for the headless batch converter and importers
+
+def withTempDir(func):
+    tmp = tempfile.mkdtemp()
+
+    try:
+        func(tmp)
+    finally:
+        shutil.rmtree(tmp)
+
+# run batch.main with given arguments and return (exit status, output).
+def run(*args):
+    out = StringIO.StringIO()
+    sys.stdout = sys.stderr = out
+
+    try:
+        ret = batch.main(list(args))
+    except SystemExit, e:
+        # usage errors
+        ret = e.code
+    finally:
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+
+    return (ret, out.getvalue())
+
+def elems(sp):
+    return sp.getElementsAsList()
+
+def testConvert():
+    u.init()
+    batch.init()
+
+    def func(tmp):
+        sp = u.load("../sample.trelby")
+
+        for fmt in batch.OUTPUT_FORMATS:
+            fn = os.path.join(tmp, "sample." + fmt)
+            res = batch.convert(("../sample.trelby", fn, fmt))
+
+            assert res[0] == "../sample.trelby"
+            assert res[1] == fn
+            assert res[3] is None
+            assert os.path.getsize(fn) > 0
+
+        assert open(os.path.join(tmp, "sample.pdf"), "rb").read() == \
+            sp.generatePDF(True)
+
+        sp2 = batch.loadScript(os.path.join(tmp, "sample.trelby"))
+        assert sp2.save() == sp.save()
+
+        sp2 = batch.loadScript(os.path.join(tmp, "sample.fdx"))
+        assert elems(sp2) == elems(sp)
+
+        # line types are guessed from the indentation, so only the texts
+        # are sure to survive
+        sp2 = batch.loadScript(os.path.join(tmp, "sample.txt"))
+        assert [s for lt, s in elems(sp2)] == [s for lt, s in elems(sp)]
+
+        res = batch.convert((os.path.join(tmp, "none.fdx"),
+                             os.path.join(tmp, "none.pdf"), "pdf"))
+        assert res[3] == "No such file or directory"
+
+    withTempDir(func)
+
+def testMain():
+    u.init()
+
+    def func(tmp):
+        indir = os.path.join(tmp, "in")
+        os.mkdir(indir)
+        shutil.copy("../sample.trelby", indir)
+        shutil.copy("../short.trelby", indir)
+        open(os.path.join(indir, "foo.doc"), "w").write("foo")
+
+        outdir = os.path.join(tmp, "out")
+
+        ret, out = run("-j", "2", "-f", "fdx", "-o", outdir, indir)
+        assert ret == 0
+        assert sorted(os.listdir(outdir)) == ["sample.fdx", "short.fdx"]
+        assert "sample.trelby -> %s/sample.fdx: " % outdir in out
+        assert "2 files converted, 0 failed" in out
+
+        assert run("-j", "1", "-f", "fountain", outdir)[0] == 0
+        assert sorted(os.listdir(outdir)) == [
+            "sample.fdx", "sample.fountain", "short.fdx", "short.fountain"]
+
+        bad = os.path.join(indir, "bad.fdx")
+        open(bad, "w").write("<FinalDraft>")
+
+        ret, out = run("-f", "pdf", bad)
+        assert ret == 1
+        assert "bad.fdx: Error parsing file" in out
+
+        # nonexistent paths are reported before converting anything
+        none = os.path.join(tmp, "none")
+        ret, out = run("-f", "pdf", bad, none)
+        assert ret == 2
+        assert ("'%s': No such file or directory" % none) in out
+        assert "files converted" not in out
+
+    withTempDir(func)
+
+def parseError(func, data):
+    try:
+        func(data)
+    except error.MiscError, e:
+        return str(e)
+
+    assert 0
+
+def testParseErrors():
+    u.init()
+
+    for func in batch.INPUT_FORMATS.values():
+        if func:
+            assert parseError(func, "") == "File is empty."
+
+    assert parseError(myimport.parseFDX, "<a>").startswith(
+        "Error parsing file")
+    assert parseError(myimport.parseFDX, "<a></a>") == \
+        "The file contains no importable lines"
+    assert parseError(myimport.parseCeltx, "foo") == \
+        "File is not a valid Celtx script file."
+    assert parseError(myimport.parseTextFile, "\n  \n") == \
+        "File contains only empty lines."
+
+def testParseText():
+    u.init()
+
+    lines = myimport.parseTextFile(
+        "INT. HOUSE - DAY\n\nJoe walks in.\n\n"
+        "                    JOE\n          Hello.\n")
+
+    assert [(ln.lt, ln.text) for ln in lines] == [
+        (scr.SCENE, "INT. HOUSE - DAY"),
+        (scr.ACTION, "Joe walks in."),
+        (scr.CHARACTER, "JOE"),
+        (scr.DIALOGUE, "Hello.")]
+
+def testParseFountain():
+    u.init()
+
+    data = ("Title: Foo\r\nAuthor: Bar\r\n\r\n"
+            "INT. HOUSE - DAY\r\n\r\n"
+            "Joe walks /* this is\r\ncut */in.\r\n\r\n"
+            "JOE\r\nHello /* and */there.\r\n")
+
+    lines = myimport.parseFountain(data, importTitles = False)
+
+    assert [(ln.lt, ln.text) for ln in lines] == [
+        (scr.SCENE, "INT. HOUSE - DAY"),
+        (scr.ACTION, "Joe walks in."),
+        (scr.CHARACTER, "JOE"),
+        (scr.DIALOGUE, "Hello there.")]
+
+    # parsing from a file gives the same
+    lines2 = myimport.parseFountainFile(StringIO.StringIO(data),
+                                        importTitles = False)
+    assert [str(ln) for ln in lines2] == [str(ln) for ln in lines]
+
+    # unterminated boneyard is left alone
+    assert list(myimport.removeBoneyard(["a /* b", "c", "d */ e /* f"])) == \
+        ["a  e /* f"]
+    assert list(myimport.removeBoneyard(["a /* b", "c"])) == \
+        ["a /* b", "c"]
+
+def testFountainRoundTrip():
+    u.init()
+    batch.init()
+
+    def func(tmp):
+        sp = u.genScript(20)
+        fn = os.path.join(tmp, "gen.fountain")
+
+        batch.saveScript(sp, fn, "fountain")
+        assert open(fn, "rb").read() == sp.generateFountain()
+
+        # shots are imported as action, as Fountain doesn't have them
+        sp2 = batch.loadScript(fn)
+        assert [s for lt, s in elems(sp2)] == [s for lt, s in elems(sp)]
+
+        sp3 = u.new()
+        sp3.lines = myimport.parseFountain(sp.generateFountain(),
+            actionWidth = sp.cfg.getType(scr.ACTION).width)
+        sp3.reformatAll()
+        assert elems(sp2) == elems(sp3)
+
+    withTempDir(func)
+
+def testParseFDX():
+    u.init()
+
+    data = """<?xml version="1.0" encoding="UTF-8"?>
+<FinalDraft DocumentType="Script" Version="1">
+  <Content>
+    <Paragraph Type="Scene Heading">
+      <Text Revision="1">INT. HOUSE</Text><Text> - DAY</Text>
+    </Paragraph>
+    <Paragraph Type="Action">
+      <ScriptNote ID="1">
+        <Paragraph><Text AdornmentStyle="0">A note.</Text></Paragraph>
+        <Paragraph><Text>More.</Text></Paragraph>
+      </ScriptNote>
+      <Text>Joe walks in.</Text>
+    </Paragraph>
+    <Paragraph Type="General">
+      <DualDialogue>
+        <Paragraph Type="Character"><Text>JOE</Text></Paragraph>
+        <Paragraph Type="Dialogue"><Text>Hi.</Text></Paragraph>
+      </DualDialogue>
+    </Paragraph>
+  </Content>
+  <TitlePage>
+    <Content>
+      <Paragraph Type="Action"><Text>Not imported</Text></Paragraph>
+    </Content>
+  </TitlePage>
+</FinalDraft>"""
+
+    lines = myimport.parseFDX(data)
+
+    assert [(ln.lb, ln.lt, ln.text) for ln in lines] == [
+        (scr.LB_LAST, scr.SCENE, "INT. HOUSE - DAY"),
+        (scr.LB_FORCED, scr.NOTE, "A note."),
+        (scr.LB_LAST, scr.NOTE, "More."),
+        (scr.LB_LAST, scr.ACTION, "Joe walks in."),
+        (scr.LB_LAST, scr.CHARACTER, "JOE"),
+        (scr.LB_LAST, scr.DIALOGUE, "Hi.")]
+
+def testFDXRoundTrip():
+    u.init()
+    batch.init()
+
+    def func(tmp):
+        sp = u.genScript(20)
+        sp.lines.insert(1, scr.Line(scr.LB_LAST, scr.NOTE, "A <note> & \xe4"))
+        fn = os.path.join(tmp, "gen.fdx")
+
+        batch.saveScript(sp, fn, "fdx")
+        assert open(fn, "rb").read() == sp.generateFDX()
+
+        sp2 = batch.loadScript(fn)
+        assert elems(sp2) == elems(sp)
+
+    withTempDir(func)
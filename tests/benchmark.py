@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# ut:ignore
+
+# headless benchmarks of the operations whose speed matters the most, run
+# on generated scripts of various lengths. results are printed, and can
+# also be written to a JSON or CSV file so that they can be compared
+# between versions. note that this is not part of the normal test run,
+# this has to be run manually:
+#
+#  $ cd tests
+#  $ python benchmark.py -o results.json
+#  $ python benchmark.py -p 10,100 -b paginate,exportPDF -o results.csv
+
+import copy
+import csv
+import json
+import optparse
+import platform
+import StringIO
+import sys
+import time
+import timeit
+
+# FIXME
+sys.path.insert(0, "../src")
+
+import characterreport
+import locationreport
+import misc
+import myimport
+import mypager
+import scenereport
+import screenplay
+import scriptreport
+import search
+import u
+
+# the benchmarks. each one is a function that is given the script to run
+# on, does any preparation needed, and returns a function to time. the
+# script must not be modified; benchmarks that modify it take a copy.
+benchmarks = []
+
+def benchmark(func):
+    name = func.__name__[len("bench"):]
+    benchmarks.append((name[0].lower() + name[1:], func))
+
+    return func
+
+@benchmark
+def benchSave(sp):
+    return sp.save
+
+@benchmark
+def benchLoad(sp):
+    s = sp.save()
+
+    return lambda: u.loadString(s)
+
+@benchmark
+def benchReformatAll(sp):
+    sp = copy.deepcopy(sp)
+
+    return sp.reformatAll
+
+@benchmark
+def benchPaginate(sp):
+    sp = copy.deepcopy(sp)
+
+    return sp.paginate
+
+@benchmark
+def benchGeneratePMLPage(sp):
+    # all pages, not going through the page cache
+    def func():
+        pager = mypager.Pager(sp.cfg)
+
+        for i in xrange(1, len(sp.pages)):
+            sp.generatePMLPage(pager, i, True, True)
+
+    return func
+
+@benchmark
+def benchExportPDF(sp):
+    sp = copy.deepcopy(sp)
+    sp.paginate()
+
+    def func():
+        sp.pageCache = screenplay.PageCache()
+        sp.generatePDF(True)
+
+    return func
+
+@benchmark
+def benchExportFDX(sp):
+    return sp.generateFDX
+
+@benchmark
+def benchImportFDX(sp):
+    s = sp.generateFDX()
+
+    return lambda: myimport.parseFDXFile(StringIO.StringIO(s))
+
+@benchmark
+def benchExportFountain(sp):
+    return sp.generateFountain
+
+@benchmark
+def benchImportFountain(sp):
+    s = sp.generateFountain()
+
+    return lambda: myimport.parseFountainFile(StringIO.StringIO(s))
+
+# return function calling 'func' with sp's cached statistics thrown
+# away first, so that reports get timed including gathering those.
+def uncached(sp, func):
+    def wrapper():
+        sp.stats = None
+
+        return func()
+
+    return wrapper
+
+@benchmark
+def benchCharacterReport(sp):
+    return uncached(sp,
+        lambda: characterreport.CharacterReport(sp).generate())
+
+@benchmark
+def benchLocationReport(sp):
+    return uncached(sp, lambda: locationreport.LocationReport(
+        scenereport.SceneReport(sp)).generate())
+
+@benchmark
+def benchSceneReport(sp):
+    return uncached(sp, lambda: scenereport.SceneReport(sp).generate())
+
+@benchmark
+def benchScriptReport(sp):
+    return uncached(sp, lambda: scriptreport.ScriptReport(sp).generate())
+
+# 100 edits spread over the script, then undoing and redoing all of them
+@benchmark
+def benchUndo(sp):
+    sp = copy.deepcopy(sp)
+    sp.paginate()
+
+    def func():
+        for i in xrange(100):
+            sp.line = (i * 7919) % len(sp.lines)
+            sp.column = 0
+
+            if i % 2:
+                sp.cmd("splitElement")
+            else:
+                sp.cmdChars("edit ")
+
+        sp.cmd("undo", count = 100)
+        sp.cmd("redo", count = 100)
+        sp.cmd("undo", count = 100)
+
+    return func
+
+# comparing against a version with every 500th line modified
+@benchmark
+def benchCompareScripts(sp):
+    sp2 = copy.deepcopy(sp)
+    sp2.paginate()
+
+    for i, line in enumerate(sp2.lines):
+        if (i % 500) == 0:
+            line.text = line.text.upper() + " CHANGED"
+
+    return lambda: sp.compareScripts(sp2)
+
+# replacing every "the" in the script, then undoing that
+@benchmark
+def benchReplaceAll(sp):
+    sp = copy.deepcopy(sp)
+    sp.paginate()
+
+    srch = search.Search("the", matchWhole = True)
+
+    def func():
+        srch.replaceAll(sp, "that")
+        sp.cmd("undo")
+
+    return func
+
+# auto-completing a transition at the end of the script
+@benchmark
+def benchAutoComplete(sp):
+    sp = copy.deepcopy(sp)
+    sp.line = len(sp.lines) - 1
+    sp.getMatchingText("", screenplay.TRANSITION)
+
+    def func():
+        for i in xrange(100):
+            sp.getMatchingText("FADE I", screenplay.TRANSITION)
+
+    return func
+
+# time func 'repeat' times and return a list of the times taken, in
+# seconds.
+def timeFunc(func, repeat):
+    ret = []
+
+    for i in xrange(repeat):
+        t = timeit.default_timer()
+        func()
+        ret.append(timeit.default_timer() - t)
+
+    return ret
+
+# run the named benchmarks on scripts of each of the page counts in
+# 'pageCounts', and return the results as a list of dictionaries.
+def run(names, pageCounts, repeat, seed):
+    ret = []
+
+    for pages in pageCounts:
+        sp = u.genScript(pages, seed)
+
+        for name, bench in benchmarks:
+            if name not in names:
+                continue
+
+            times = timeFunc(bench(sp), repeat)
+            times.sort()
+
+            res = {
+                "benchmark" : name,
+                "pages" : pages,
+                "actualPages" : len(sp.pages) - 1,
+                "lines" : len(sp.lines),
+                "repeat" : repeat,
+                "min" : times[0],
+                "median" : times[len(times) // 2],
+                "mean" : sum(times) / len(times),
+                "max" : times[-1]
+                }
+
+            ret.append(res)
+
+            print "%-18s %5d pages: min %9.4f s, median %9.4f s" % (
+                name, pages, res["min"], res["median"])
+
+    return ret
+
+# fields of each result, in the order they are written in as CSV
+FIELDS = ["benchmark", "pages", "actualPages", "lines", "repeat", "min",
+          "median", "mean", "max"]
+
+# write results to 'fileName', as CSV if it ends in ".csv" and as JSON
+# otherwise, along with information about the environment they were
+# produced in.
+def save(fileName, results, seed):
+    f = open(fileName, "wb")
+
+    try:
+        if fileName.lower().endswith(".csv"):
+            w = csv.writer(f)
+            w.writerow(FIELDS)
+
+            for res in results:
+                w.writerow([res[fl] for fl in FIELDS])
+        else:
+            json.dump({
+                "version" : misc.version,
+                "python" : platform.python_version(),
+                "platform" : platform.platform(),
+                "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "seed" : seed,
+                "results" : results
+                }, f, indent = 1, sort_keys = True)
+            f.write("\n")
+    finally:
+        f.close()
+
+def main():
+    allNames = [name for name, bench in benchmarks]
+
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-p", "--pages", default = "10,100,1000",
+        help = "comma-separated page counts of the scripts to use"
+        " (default: %default)")
+    parser.add_option("-b", "--benchmarks", default = ",".join(allNames),
+        help = "comma-separated names of the benchmarks to run"
+        " (default: all, which are %default)")
+    parser.add_option("-r", "--repeat", type = "int", default = 3,
+        help = "how many times to run each benchmark (default: %default)")
+    parser.add_option("-s", "--seed", type = "int", default = 0,
+        help = "random seed for generating the scripts (default: %default)")
+    parser.add_option("-o", "--output",
+        help = "file to write results to, as CSV if its name ends in"
+        " .csv and as JSON otherwise")
+
+    opts, args = parser.parse_args()
+
+    names = opts.benchmarks.split(",")
+
+    for name in names:
+        if name not in allNames:
+            parser.error("unknown benchmark '%s'" % name)
+
+    try:
+        pageCounts = [int(s) for s in opts.pages.split(",")]
+    except ValueError:
+        parser.error("invalid page counts '%s'" % opts.pages)
+
+    if opts.repeat < 1:
+        parser.error("invalid repeat count %d" % opts.repeat)
+
+    u.init()
+
+    results = run(names, pageCounts, opts.repeat, opts.seed)
+
+    if opts.output:
+        save(opts.output, results, opts.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import viewmode
+
+# tests for the LRU cache of rendered bitmaps
+
+def testLRU():
+    calls = []
+
+    def render(s, color):
+        calls.append(s)
+
+        if s.strip():
+            return (s, color)
+        else:
+            return None
+
+    bc = viewmode.BitmapCache(render)
+    bc.MAX_BITMAPS = 3
+
+    assert bc.get(("a", (0, 0, 0))) == ("a", (0, 0, 0))
+    assert bc.get(("b", (0, 0, 0))) == ("b", (0, 0, 0))
+    assert bc.get((" ", (0, 0, 0))) is None
+    assert calls == ["a", "b", " "]
+
+    # hits, including ones for empty results, don't render again
+    assert bc.get(("a", (0, 0, 0))) == ("a", (0, 0, 0))
+    assert bc.get((" ", (0, 0, 0))) is None
+    assert calls == ["a", "b", " "]
+
+    # the least recently used item gets evicted
+    bc.get(("c", (0, 0, 0)))
+    assert len(bc.bitmaps) == 3
+    bc.get(("a", (0, 0, 0)))
+    bc.get(("b", (0, 0, 0)))
+    assert calls == ["a", "b", " ", "c", "b"]
+
+    # colour is part of the key
+    assert bc.get(("a", (1, 2, 3))) == ("a", (1, 2, 3))
@@ -0,0 +1,20 @@
+import screenplay as scr
+import u
+
+# tests for the generator of scripts used by benchmark.py
+
+def testGenerate():
+    sp = u.genScript(20)
+    sp._validate()
+
+    assert len(sp.pages) - 1 >= 20
+
+    types = set([ln.lt for ln in sp.lines])
+
+    for lt in (scr.SCENE, scr.ACTION, scr.CHARACTER, scr.DIALOGUE,
+               scr.PAREN, scr.TRANSITION):
+        assert lt in types
+
+    # the same parameters always give the same script
+    assert u.genScript(20).save() == sp.save()
+    assert u.genScript(20, 1).save() != sp.save()
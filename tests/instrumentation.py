@@ -0,0 +1,134 @@
+import csv
+import json
+import os
+import tempfile
+
+import batch
+import instrument
+import u
+
+# tests for the instrumentation of hot paths
+
+def run(func):
+    instrument.enable(None)
+
+    try:
+        func()
+    finally:
+        instrument.disable()
+
+def testBuckets():
+    assert instrument.getBucket(0.0) == 0
+    assert instrument.getBucket(0.000001) == 0
+    assert instrument.getBucket(0.000002) == 1
+    assert instrument.getBucket(0.000003) == 2
+    assert instrument.getBucket(0.001) == 10
+    assert instrument.getBucket(1000.0) == instrument.BUCKETS - 1
+
+    for i in range(instrument.BUCKETS - 1):
+        assert instrument.getBucket(instrument.bucketBounds[i]) == i
+
+def testStats():
+    st = instrument.Stats()
+
+    for t in [0.001] * 90 + [0.1] * 10:
+        st.add(t)
+
+    d = st.asDict()
+    assert d["calls"] == 100
+    assert d["min"] == 0.001
+    assert d["max"] == 0.1
+    assert abs(d["total"] - 1.09) < 1e-9
+    assert sum(d["histogram"]) == 100
+
+    # percentiles are bucket upper bounds, capped to the maximum
+    assert 0.001 <= d["p50"] < 0.002
+    assert 0.001 <= d["p90"] < 0.002
+    assert d["p99"] == 0.1
+
+def testTimed():
+    def func():
+        sp = u.load("../sample.trelby")
+        sp.paginate()
+        sp.generatePDF(True)
+
+        st = instrument.getStats()
+
+        assert st["Screenplay.paginate"]["calls"] == 2
+        assert st["Screenplay.generatePMLPage"]["calls"] == \
+               (len(sp.pages) - 1)
+        assert st["PDFExporter.generate"]["calls"] == 1
+
+    run(func)
+
+    # nothing is recorded when disabled
+    u.load("../sample.trelby").paginate()
+    assert instrument.getStats() == {}
+
+def testDump():
+    def func():
+        u.load("../sample.trelby")
+
+        fd, fileName = tempfile.mkstemp(".json")
+        os.close(fd)
+
+        try:
+            instrument.dump(fileName)
+            d = json.load(open(fileName))
+
+            assert len(d["buckets"]) == (instrument.BUCKETS - 1)
+            assert d["functions"]["Screenplay.paginate"]["calls"] == 1
+
+            os.rename(fileName, fileName + ".csv")
+            fileName += ".csv"
+
+            instrument.dump(fileName)
+            rows = list(csv.reader(open(fileName, "rb")))
+
+            assert len(rows[0]) == 9 + instrument.BUCKETS
+            assert [r[0] for r in rows[1:]] == sorted(instrument.stats)
+
+            for r in rows[1:]:
+                assert len(r) == len(rows[0])
+        finally:
+            os.remove(fileName)
+
+    run(func)
+
+def testTakeStats():
+    def func():
+        u.load("../sample.trelby")
+        u.load("../sample.trelby")
+
+        st = instrument.takeStats()
+        assert instrument.getStats() == {}
+        assert st["Screenplay.paginate"].count == 2
+
+        # what a worker process would record
+        u.load("../sample.trelby").paginate()
+
+        instrument.addStats(st)
+        d = instrument.getStats()["Screenplay.paginate"]
+        assert d["calls"] == 4
+        assert sum(d["histogram"]) == 4
+
+    run(func)
+
+def testBatch():
+    def func():
+        fd, fileName = tempfile.mkstemp(".pdf")
+        os.close(fd)
+
+        try:
+            batch.init()
+            res = batch.convert(("../sample.trelby", fileName, "pdf"))
+        finally:
+            os.remove(fileName)
+
+        # conversions return their stats, for the main process to add to
+        # its own
+        assert res[3] is None
+        assert res[4]["PDFExporter.generate"].count == 1
+        assert instrument.getStats() == {}
+
+    run(func)
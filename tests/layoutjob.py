@@ -0,0 +1,112 @@
+import copy
+
+import error
+import screenplay as scr
+import u
+import util
+
+# tests for running layout jobs in a background thread
+
+# run job in a BackgroundTask and return the task.
+def runJob(job, cancel = False):
+    task = util.BackgroundTask(job.run)
+
+    if cancel:
+        task.cancel()
+
+    task.start()
+    assert task.wait(60)
+
+    return task
+
+def testPaginate():
+    sp = u.load("../sample.trelby")
+    sp.cmd("moveDown", count = 50)
+    sp.cmdChars("some text that will wrap onto a new line " * 5)
+
+    job = scr.LayoutJob(sp, False)
+    runJob(job).getResult()
+    assert job.apply()
+
+    sp2 = copy.deepcopy(sp)
+    sp2.paginate()
+
+    assert sp.pages == sp2.pages
+    assert sp.pagesNoAdjust == sp2.pagesNoAdjust
+
+    # nothing should be left to do
+    assert not sp.pgDirty.isSet()
+
+def testApplyCfg():
+    sp = u.load("../sample.trelby")
+    sp2 = copy.deepcopy(sp)
+
+    cfg = copy.deepcopy(sp.cfg)
+    cfg.getType(scr.ACTION).width = 40
+    cfg.getType(scr.DIALOGUE).width = 25
+
+    job = scr.LayoutJob(sp, True, cfg)
+    runJob(job).getResult()
+
+    # the script isn't touched until the results are applied
+    assert sp.cfg.getType(scr.ACTION).width != 40
+
+    assert job.apply()
+
+    sp2.applyCfg(cfg)
+
+    assert sp.save() == sp2.save()
+    assert sp.pages == sp2.pages
+    assert (sp.line, sp.column) == (sp2.line, sp2.column)
+    assert sp.hasChanged
+
+def testProgress():
+    sp = u.load("../sample.trelby")
+    fractions = []
+
+    def progress(done, total):
+        fractions.append(float(done) / total)
+
+    scr.LayoutJob(sp, True).run(progress)
+
+    assert len(fractions) > 2
+    assert fractions == sorted(fractions)
+    assert fractions[-1] > 0.9
+
+def testCancel():
+    sp = u.load("../sample.trelby")
+    pages = sp.pages[:]
+
+    job = scr.LayoutJob(sp, True)
+    task = runJob(job, True)
+
+    try:
+        task.getResult()
+        assert 0
+    except error.CancelledError:
+        pass
+
+    assert sp.pages == pages
+
+def testModified():
+    sp = u.load("../sample.trelby")
+
+    job = scr.LayoutJob(sp, False)
+    runJob(job).getResult()
+
+    sp.cmdChars("a")
+    assert not job.apply()
+
+def testError():
+    def func(progress):
+        raise error.MiscError("foo")
+
+    task = util.BackgroundTask(func)
+    task.start()
+    task.wait()
+
+    try:
+        task.getResult()
+        assert 0
+    except error.MiscError, e:
+        assert str(e) == "foo"
@@ -0,0 +1,83 @@
+import copy
+
+import screenplay as scr
+import u
+
+# tests for LineStore
+
+def lines():
+    return [scr.Line(scr.LB_LAST, scr.SCENE, "INT. ROOM - DAY"),
+            scr.Line(scr.LB_SPACE, scr.ACTION, "Some"),
+            scr.Line(scr.LB_LAST, scr.ACTION, "action."),
+            scr.Line(scr.LB_LAST, scr.CHARACTER, "BOB")]
+
+def same(a, b):
+    return [str(ln) for ln in a] == [str(ln) for ln in b]
+
+def testLine():
+    ln = scr.Line(scr.LB_LAST, scr.ACTION, "foo")
+
+    # Line has no instance dictionary
+    try:
+        ln.foo = 1
+        assert 0
+    except AttributeError:
+        pass
+
+def testAccess():
+    ls = scr.LineStore(lines())
+
+    assert len(ls) == 4
+    assert ls[0].text == "INT. ROOM - DAY"
+    assert ls[-1].lt == scr.CHARACTER
+    assert ls[1].lb == scr.LB_SPACE
+    assert same(ls, lines())
+    assert same(ls[1:3], lines()[1:3])
+    assert same(ls.toLines(), lines())
+
+    try:
+        ls[4]
+        assert 0
+    except IndexError:
+        pass
+
+    ls[3].text = "ALICE"
+    ls[3].lt = scr.DIALOGUE
+    assert ls[3].text == "ALICE"
+    assert ls[3].lt == scr.DIALOGUE
+
+def testModify():
+    ls = scr.LineStore(lines())
+    ref = lines()
+
+    for l in (ls, ref):
+        l[1:3] = [scr.Line(scr.LB_LAST, scr.SHOT, "CLOSE")]
+        l.insert(0, scr.Line(scr.LB_LAST, scr.NOTE, "note"))
+        l.append(scr.Line(scr.LB_LAST, scr.DIALOGUE, "Hi."))
+        l[0] = l[3]
+        del l[2]
+
+    assert same(ls, ref)
+
+def testDeepcopy():
+    ls = scr.LineStore(lines())
+    ls2 = copy.deepcopy(ls)
+
+    ls2[0].text = "changed"
+    assert ls[0].text == "INT. ROOM - DAY"
+
+# a script whose lines are in a LineStore must paginate and export the
+# same as one with a normal list.
+def testScreenplay():
+    sp = u.load("../sample.trelby")
+    sp2 = u.load("../sample.trelby")
+    sp2.lines = scr.LineStore(sp2.lines)
+    sp2.paginate()
+
+    assert sp.pages == sp2.pages
+    assert sp.generatePDF(True) == sp2.generatePDF(True)
+    assert sp.save() == sp2.save()
+
+    sp3 = copy.deepcopy(sp2)
+    assert isinstance(sp3.lines, scr.LineStore)
+    assert same(sp3.lines, sp.lines)
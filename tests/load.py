@@ -0,0 +1,79 @@
+import StringIO
+
+import config
+import error
+import screenplay as scr
+import u
+
+# tests for loading .trelby files
+
+def readAll(s, chunkSize):
+    lr = scr.LineReader(StringIO.StringIO(s))
+    lr.CHUNK_SIZE = chunkSize
+    ret = []
+
+    while 1:
+        ln = lr.next()
+
+        if ln is None:
+            break
+
+        ret.append(ln)
+
+    assert lr.lineNr == len(ret)
+
+    return ret
+
+def testLineReader():
+    for s in ["", "a", "a\n", "a\nb", "a\n\nb\n\n", "a\r\nb\rc\n", "\r\n\r",
+              "foo\r\n" * 10]:
+        for size in (1, 2, 3, 7, 65536):
+            assert readAll(s, size) == s.splitlines()
+
+def testPeek():
+    lr = scr.LineReader(StringIO.StringIO("a\nb\n"))
+
+    assert lr.peek() == "a"
+    assert lr.peek() == "a"
+    assert lr.lineNr == 0
+    assert lr.next() == "a"
+    assert lr.next() == "b"
+    assert lr.peek() is None
+    assert lr.next() is None
+    assert lr.lineNr == 2
+
+def testLoadFile():
+    u.init()
+
+    s = open("../sample.trelby", "rb").read()
+    sp = u.loadString(s)
+
+    sp2 = scr.Screenplay.loadFile(open("../sample.trelby", "rb"),
+                                  config.ConfigGlobal())[0]
+    assert sp2.save() == sp.save()
+    assert sp2.pages == sp.pages
+
+    sp3 = u.loadString(s.replace("\n", "\r\n"))
+    assert sp3.save() == sp.save()
+
+def loadError(s):
+    try:
+        u.loadString("\xef\xbb\xbf" + s)
+    except error.MiscError, e:
+        return str(e)
+
+    assert 0
+
+def testErrors():
+    assert loadError("#Version 3\n") == \
+        "File has too few lines to be a valid\nscreenplay file."
+    assert loadError("#Version 3\n#Begin-Config \nfoo\n") == \
+        "#End-Config not found"
+    assert loadError("#Version 3\n#Start-Script \n.\\ok\nx\n") == \
+        "Line 4 is too short."
+    assert loadError("#Version 3\n#Start-Script \n#bad\n") == \
+        "Line 3 has invalid syntax for\nconfig line."
+    assert loadError("#Version 3\n#Start-Script \n>\\foo\n.:bar\n") == \
+        "Line 4 has invalid element type."
+    assert loadError("#Version 3\n#Start-Script \n>\\foo\n") == \
+        "Last line doesn't end an element."
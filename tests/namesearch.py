@@ -0,0 +1,88 @@
+import StringIO
+
+import namearray
+import namesdlg
+import u
+import util
+
+# tests for the character name database search index
+
+def load():
+    u.init()
+
+    return namesdlg.parseNames(open("../names.txt").read())
+
+# what NamesDlg.OnSearch used to do, without the sex and type filters
+def searchSlow(na, s, mode):
+    ret = []
+
+    for i in xrange(na.count):
+        name = util.lower(na.name[i])
+
+        if (mode == namearray.BEGINS) and not name.startswith(s):
+            continue
+        elif (mode == namearray.CONTAINS) and (name.find(s) == -1):
+            continue
+        elif (mode == namearray.ENDS) and not name.endswith(s):
+            continue
+
+        ret.append(i)
+
+    return ret
+
+QUERIES = ("", "a", "jo", "son", "ann", "anna", "elle", "xyzzy", "\xe9",
+           "\xff", "z\xff")
+
+def testSearch():
+    na = load()
+    na.buildIndex()
+
+    for s in QUERIES:
+        for mode in (namearray.BEGINS, namearray.CONTAINS, namearray.ENDS):
+            ids = searchSlow(na, s, mode)
+
+            for sex in (None, 0, 1):
+                for types in (None, {0 : True, 5 : True}):
+                    res = [i for i in ids
+                           if ((sex is None) or (na.sex[i] == sex)) and
+                           ((types is None) or (na.type[i] in types))]
+
+                    assert na.search(s, mode, sex, types) == res
+
+def testPrefixRange():
+    keys = ["a", "ab", "ab\xff", "ab\xff\xff", "ac", "b", "\xff", "\xff\xff"]
+
+    for s in ["", "a", "ab", "ab\xff", "b", "\xff", "c"]:
+        lo, hi = util.prefixRange(keys, s)
+
+        assert keys[lo:hi] == [k for k in keys if k.startswith(s)]
+
+def testSaveLoad():
+    na = load()
+    na.buildIndex()
+
+    f = StringIO.StringIO()
+    na.save(f, ("names.txt", 1, 2))
+
+    f.seek(0)
+    assert namearray.NameArray.load(f, ("names.txt", 1, 3)) is None
+
+    f.seek(0)
+    na2 = namearray.NameArray.load(f, ("names.txt", 1, 2))
+
+    assert na2.name == na.name[:na.count]
+    assert na2.type == na.type[:na.count]
+    assert na2.sex == na.sex[:na.count]
+    assert na2.typeNamesById == na.typeNamesById
+    assert na2.typeNamesCnt == na.typeNamesCnt
+    assert na2.typeId == na.typeId
+
+    for s in QUERIES:
+        for mode in (namearray.BEGINS, namearray.CONTAINS, namearray.ENDS):
+            assert na2.search(s, mode, 1, {3 : True}) == \
+                   na.search(s, mode, 1, {3 : True})
+
+    # broken files are ignored
+    for data in ("", "foo", f.getvalue()[:-10]):
+        assert namearray.NameArray.load(StringIO.StringIO(data),
+                                        ("names.txt", 1, 2)) is None
@@ -0,0 +1,93 @@
+import copy
+
+import mypager
+import screenplay as scr
+import u
+
+# tests for the PML page cache
+
+# return a comparable description of a pml.Page.
+def describe(pg):
+    ret = []
+
+    for op in pg.ops:
+        d = dict(op.__dict__)
+
+        if d.get("toc"):
+            d["toc"] = d["toc"].text
+
+        ret.append((op.__class__.__name__, sorted(d.items())))
+
+    return ret
+
+# check that all pages of sp come out the same from the cache and
+# generatePMLPage.
+def check(sp, forPDF, doExtra):
+    pager = mypager.Pager(sp.cfg)
+    pager2 = mypager.Pager(sp.cfg)
+
+    for i in xrange(1, len(sp.pages)):
+        pg = sp.getPMLPage(pager, i, forPDF, doExtra)
+        pg2 = sp.generatePMLPage(pager2, i, forPDF, doExtra)
+
+        assert describe(pg) == describe(pg2)
+        assert pager.scene == pager2.scene
+        assert pager.sceneContNr == pager2.sceneContNr
+
+    assert [t.text for t in pager.doc.tocs] == \
+           [t.text for t in pager2.doc.tocs]
+
+def testHits():
+    sp = u.load("../sample.trelby")
+    count = [0]
+    orig = sp.generatePMLPage
+
+    def gen(*args):
+        count[0] += 1
+
+        return orig(*args)
+
+    sp.generatePMLPage = gen
+
+    pdf = sp.generatePDF(True)
+    assert count[0] == (len(sp.pages) - 1)
+
+    assert sp.generatePDF(True) == pdf
+    assert count[0] == (len(sp.pages) - 1)
+
+    # editing one line only regenerates its page
+    sp.cmd("moveDown", count = 30)
+    sp.cmdChars("x")
+    sp.paginate(True)
+    sp.generatePDF(True)
+    assert count[0] == (len(sp.pages) - 1) + 1
+
+def testEdits():
+    sp = u.load("../sample.trelby")
+    sp.cfg.pdfIncludeTOC = True
+    sp.cfg.pdfShowSceneNumbers = True
+
+    for forPDF, doExtra in ((True, True), (False, True), (False, False)):
+        check(sp, forPDF, doExtra)
+
+    u.randomEdits(sp, 1, 30, lambda sp: sp.paginate(True))
+
+    for forPDF, doExtra in ((True, True), (False, True), (False, False)):
+        check(sp, forPDF, doExtra)
+
+    sp2 = copy.deepcopy(sp)
+    sp2.paginate()
+
+    assert sp.generatePDF(True) == sp2.generatePDF(True)
+
+def testModifyPage():
+    sp = u.load("../sample.trelby")
+    pager = mypager.Pager(sp.cfg)
+
+    pg = sp.getPMLPage(pager, 1, True, True)
+    ops = describe(pg)
+
+    pg.add(scr.pml.TextOp("foo", 0, 0, 12))
+    pg.addOpsToFront([scr.pml.TextOp("bar", 0, 0, 12)])
+
+    assert describe(sp.getPMLPage(pager, 1, True, True)) == ops
@@ -0,0 +1,77 @@
+import copy
+
+import screenplay as scr
+import u
+
+# tests that incremental pagination gives the same results as a full one
+
+# check that sp's pagination and line height index match a full
+# pagination of the script.
+def check(sp):
+    sp2 = copy.deepcopy(sp)
+    sp2.paginate()
+
+    assert sp.pages == sp2.pages
+    assert sp.pagesNoAdjust == sp2.pagesNoAdjust
+
+    spi = sp.spacingIndex
+
+    assert len(spi.heights) == len(sp.lines)
+    assert spi.heights.toList() == sp2.spacingIndex.heights.toList()
+
+# paginate sp incrementally and check the result.
+def paginateAndCheck(sp):
+    sp.paginate(True)
+    check(sp)
+
+def testNoChanges():
+    sp = u.load("../sample.trelby")
+    pages = sp.pages[:]
+
+    sp.paginate(True)
+    assert sp.pages == pages
+
+def testAddChars():
+    sp = u.load("../sample.trelby")
+
+    sp.cmd("moveDown", count = 100)
+    sp.cmdChars("some text that will wrap onto a new line " * 3)
+    sp.paginate(True)
+    check(sp)
+
+def testDeleteAll():
+    sp = u.load("../sample.trelby")
+
+    sp.cmd("selectAll")
+    sp.getSelectedAsCD(True)
+    sp.paginate(True)
+    check(sp)
+
+def testRemoveElementTypes():
+    sp = u.load("../sample.trelby")
+
+    sp.removeElementTypes({ scr.ACTION : None }, True)
+    sp.paginate(True)
+    check(sp)
+
+    sp.cmd("undo")
+    sp.paginate(True)
+    check(sp)
+
+def testSpacingIndex():
+    sp = u.load("../sample.trelby")
+    spi = sp.spacingIndex
+
+    # heights must match what getSpacingBefore says
+    h = 0
+    for i in xrange(1, len(sp.lines)):
+        h += 10 + sp.getSpacingBefore(i)
+        assert spi.getHeight(i) == h
+
+    assert spi.findPageEnd(len(sp.lines) - 1, 500) == len(sp.lines) - 1
+    assert spi.findPageEnd(0, 10) == 0
+
+def testRandom():
+    for seed in xrange(5):
+        u.randomEdits(u.load("../sample.trelby"), seed, 100,
+                      paginateAndCheck)
@@ -0,0 +1,96 @@
+import StringIO
+import multiprocessing
+
+import screenplay as scr
+import pdf
+import u
+import watermarkdlg
+
+# tests that parallel PDF generation gives the same output as serial
+
+def load():
+    sp = u.load("../sample.trelby")
+
+    sp.cfg.pdfIncludeTOC = True
+    sp.cfg.pdfShowSceneNumbers = True
+    sp.cfg.getType(scr.SCENE).export.isBold = True
+    sp.cfg.getType(scr.CHARACTER).export.isUnderlined = True
+
+    return sp
+
+def testParallel():
+    sp = load()
+    pool = multiprocessing.Pool(2)
+
+    try:
+        serial = pdf.generate(sp.generatePML(True))
+
+        # documents smaller than MIN_PARALLEL_PAGES are always done
+        # serially, so force the parallel path
+        old = pdf.PDFExporter.MIN_PARALLEL_PAGES
+        pdf.PDFExporter.MIN_PARALLEL_PAGES = 1
+
+        try:
+            parallel = pdf.generate(sp.generatePML(True), pool)
+        finally:
+            pdf.PDFExporter.MIN_PARALLEL_PAGES = old
+    finally:
+        pool.terminate()
+
+    assert parallel == serial
+
+def testWatermark():
+    sp = load()
+
+    # what WatermarkDlg used to do, generating the document each time
+    doc = sp.generatePML(True)
+    ops = watermarkdlg.addWatermark(doc, sp.cfg, u"Common", u"Mark",
+                                    40).pages[0].ops[:4]
+
+    for pg in doc.pages:
+        pg.addOpsToFront(ops)
+
+    doc.uniqueId = "0123456789abcdef"
+    old = pdf.generate(doc)
+
+    base = sp.generatePML(True)
+
+    for i in xrange(2):
+        wdoc = watermarkdlg.addWatermark(base, sp.cfg, u"Common", u"Mark", 40)
+        wdoc.uniqueId = "0123456789abcdef"
+
+        assert pdf.generate(wdoc) == old
+
+    # the base document is not modified
+    assert pdf.generate(base) == sp.generatePDF(True)
+
+# check that the xref table of PDF 's' points to the right objects.
+def checkXref(s):
+    start = int(s.rsplit("startxref\n", 1)[1].split("\n")[0])
+    lines = s[start:].split("\n")
+
+    assert lines[0] == "xref"
+    cnt = int(lines[1].split()[1])
+
+    for i in xrange(1, cnt):
+        pos = int(lines[2 + i].split()[0])
+        assert s[pos:].startswith("%d 0 obj\n" % i)
+
+def testGenerateTo():
+    sp = load()
+    doc = sp.generatePML(True)
+    doc.fonts[scr.pml.COURIER] = scr.pml.PDFFontInfo("Foo", "x" * 5000)
+
+    s = pdf.generate(doc)
+    checkXref(s)
+
+    out = StringIO.StringIO()
+    pdf.generateTo(doc, out)
+    assert out.getvalue() == s
+
+    # page contents are not kept around after being written out
+    pe = pdf.PDFExporter(doc)
+    pe.generateTo(StringIO.StringIO())
+
+    for obj in pe.pageContentObjs:
+        assert obj.data == ""
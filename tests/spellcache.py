@@ -0,0 +1,108 @@
+import spellcheck
+import u
+import util
+
+# tests for finding all misspelled words in a script
+
+def setup():
+    sp = u.load("../sample.trelby")
+
+    spellcheck.gdict.clear()
+
+    for w in open("../dict_en.dat").read().splitlines():
+        spellcheck.gdict[w] = None
+
+    # the sample script has no misspellings, so add some
+    sp.cmd("moveDown", count = 10)
+    sp.cmdChars("Teh quik Mrs. Smith ain't doin' nothin' ")
+    sp.cmdChars("123 fooo, barr-bazz! ")
+
+    gScDict = spellcheck.Dict()
+    gScDict.add("ain't")
+    sp.scDict.add("nothin'")
+
+    return sp, spellcheck.SpellChecker(sp, gScDict)
+
+# find all misspelled words one at a time, the way findNext used to
+def findSlow(sc):
+    ret = []
+    line = col = 0
+
+    while 1:
+        word, line, col = sc.sp.getWord(line, col)
+
+        if not word:
+            return ret
+
+        if not sc.isKnown(word):
+            ret.append((line, col, word))
+
+        col += len(word)
+
+def testFindAll():
+    sp, sc = setup()
+
+    res = sc.findAll()
+    assert [it[2] for it in res] == [
+        "Teh", "quik", "doin'", "fooo", "barr", "bazz"]
+    assert res == findSlow(sc)
+
+    # findNext goes through the same words
+    res2 = []
+    sc.line = sc.col = 0
+
+    while sc.findNext():
+        res2.append((sc.line, sc.col, sc.word))
+        sc.col += len(sc.word)
+
+    assert res2 == res
+
+    # adding words to the user's dictionaries works without clearing the
+    # cache
+    word = res[0][2]
+    sc.gScDict.add(word)
+
+    assert sc.findAll() == [it for it in res
+                            if util.lower(it[2]) != util.lower(word)]
+
+def testCache():
+    sp, sc = setup()
+    sc.findAll()
+
+    orig = spellcheck.findUnknownWords
+    calls = []
+
+    def find(s):
+        calls.append(s)
+
+        return orig(s)
+
+    spellcheck.findUnknownWords = find
+
+    try:
+        res = sc.findAll()
+        assert not calls
+
+        # only the changed line is checked again
+        sp.cmd("moveDown", count = 20)
+        sp.cmd("moveLineStart")
+        sp.cmdChars("xyzzy ")
+        line = sp.line
+
+        res2 = sc.findAll()
+
+        # the text may wrap onto the next lines, which are checked too
+        assert calls[0] == sp.lines[line].text
+        assert len(calls) < 4
+        assert res2 == findSlow(sc)
+        assert (line, 0, "xyzzy") in res2
+        assert len(res2) == len(res) + 1
+
+        # changing the global dictionary empties the cache
+        spellcheck.gdict["xyzzy"] = None
+        del calls[:]
+
+        assert sc.findAll() == res
+        assert len(calls) > 100
+    finally:
+        spellcheck.findUnknownWords = orig
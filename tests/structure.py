@@ -0,0 +1,103 @@
+import screenplay as scr
+import u
+
+# tests that the structure index gives the same answers as walking the
+# lines does
+
+# brute-force scene start and end lines for the given line.
+def sceneIndexes(sp, line):
+    ls = sp.lines
+    top = sp.getElemFirstIndexFromLine(line)
+
+    while (ls[top].lt not in (scr.SCENE, scr.ACTBREAK)) and (top > 0):
+        top = sp.getElemFirstIndexFromLine(top - 1)
+
+    bottom = sp.getElemLastIndexFromLine(line)
+
+    while ((bottom + 1) < len(ls)) and \
+              (ls[bottom + 1].lt not in (scr.SCENE, scr.ACTBREAK)):
+        bottom = sp.getElemLastIndexFromLine(bottom + 1)
+
+    return (top, bottom)
+
+# check that all structural queries agree with walking the lines, for
+# every line of sp.
+def check(sp):
+    ls = sp.lines
+    elems = 0
+    scene = 0
+    speaker = "UNKNOWN"
+    locs = []
+
+    assert sp.getSceneNumber(-1) == 0
+
+    for i in xrange(len(ls)):
+        ln = ls[i]
+
+        if (ln.lt == scr.SCENE) and sp.isFirstLineOfElem(i):
+            scene += 1
+            locs.append((str(scene), i))
+
+        if (ln.lt == scr.CHARACTER) and (ln.lb == scr.LB_LAST):
+            speaker = ln.text.upper()
+
+        assert sp.getSceneNumber(i) == scene
+        assert sp.getPrevSpeaker(i) == speaker
+        assert sp.getSceneIndexesFromLine(i) == sceneIndexes(sp, i)
+        assert sp.elemsDistance(0, i) == elems
+
+        if ln.lb == scr.LB_LAST:
+            elems += 1
+
+    assert sp.getSceneLocations() == locs
+
+def testLoad():
+    check(u.load("../sample.trelby"))
+
+def testNew():
+    check(u.new())
+
+def testDeleteAll():
+    sp = u.load("../sample.trelby")
+    check(sp)
+
+    sp.cmd("selectAll")
+    sp.getSelectedAsCD(True)
+    check(sp)
+
+def testRemoveElementTypes():
+    sp = u.load("../sample.trelby")
+    check(sp)
+
+    sp.removeElementTypes({ scr.SCENE : None }, True)
+    check(sp)
+
+    sp.cmd("undo")
+    check(sp)
+
+def testShiftArray():
+    arr = scr.ShiftArray([0, 2, 4, 6, 8])
+
+    arr.replace(1, 3, [1, 2, 3], 1)
+    assert arr.toList() == [0, 1, 2, 3, 7, 9]
+    assert arr.bisectRight(6) == 4
+    assert arr.bisectRight(7) == 5
+    assert arr.bisectRight(-1) == 0
+    assert arr.bisectRight(100) == 6
+
+    arr.replace(0, 0, [], 5)
+    assert arr.toList() == [5, 6, 7, 8, 12, 14]
+
+    arr.replace(4, 6, [], 0)
+    assert arr.toList() == [5, 6, 7, 8]
+
+    arr.applyFixups()
+    assert arr.toList() == [5, 6, 7, 8]
+    assert arr.fixPos == []
+
+def testRandom():
+    for seed in xrange(3):
+        sp = u.load("../sample.trelby")
+        check(sp)
+
+        u.randomEdits(sp, seed, 60, check)
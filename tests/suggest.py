@@ -0,0 +1,73 @@
+import spellcheck
+import u
+
+# tests for spelling suggestions
+
+def words():
+    return open("../dict_en.dat").read().splitlines()[::97]
+
+def testFind():
+    ws = words()
+    index = spellcheck.SuggestionIndex(ws)
+
+    for word in ["", "a", "teh", "chair", "hcair", "xylophne", "abcdefghij",
+                 ws[0], ws[-1], ws[100] + "s"]:
+        for maxDist in xrange(4):
+            res = [(d, w) for d, w in
+                   ((spellcheck.lev(word, w), w) for w in sorted(ws))
+                   if d <= maxDist]
+
+            assert index.find(word, maxDist) == res
+
+def testAdd():
+    index = spellcheck.SuggestionIndex(["b", "d"])
+
+    for w in ["c", "a", "e", "c", "\xff", "\xe9"]:
+        index.add(w)
+
+    assert index.words == ["a", "b", "c", "d", "e", "\xe9", "\xff"]
+
+    # skipping past prefixes ending in the last possible character
+    index = spellcheck.SuggestionIndex(["a\xffbcd", "a\xffbce", "b"])
+    assert index.find("b", 1) == [(0, "b")]
+
+def testDict():
+    u.init()
+
+    d = spellcheck.Dict()
+    d.add("Chair")
+    d.add("chairs")
+    d.add("cheer")
+
+    # typos in the first letters are found too
+    assert spellcheck.getSuggestions("hcair", [d]) == [(2, "chair")]
+    assert spellcheck.getSuggestions("hcair", [d], 5, 1) == []
+
+    d2 = spellcheck.Dict()
+    d2.set(["hair", "stair"])
+
+    assert spellcheck.getSuggestions("chairr", [d, d2], 3) == [
+        (1, "chairs"), (1, "chair"), (2, "hair")]
+
+    d2.load(d.save())
+    assert d2.index.words == ["chair", "chairs", "cheer"]
+
+def testGlobal():
+    u.init()
+
+    old = spellcheck.gindex
+    spellcheck.gindex = spellcheck.SuggestionIndex(["table", "cable"])
+
+    try:
+        d = spellcheck.Dict()
+        d.add("tables")
+
+        assert spellcheck.getSuggestions("tabel", [d]) == [
+            (2, "table"), (2, "tables")]
+        assert spellcheck.getSuggestions("tabel", [d], 1) == [(2, "table")]
+        assert spellcheck.getSuggestions("tabel", [d], 5, 1) == []
+
+        # distance 3 is only searched if nothing is closer
+        assert spellcheck.getSuggestions("tbxxe", [d]) == [(3, "table")]
+    finally:
+        spellcheck.gindex = old
@@ -0,0 +1,146 @@
+import copy
+import random
+
+import screenplay as scr
+import scriptdiff
+import u
+
+# tests comparing scripts
+
+# apply opcodes to a and check that gives b
+def checkOpcodes(a, b):
+    res = []
+    i = j = 0
+
+    for tag, i1, i2, j1, j2 in scriptdiff.getOpcodes(a, b):
+        assert (i1 == i) and (j1 == j)
+
+        if tag == scriptdiff.EQUAL:
+            assert a[i1:i2] == b[j1:j2]
+            res.extend(a[i1:i2])
+        else:
+            assert (i2 > i1) or (j2 > j1)
+            res.extend(b[j1:j2])
+
+        i, j = i2, j2
+
+    assert (i == len(a)) and (j == len(b))
+    assert res == b
+
+def testOpcodes():
+    checkOpcodes([], [])
+    checkOpcodes([], list("abc"))
+    checkOpcodes(list("abc"), [])
+
+    assert scriptdiff.getOpcodes(list("abxcd"), list("abycd")) == [
+        ("=", 0, 2, 0, 2), ("!", 2, 3, 2, 3), ("=", 3, 5, 3, 5)]
+
+    assert scriptdiff.getOpcodes(list("abcd"), list("acd")) == [
+        ("=", 0, 1, 0, 1), ("-", 1, 2, 1, 1), ("=", 2, 4, 1, 3)]
+
+    rnd = random.Random(5)
+
+    for i in xrange(300):
+        # few distinct items so there are lots of repeats, which are not
+        # used as anchors and so go through the Myers part
+        a = [rnd.randint(0, 4) for x in xrange(rnd.randint(0, 40))]
+        b = a[:]
+
+        for x in xrange(rnd.randint(0, 8)):
+            pos = rnd.randint(0, len(b))
+
+            if b and rnd.randint(0, 1):
+                del b[pos - 1]
+            else:
+                b.insert(pos, rnd.randint(0, 6))
+
+        checkOpcodes(a, b)
+
+def testMyersIsMinimal():
+    # no unique items, so this is all done by Myers' algorithm
+    a = list("abcabba")
+    b = list("cbabac")
+
+    assert len(scriptdiff.getMatches(a, b)) == 4
+
+def testDiffWords():
+    assert scriptdiff.diffWords("He runs home.", "He walks home!") == [
+        ("=", "He "), ("-", "runs"), ("+", "walks"), ("=", " home"),
+        ("-", "."), ("+", "!")]
+
+    assert scriptdiff.diffWords("", "foo") == [("+", "foo")]
+
+def testIdentical():
+    sp = u.load()
+    sp2 = copy.deepcopy(sp)
+
+    assert scriptdiff.compare(sp, sp2) == []
+    assert sp.compareScripts(sp2) is None
+
+    # rewrapping doesn't matter, only the elements' contents
+    sp2.cfg.getType(scr.ACTION).width = 40
+    sp2.reformatAll()
+
+    assert scriptdiff.compare(sp, sp2) == []
+
+# return index of the first line of sp's n'th element
+def firstLine(sp, n):
+    line = 0
+
+    for i in xrange(n):
+        line = sp.getElemLastIndexFromLine(line) + 1
+
+    return line
+
+def testChanges():
+    sp = u.load()
+    sp2 = copy.deepcopy(sp)
+
+    els = sp.getElementsAsList()
+
+    # change a word in the first dialogue element, delete the first
+    # action element after it and add a new element near the end.
+    dlg = [i for i, (lt, s) in enumerate(els) if lt == scr.DIALOGUE][0]
+    act = [i for i, (lt, s) in enumerate(els)
+           if (lt == scr.ACTION) and (i > dlg)][0]
+
+    line = firstLine(sp2, dlg)
+    text = sp2.lines[line].text
+    word = text.split()[0]
+    sp2.lines[line].text = text.replace(word, "Xyzzy", 1)
+
+    start, end = sp2.getElemIndexesFromLine(firstLine(sp2, act))
+    del sp2.lines[start:end + 1]
+
+    line = firstLine(sp2, len(els) - 3)
+    sp2.lines.insert(line, scr.Line(scr.LB_LAST, scr.NOTE, "New note."))
+
+    changes = scriptdiff.compare(sp, sp2)
+    assert [ch.kind for ch in changes] == [
+        scriptdiff.CHANGED, scriptdiff.DELETED, scriptdiff.ADDED]
+
+    ch = changes[0]
+    assert ch.lt == scr.DIALOGUE
+    assert (ch.oldIndex, ch.newIndex) == (dlg, dlg)
+    assert ("-", word) in ch.words
+    assert ("+", "Xyzzy") in ch.words
+
+    ch = changes[1]
+    assert ch.lt == scr.ACTION
+    assert (ch.oldIndex, ch.newIndex) == (act, act)
+    assert ch.oldText == els[act][1]
+
+    ch = changes[2]
+    assert (ch.lt, ch.newText) == (scr.NOTE, "New note.")
+    assert ch.newIndex == len(els) - 3
+
+    # scenes are numbered as in the new script
+    for ch in changes:
+        heads = [s for lt, s in sp2.getElementsAsList()[:ch.newIndex + 1]
+                 if lt == scr.SCENE]
+
+        assert ch.scene == len(heads)
+        assert ch.sceneName == heads[-1]
+
+    data = sp.compareScripts(sp2)
+    assert data[:8] == "%PDF-1.5"
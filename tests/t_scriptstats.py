@@ -0,0 +1,96 @@
+import characterreport
+import dialoguechart
+import locationreport
+import scenereport
+import screenplay as scr
+import scriptreport
+import scriptstats
+import u
+import util
+
+# tests script statistics the reports are built from
+
+def testLines():
+    sp = u.load()
+    st = sp.getStats()
+
+    assert st.getLineCount() == len(sp.lines)
+
+    for i, ln in enumerate(sp.lines):
+        assert st.lineTypes[i] == ln.lt
+        assert st.linePages[i] == sp.line2page(i)
+        assert st.scenes[st.lineScenes[i]].number == sp.getSceneNumber(i)
+        assert st.lineWords[i] == len(util.splitToWords(ln.text))
+
+        if st.lineSpeakers[i] != -1:
+            assert ln.lt in (scr.DIALOGUE, scr.PAREN)
+            assert st.speakers[st.lineSpeakers[i]].name == \
+                   util.upper(sp.getPrevSpeaker(i))
+
+    for ss in st.scenes:
+        start, end = sp.getSceneIndexesFromLine(ss.start)
+        assert start == ss.start
+
+    assert len(st.scenes) == len(set([sp.getSceneIndexesFromLine(i)
+                                      for i in xrange(len(sp.lines))]))
+
+    for lt, cnt in st.typeCounts.iteritems():
+        assert cnt == len([ln for ln in sp.lines if ln.lt == lt])
+
+def testSpeakers():
+    sp = u.new()
+    sp.lines = [
+        scr.Line(scr.LB_LAST, scr.SCENE, "INT. HOUSE - DAY"),
+        scr.Line(scr.LB_LAST, scr.CHARACTER, "Bob"),
+        scr.Line(scr.LB_SPACE, scr.DIALOGUE, "Hello there, my"),
+        scr.Line(scr.LB_LAST, scr.DIALOGUE, "friend."),
+        scr.Line(scr.LB_LAST, scr.PAREN, "(smiles)"),
+        scr.Line(scr.LB_LAST, scr.DIALOGUE, "Bye."),
+        scr.Line(scr.LB_LAST, scr.ACTION, "He leaves."),
+        scr.Line(scr.LB_LAST, scr.ACTION, "Silence."),
+        scr.Line(scr.LB_LAST, scr.SCENE, "EXT. STREET - NIGHT"),
+        scr.Line(scr.LB_LAST, scr.CHARACTER, "BOB"),
+        scr.Line(scr.LB_LAST, scr.DIALOGUE, "Again."),
+        ]
+    sp.paginate()
+
+    st = sp.getStats()
+
+    assert list(st.lineSpeakers) == [-1, -1, 0, 0, 0, 0, -1, -1, -1, -1, 0]
+    assert st.actionLengths == [1, 1]
+
+    ss = st.speakers[0]
+    assert len(st.speakers) == 1
+    assert ss.name == "BOB"
+    assert (ss.speechCnt, ss.lineCnt, ss.wordCnt) == (2, 4, 6)
+    assert ss.scenes == { "INT. HOUSE - DAY" : 4, "EXT. STREET - NIGHT" : 1 }
+
+    assert [(si.number, si.lines, si.actionLines, si.chars)
+            for si in st.scenes] == [(1, 7, 2, { "BOB" : 3 }),
+                                     (2, 2, 0, { "BOB" : 1 })]
+
+def testCache():
+    sp = u.load()
+    st = sp.getStats()
+
+    # all reports are built from the same stats
+    characterreport.CharacterReport(sp)
+    locationreport.LocationReport(scenereport.SceneReport(sp))
+    scriptreport.ScriptReport(sp)
+    dialoguechart.DialogueChart(sp, 1)
+
+    assert sp.getStats() is st
+
+    sp.cmd("moveDown", count = 3)
+    assert sp.getStats() is st
+
+    sp.cmdChars("foo")
+    st2 = sp.getStats()
+    assert st2 is not st
+    assert sp.getStats() is st2
+
+    sp.pages = sp.pages[:1] + [len(sp.lines) - 1]
+    assert sp.getStats() is not st2
+    assert set(sp.getStats().linePages) == set([1])
+
+    assert isinstance(st2, scriptstats.ScriptStats)
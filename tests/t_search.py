@@ -0,0 +1,208 @@
+import screenplay as scr
+import search
+import u
+
+from error import *
+
+# tests finding and replacing text
+
+# return a script with a long action paragraph wrapped into several lines
+def newScript():
+    sp = u.new()
+    sp.lines = [
+        scr.Line(scr.LB_LAST, scr.SCENE, "INT. HOUSE - DAY"),
+        scr.Line(scr.LB_LAST, scr.ACTION, ""),
+        scr.Line(scr.LB_LAST, scr.CHARACTER, "BOB"),
+        scr.Line(scr.LB_LAST, scr.DIALOGUE, "The cat sat. Don't go, Cat."),
+        ]
+
+    sp.lines[1].text = ("The cat walks slowly across the room and stops "
+                        "right by the old wooden door, where another cat "
+                        "waits. \xc4kta cats!")
+    sp.rewrapPara(1)
+    sp.paginate()
+
+    return sp
+
+def testGetParaText():
+    sp = newScript()
+
+    assert sp.lines[1].lb == scr.LB_SPACE
+
+    s, last = search.getParaText(sp, 1)
+    assert last == sp.getParaLastIndexFromLine(1)
+    assert s == " ".join([ln.text for ln in sp.lines[1:last + 1]])
+
+    for offset in xrange(len(s) + 1):
+        line, col = search.offset2pos(sp, 1, offset)
+        assert search.pos2offset(sp, 1, line, col) == offset
+
+def testFind():
+    sp = newScript()
+    srch = search.Search("cat")
+
+    m = srch.find(sp, 0, 0)
+    assert m == (1, 4, 7)
+
+    m = srch.find(sp, 1, 5)
+    s = search.getParaText(sp, 1)[0]
+    assert m[0] == 1
+    assert s[m[1]:m[2]] == "cat"
+    assert s[:m[1]].endswith("another ")
+
+    # backwards from the start of the dialogue finds the last match in the
+    # action paragraph
+    last = sp.getParaLastIndexFromLine(1)
+    m = srch.find(sp, last + 2, 0, False)
+    assert m[0] == 1
+    assert s[m[1]:m[2] + 1] == "cats"
+
+    assert srch.find(sp, 0, 0, False) is None
+    assert srch.find(sp, len(sp.lines) - 1, 30) is None
+
+    # case sensitivity
+    assert len(srch.findAll(sp)) == 5
+    assert len(search.Search("cat", matchCase = True).findAll(sp)) == 4
+    assert len(search.Search("\xe4KTA").findAll(sp)) == 1
+
+def testFindAcrossLines():
+    sp = newScript()
+
+    s, last = search.getParaText(sp, 1)
+    text = sp.lines[1].text.split()[-1] + " " + \
+           sp.lines[2].text.split()[0]
+
+    m = search.Search(text).find(sp, 0, 0)
+    assert m and (m[0] == 1)
+
+    assert search.offset2pos(sp, 1, m[1])[0] == 1
+    assert search.offset2pos(sp, 1, m[2])[0] == 2
+
+def testFindAtWrap():
+    sp = newScript()
+    wrap = len(sp.lines[1].text)
+
+    for srch in (search.Search(" old"),
+                 search.Search(r"\s+old", isRegex = True)):
+        # the match starts at the space joining the first two lines
+        m = srch.find(sp, 0, 0)
+        assert m == (1, wrap, wrap + 4)
+
+        # so continuing after a match at the last character of the line
+        # has to start at the space, not the start of the next line
+        assert srch.findFrom(sp, 1, wrap) == m
+        assert srch.find(sp, 2, 0) is None
+
+        # and backwards from after it
+        assert srch.findFrom(sp, 1, wrap + 1, False) == m
+        assert srch.findFrom(sp, 1, wrap - 1, False) is None
+
+    # offsets outside the paragraph continue in the next (previous) one
+    srch = search.Search("bob")
+    assert srch.findFrom(sp, 1, 1000) == (3, 0, 3)
+    assert srch.findFrom(sp, 4, -1, False) == (3, 0, 3)
+
+def testWholeWords():
+    sp = newScript()
+
+    ms = search.Search("cat", matchWhole = True).findAll(sp)
+    assert len(ms) == 4
+
+    assert search.Search("don", matchWhole = True).findAll(sp) == []
+    assert len(search.Search("don't", matchWhole = True).findAll(sp)) == 1
+
+def testElements():
+    sp = newScript()
+
+    srch = search.Search("cat", elements = [scr.DIALOGUE])
+    ms = srch.findAll(sp)
+
+    assert len(ms) == 2
+    assert [m[0] for m in ms] == [len(sp.lines) - 1] * 2
+
+    assert srch.find(sp, 0, 0) == ms[0]
+
+def testRegex():
+    sp = newScript()
+
+    srch = search.Search(r"\bca(t|ts)\b", isRegex = True, matchCase = True)
+    assert len(srch.findAll(sp)) == 4
+
+    try:
+        search.Search("ca(t", isRegex = True)
+    except MiscError:
+        pass
+    else:
+        assert 0
+
+    # special characters are literal in non-regex searches
+    assert search.Search("(t", isRegex = False).findAll(sp) == []
+
+    srch = search.Search(r"(\w+) (cat)\b", isRegex = True)
+    assert srch.replaceAll(sp, r"\2 \1") == 3
+    assert sp.lines[1].text.startswith("cat The walks")
+    assert sp.lines[-1].text == "cat The sat. Don't go, Cat."
+
+    try:
+        srch.replaceAll(sp, r"\3")
+    except MiscError:
+        pass
+    else:
+        assert 0
+
+def testReplace():
+    sp = newScript()
+    srch = search.Search("cat")
+
+    m = srch.find(sp, 0, 0)
+    assert srch.replace(sp, m, "dog") == 7
+    assert sp.lines[1].text.startswith("The dog walks")
+    assert (sp.line, sp.column) == (1, 7)
+
+    # match no longer there
+    assert srch.replace(sp, m, "dog") is None
+
+    sp.cmd("undo")
+    assert sp.lines[1].text.startswith("The cat walks")
+
+    sp._validate()
+
+def testReplaceAll():
+    sp = newScript()
+    orig = [str(ln) for ln in sp.lines]
+
+    srch = search.Search("cat", matchWhole = True)
+    assert srch.replaceAll(sp, "bobcat") == 4
+    sp._validate()
+
+    assert srch.findAll(sp) == []
+    assert len(search.Search("bobcat").findAll(sp)) == 4
+
+    # dialogue's the last paragraph with a match
+    assert sp.line == len(sp.lines) - 1
+    assert sp.lines[sp.line].text[:sp.column].endswith("Don't go, bobcat")
+
+    assert search.Search("zzz").replaceAll(sp, "a") == 0
+
+    # one undo restores everything
+    sp.cmd("undo")
+    assert [str(ln) for ln in sp.lines] == orig
+
+    sp.cmd("redo")
+    assert len(search.Search("bobcat").findAll(sp)) == 4
+
+def testReplaceAllBig():
+    sp = u.genScript(20)
+    els = sp.getElementsAsList()
+
+    srch = search.Search("the", matchWhole = True)
+    cnt = len(srch.findAll(sp))
+    assert cnt > 40
+
+    assert srch.replaceAll(sp, "THAT ONE") == cnt
+    sp._validate()
+
+    assert [(lt, s) for lt, s in sp.getElementsAsList()] == \
+           [(lt, search.Search("the", matchWhole = True).regex.sub(
+               u"THAT ONE", search.toUnicode(s)).encode("ISO-8859-1"))
+            for lt, s in els]
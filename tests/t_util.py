@@ -1,5 +1,12 @@
 # -*- coding: iso-8859-1 -*-
 
+import StringIO
+import os
+import shutil
+import stat
+import tempfile
+
+import misc
 import u
 import util
 
@@ -34,6 +41,17 @@ def testSplitToWords():
     assert us("don't assume -- it blaa") == ["don't", "assume", "it", "blaa"]
     assert us("a''b--c|de") == ["a''b", "c", "d", "e"]
 
+def testIterLines():
+    u.init()
+
+    for data in ["", "\n", "a", "a\r\nb\rc\n\nd\r", "\r\r\n\n\r"]:
+        for size in (1, 2, 3, 100):
+            assert list(util.iterLines(StringIO.StringIO(data), "", size)) \
+                   == util.fixNL(data).split("\n")
+
+    assert list(util.iterLines(StringIO.StringIO("\nb"), "a\r")) == \
+        ["a", "b"]
+
 def testToUTF8():
     u.init()
 
@@ -70,3 +88,126 @@ def testEscapeStrings():
     for items,s in data:
         assert util.escapeStrings(items) == s
         assert util.unescapeStrings(s) == items
+
+def testWriteFileSafely():
+    u.init()
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        fn = os.path.join(tmp, "out.txt")
+
+        util.writeFileSafely(fn, lambda f: f.write("old"))
+        assert open(fn, "rb").read() == "old"
+
+        def fail(f):
+            f.write("partial")
+            raise IOError(28, "No space left on device")
+
+        try:
+            util.writeFileSafely(fn, fail)
+        except IOError:
+            pass
+        else:
+            assert 0
+
+        # the old contents are kept and the temporary file is gone
+        assert open(fn, "rb").read() == "old"
+        assert os.listdir(tmp) == ["out.txt"]
+
+        assert util.writeToFile(fn, lambda f: f.write("new"), None)
+        assert open(fn, "rb").read() == "new"
+
+        assert util.writeToFile(fn, "newer", None)
+        assert open(fn, "rb").read() == "newer"
+        assert os.listdir(tmp) == ["out.txt"]
+    finally:
+        shutil.rmtree(tmp)
+
+def testWriteFileSafelyLinks():
+    u.init()
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        fn = os.path.join(tmp, "out.txt")
+        link = os.path.join(tmp, "link.txt")
+
+        open(fn, "wb").write("old")
+        os.chmod(fn, 0640)
+        os.symlink(fn, link)
+
+        # the link is kept and the file it points to replaced
+        util.writeFileSafely(link, lambda f: f.write("new"))
+        assert os.path.islink(link)
+        assert open(fn, "rb").read() == "new"
+        assert stat.S_IMODE(os.stat(fn).st_mode) == 0640
+        assert sorted(os.listdir(tmp)) == ["link.txt", "out.txt"]
+    finally:
+        shutil.rmtree(tmp)
+
+def testWriteFileSafelyInPlace():
+    u.init()
+
+    tmp = tempfile.mkdtemp()
+
+    try:
+        fn = os.path.join(tmp, "out.txt")
+        open(fn, "wb").write("old")
+
+        # the temporary file can't be created, so fn is written in place
+        tmpPath = "%s.%d.tmp" % (fn, os.getpid())
+        os.mkdir(tmpPath)
+
+        util.writeFileSafely(fn, lambda f: f.write("new"))
+        assert open(fn, "rb").read() == "new"
+
+        os.rmdir(tmpPath)
+
+        # a writable file in a read-only directory (root can write to
+        # the directory anyway)
+        if os.getuid() != 0:
+            os.chmod(tmp, 0555)
+
+            try:
+                util.writeFileSafely(fn, lambda f: f.write("newer"))
+            finally:
+                os.chmod(tmp, 0755)
+
+            assert open(fn, "rb").read() == "newer"
+            assert os.listdir(tmp) == ["out.txt"]
+    finally:
+        shutil.rmtree(tmp)
+
+def testReplaceFileWindows():
+    u.init()
+
+    tmp = tempfile.mkdtemp()
+    isWindows = misc.isWindows
+
+    try:
+        misc.isWindows = True
+
+        src = os.path.join(tmp, "new.txt")
+        dst = os.path.join(tmp, "out.txt")
+
+        open(dst, "wb").write("old")
+        open(src, "wb").write("new")
+
+        util.replaceFile(src, dst)
+        assert open(dst, "rb").read() == "new"
+        assert os.listdir(tmp) == ["out.txt"]
+
+        # a failed rename puts the old file back
+        try:
+            util.replaceFile(os.path.join(tmp, "none.txt"), dst)
+        except OSError:
+            pass
+        else:
+            assert 0
+
+        assert open(dst, "rb").read() == "new"
+        assert os.listdir(tmp) == ["out.txt"]
+    finally:
+        misc.isWindows = isWindows
+        shutil.rmtree(tmp)
@@ -1,5 +1,7 @@
 # ut:ignore
 
+import random
+
 import config
 import misc
 import screenplay
@@ -35,3 +37,132 @@ def loadString(s):
 
     return screenplay.Screenplay.load(s, config.ConfigGlobal())[0]
 
+
+# run 'count' random editing commands at random positions in sp, calling
+# func(sp) after each one. seed is used to seed the random number
+# generator.
+def randomEdits(sp, seed, count, func):
+    rnd = random.Random(seed)
+
+    cmds = ["addChar", "addChar", "addChar", "deleteBackward",
+            "deleteForward", "splitElement", "tab", "toPrevTypeTab",
+            "insertForcedLineBreak", "toScene", "toDialogue", "toParen",
+            "toActBreak", "undo", "undo", "redo", "cut", "paste"]
+
+    clip = None
+
+    for i in xrange(count):
+        sp.line = rnd.randrange(len(sp.lines))
+        sp.column = rnd.randint(0, len(sp.lines[sp.line].text))
+
+        name = rnd.choice(cmds)
+
+        if name == "addChar":
+            sp.cmdChars(rnd.choice(["a", " ", "foo bar ", "x" * 70]))
+        elif name == "cut":
+            sp.cmd("setMark")
+            sp.cmd("moveDown", count = rnd.randint(0, 30))
+            clip = sp.getSelectedAsCD(True)
+        elif name == "paste":
+            if clip:
+                sp.paste(clip.lines)
+        else:
+            sp.cmd(name)
+
+        func(sp)
+
+# words, names and places generated scripts are made of
+WORDS = ("the a an and of to in on at with from into over under back door "
+         "room car gun phone window table light night rain street city "
+         "looks turns walks runs stops waits smiles nods stares grabs "
+         "opens closes reaches falls slowly quickly suddenly quietly "
+         "finally never always maybe really just still again here there "
+         "what why how who I you we they he she it this that something "
+         "nothing everything time way day man woman girl boy money job "
+         "know think want need tell said go come take give find leave "
+         "love hate trust kill help believe remember forget").split()
+
+NAMES = ("JACK", "SARAH", "MICHAEL", "ELENA", "DETECTIVE RUIZ", "MOM",
+         "DR. PATEL", "OLD MAN", "TOMMY", "KATE", "BARTENDER", "VOICE (O.S.)")
+
+PLACES = ("APARTMENT", "POLICE STATION", "DINER", "CAR", "WAREHOUSE",
+          "ROOFTOP", "HOSPITAL CORRIDOR", "SARAH'S HOUSE - KITCHEN",
+          "FOREST", "MAIN STREET", "OFFICE", "MOTEL ROOM")
+
+TIMES = ("DAY", "NIGHT", "CONTINUOUS", "LATER", "MORNING", "DUSK")
+
+TRANSITIONS = ("CUT TO:", "DISSOLVE TO:", "SMASH CUT TO:", "FADE OUT.")
+
+# return a sentence of 'n' random words.
+def genSentence(rnd, n):
+    words = [rnd.choice(WORDS) for i in xrange(n)]
+
+    return " ".join(words).capitalize() + rnd.choice([".", ".", "?", "!"])
+
+# append the elements of one scene to 'elems' as (type, text) tuples.
+def genScene(rnd, elems):
+    elems.append((screenplay.SCENE, "%s. %s - %s" % (
+        rnd.choice(["INT", "INT", "EXT"]), rnd.choice(PLACES),
+        rnd.choice(TIMES))))
+
+    for i in xrange(rnd.randint(3, 14)):
+        r = rnd.random()
+
+        if r < 0.35:
+            elems.append((screenplay.ACTION, " ".join(
+                [genSentence(rnd, rnd.randint(4, 16))
+                 for j in xrange(rnd.randint(1, 4))])))
+        elif r < 0.92:
+            elems.append((screenplay.CHARACTER, rnd.choice(NAMES)))
+
+            if rnd.random() < 0.2:
+                elems.append((screenplay.PAREN, "(%s)" % genSentence(
+                    rnd, rnd.randint(1, 4))[:-1].lower()))
+
+            elems.append((screenplay.DIALOGUE, " ".join(
+                [genSentence(rnd, rnd.randint(2, 12))
+                 for j in xrange(rnd.randint(1, 3))])))
+        elif r < 0.96:
+            elems.append((screenplay.SHOT, rnd.choice(
+                ["CLOSE ON", "ANGLE ON", "POV"]) + " " +
+                rnd.choice(NAMES)))
+        else:
+            elems.append((screenplay.NOTE, genSentence(rnd, 10)))
+
+    if rnd.random() < 0.3:
+        elems.append((screenplay.TRANSITION, rnd.choice(TRANSITIONS)))
+
+# return a new Screenplay of at least 'pages' pages with randomly
+# generated contents, with a realistic mix of element types. the same
+# 'pages' and 'seed' always give the same script.
+def genScript(pages, seed = 0):
+    rnd = random.Random(seed)
+    sp = new()
+    elems = []
+
+    # generate enough scenes for the wanted page count, checking by
+    # actually paginating the script, and estimating how many more are
+    # needed if it falls short
+    scenes = max(1, pages * 3 // 4)
+
+    while 1:
+        while len([e for e in elems if e[0] == screenplay.SCENE]) < scenes:
+            genScene(rnd, elems)
+
+        sp.lines = [screenplay.Line(screenplay.LB_LAST, lt, text)
+                    for lt, text in elems]
+        sp.reformatAll()
+        sp.paginate()
+
+        cnt = len(sp.pages) - 1
+
+        if cnt >= pages:
+            break
+
+        scenes = int(scenes * (float(pages) / cnt) * 1.02) + 1
+
+    sp.titles.addDefaults()
+    sp.headers.addDefaults()
+    sp.paginate()
+
+    return sp
@@ -0,0 +1,327 @@
+import os
+import shutil
+import tempfile
+import time
+
+import journal
+import screenplay as scr
+import u
+import undo
+
+# tests for the journal of script changes used for crash recovery and
+# for keeping old undo history out of memory
+
+def state(sp):
+    return [str(ln) for ln in sp.lines]
+
+# call func(sp, dirName) with a temporary directory to keep journals in
+# and sp being the sample script being journaled there.
+def withJournal(func):
+    dirName = tempfile.mkdtemp()
+
+    try:
+        sp = u.load("../sample.trelby")
+        sp.journal = journal.Journal(dirName, sp, None)
+
+        try:
+            func(sp, dirName)
+        finally:
+            sp.journal.close()
+    finally:
+        shutil.rmtree(dirName)
+
+# flush sp's journal and return what recovering it gives.
+def recover(sp):
+    sp.journal.flush()
+
+    return journal.recover(sp.journal.path, sp.cfgGl)
+
+# flush sp's journal and return the types of the records in it.
+def recordTypes(sp):
+    sp.journal.flush()
+
+    f = open(sp.journal.path, "rb")
+    f.seek(len(journal.MAGIC))
+    ret = []
+
+    try:
+        while True:
+            rec = journal.readRecord(f)
+
+            if not rec:
+                return ret
+
+            ret.append(rec[0])
+    finally:
+        f.close()
+
+# file object wrapper that's slow to write to
+class SlowFile:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data):
+        time.sleep(0.001)
+        self.f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+def testRecover():
+    def func(sp, dirName):
+        # nothing to recover from an unmodified script
+        assert recover(sp) is None
+
+        u.randomEdits(sp, 3, 300, lambda sp: sp.syncJournal())
+
+        sp.titles.pages[0][0].items[0] = "Recovered"
+        sp.markChanged()
+        sp.syncJournal()
+
+        sp.cmd("moveDown", count = 5)
+        sp.cmdChars("foo")
+
+        sp2, fileName = recover(sp)
+        sp2._validate()
+
+        assert fileName is None
+        assert state(sp2) == state(sp)
+        assert (sp2.line, sp2.column) == (sp.line, sp.column)
+        assert sp2.titles.pages[0][0].items[0] == "Recovered"
+        assert sp2.isModified()
+
+    withJournal(func)
+
+def testSaved():
+    def func(sp, dirName):
+        sp.cmdChars("foo")
+        sp.journal.saved(sp, u"foo.trelby")
+        sp.markChanged(False)
+
+        assert recover(sp) is None
+
+        sp.cmd("undo")
+
+        sp2, fileName = recover(sp)
+        assert fileName == u"foo.trelby"
+        assert state(sp2) == state(sp)
+
+    withJournal(func)
+
+def testTruncated():
+    def func(sp, dirName):
+        u.randomEdits(sp, 4, 50, lambda sp: sp.syncJournal())
+        sp.journal.flush()
+
+        data = open(sp.journal.path, "rb").read()
+        path = os.path.join(dirName, "broken" + journal.EXT)
+
+        # whatever the program managed to write before dying, recovering
+        # gives some consistent earlier state
+        for size in xrange(len(journal.MAGIC), len(data), 97):
+            f = open(path, "wb")
+            f.write(data[:size])
+            f.close()
+
+            res = journal.recover(path, sp.cfgGl)
+
+            if res:
+                res[0]._validate()
+
+    withJournal(func)
+
+def testStubs():
+    old = scr.UNDO_MEMORY_LIMIT
+    scr.UNDO_MEMORY_LIMIT = 200000
+
+    try:
+        withJournal(checkStubs)
+    finally:
+        scr.UNDO_MEMORY_LIMIT = old
+
+def checkStubs(sp, dirName):
+    states = [state(sp)]
+
+    for i in xrange(200):
+        sp.line = (i * 37) % len(sp.lines)
+        sp.column = 0
+
+        if i % 3:
+            sp.cmdChars("x ")
+        else:
+            sp.cmd("splitElement")
+
+        states.append(state(sp))
+
+    # the oldest undo objects got moved to the journal instead of being
+    # thrown away
+    stubs = 0
+    cnt = 0
+    tmp = sp.firstUndo
+
+    while tmp:
+        if isinstance(tmp, undo.Stub):
+            stubs += 1
+
+        cnt += 1
+        tmp = tmp.next
+
+    assert stubs > 50
+    assert cnt == 200
+    assert sp.undoMemoryUsed < scr.UNDO_MEMORY_LIMIT
+
+    for i in xrange(200, 0, -1):
+        sp.cmd("undo")
+        assert state(sp) == states[i - 1]
+
+    for i in xrange(200):
+        sp.cmd("redo")
+        assert state(sp) == states[i + 1]
+
+    # and the journal still replays fine after all that
+    sp.cmd("undo", count = 30)
+    assert state(recover(sp)[0]) == state(sp)
+
+def testUnreadable():
+    old = scr.UNDO_MEMORY_LIMIT
+    scr.UNDO_MEMORY_LIMIT = 200000
+
+    try:
+        withJournal(checkUnreadable)
+    finally:
+        scr.UNDO_MEMORY_LIMIT = old
+
+# undo or redo in sp, and return the error message given, if any.
+def undoOrRedo(sp, name):
+    cs = scr.CommandState()
+    getattr(sp, name + "Cmd")(cs)
+    sp.cmdPost(cs)
+
+    return cs.errorMsg
+
+def checkUnreadable(sp, dirName):
+    for i in xrange(200):
+        sp.line = (i * 37) % len(sp.lines)
+        sp.column = 0
+        sp.cmdChars("x ")
+
+    sp.journal.flush()
+    path = sp.journal.path
+    os.rename(path, path + ".old")
+
+    # the undo objects still in memory can be undone, up to the first one
+    # in the journal, which is removed along with the rest before it
+    cnt = 0
+
+    while True:
+        st = state(sp)
+        msg = undoOrRedo(sp, "undo")
+
+        if msg:
+            break
+
+        cnt += 1
+
+    assert msg.startswith("Undo failed: ")
+    assert 0 < cnt < 200
+    assert state(sp) == st
+    assert not sp.canUndo()
+    assert sp.firstUndo.prev is None
+
+    used = sp.undoMemoryUsed
+    sp.calcUndoMemoryUsed()
+    assert sp.undoMemoryUsed == used
+
+    # what's left can still be redone and undone
+    for i in xrange(cnt):
+        assert undoOrRedo(sp, "redo") is None
+
+    assert not sp.canRedo()
+
+    for i in xrange(cnt):
+        assert undoOrRedo(sp, "undo") is None
+
+    assert not sp.canUndo()
+    os.rename(path + ".old", path)
+
+    # a failed redo removes the rest of the redo history
+    sp.journal.close()
+    sp.journal = journal.Journal(dirName, sp, None)
+
+    for i in xrange(200):
+        sp.line = (i * 37) % len(sp.lines)
+        sp.column = 0
+        sp.cmdChars("y ")
+
+    sp.cmd("undo", count = 200)
+    assert not sp.canUndo()
+    st = state(sp)
+
+    sp.journal.flush()
+    path = sp.journal.path
+    os.rename(path, path + ".old")
+
+    assert undoOrRedo(sp, "redo").startswith("Redo failed: ")
+    assert state(sp) == st
+    assert not sp.canRedo()
+    assert not sp.canUndo()
+    assert sp.undoMemoryUsed == 0
+
+    os.rename(path + ".old", path)
+
+    # new edits work normally after that
+    sp.cmdChars("z")
+    sp.cmd("undo")
+    assert state(sp) == st
+
+def testOrphans():
+    def func(sp, dirName):
+        # journals in use are not orphans
+        assert journal.findOrphans(dirName) == []
+
+        jnl = journal.Journal(dirName, sp, None)
+        jnl.close(False)
+
+        assert journal.findOrphans(dirName) == [jnl.path]
+
+    withJournal(func)
+
+def testFlush():
+    def func(sp, dirName):
+        sp.journal.flush()
+        sp.journal.f = SlowFile(sp.journal.f)
+
+        for i in xrange(20):
+            sp.cmdChars("x")
+            pos = sp.journal.lastPos
+
+            # everything queued is in the file once flush returns
+            sp.journal.flush()
+            assert os.path.getsize(sp.journal.path) == sp.journal.size
+            assert sp.journal.readDelta(pos)
+
+    withJournal(func)
+
+def testPaste():
+    def func(sp, dirName):
+        sp.cmd("setMark")
+        sp.cmd("moveDown", count = 10)
+        cd = sp.getSelectedAsCD(False)
+        sp.syncJournal()
+
+        cnt = len(recordTypes(sp))
+
+        sp.cmd("moveDown", count = 20)
+        sp.paste(cd.lines)
+        sp.syncJournal()
+        sp.cmd("undo")
+        sp.syncJournal()
+        sp.cmd("redo")
+        sp.syncJournal()
+
+        # pasting, undoing and redoing it are all recorded without full
+        # copies of the script
+        assert "B" not in recordTypes(sp)[cnt:]
+        assert state(recover(sp)[0]) == state(sp)
+
+    withJournal(func)
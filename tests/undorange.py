@@ -0,0 +1,81 @@
+import random
+
+import screenplay as scr
+import u
+import undo
+
+# tests that undo objects storing only the modified range of lines undo
+# and redo edits correctly
+
+def state(sp):
+    return [str(ln) for ln in sp.lines]
+
+# run func(sp), which must create one undo object, and check that undoing
+# and redoing it gives back the states before and after it.
+def check(sp, func):
+    before = state(sp)
+    func(sp)
+    after = state(sp)
+
+    sp.cmd("undo")
+    assert state(sp) == before
+
+    sp.cmd("redo")
+    assert state(sp) == after
+
+def testCutPaste():
+    sp = u.load("../sample.trelby")
+    rnd = random.Random(5)
+    clip = None
+
+    for i in xrange(150):
+        sp.line = rnd.randrange(len(sp.lines))
+        sp.column = rnd.randint(0, len(sp.lines[sp.line].text))
+
+        if clip and rnd.randint(0, 1):
+            check(sp, lambda sp: sp.paste(clip.lines))
+        else:
+            def cut(sp):
+                sp.cmd("setMark")
+                sp.cmd("moveDown", count = rnd.randint(0, 30))
+                sp.cmd("moveRight", count = rnd.randint(0, 30))
+
+                cds.append(sp.getSelectedAsCD(True))
+
+            cds = []
+            check(sp, cut)
+            clip = cds[0]
+
+def testCutAll():
+    sp = u.load("../sample.trelby")
+
+    def cut(sp):
+        sp.cmd("moveStart")
+        sp.cmd("setMark")
+        sp.cmd("moveEnd")
+        sp.getSelectedAsCD(True)
+
+    check(sp, cut)
+    assert len(sp.lines) == 1
+
+def testSize():
+    sp = u.load("../sample.trelby")
+    sp.cmd("moveDown", count = 100)
+
+    cd = scr.ClipData()
+    cd.lines = [scr.Line(scr.LB_LAST, scr.ACTION, "Foo bar.")]
+    sp.paste(cd.lines)
+
+    # only the modified element is stored
+    assert sp.lastUndo.removed[0] <= 3
+    assert sp.lastUndo.inserted[0] <= 3
+
+def testFullCopy():
+    sp = u.load("../sample.trelby")
+
+    check(sp, lambda sp: sp.removeElementTypes({scr.TRANSITION : None},
+                                               True))
+
+    # only the changed block is kept
+    assert sp.lastUndo.removed[0] < len(sp.lines)
+    assert not hasattr(sp.lastUndo, "storage")
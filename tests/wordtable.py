@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+import error
+import spellcheck
+import u
+
+# tests for the precompiled word table
+
+WORDS = ["table", "cable", "a", "zebra", "tablet", "able", "table", "\xe4iti"]
+
+def testWords():
+    wt = spellcheck.WordTable(spellcheck.WordTable.generate(WORDS))
+    words = sorted(set(WORDS))
+
+    assert len(wt) == len(words)
+    assert list(wt) == words
+
+    for w in words:
+        assert w in wt
+
+        # and again from the lookup cache
+        assert w in wt
+
+    for w in ("", "tabl", "tables", "aa", "zz", "\xff", "\xe4"):
+        assert w not in wt
+
+    try:
+        wt[len(words)]
+        assert 0
+    except IndexError:
+        pass
+
+def testEmpty():
+    wt = spellcheck.WordTable(spellcheck.WordTable.generate([]))
+
+    assert len(wt) == 0
+    assert "a" not in wt
+
+def testInvalid():
+    s = spellcheck.WordTable.generate(WORDS)
+
+    for data in ("", "foo", s[:-1], s + "x", "X" + s[1:]):
+        try:
+            spellcheck.WordTable(data)
+            assert 0
+        except error.MiscError:
+            pass
+
+def testLoad():
+    u.init()
+
+    fd, fn = tempfile.mkstemp()
+
+    try:
+        os.write(fd, spellcheck.WordTable.generate(WORDS))
+        os.close(fd)
+
+        wt = spellcheck.WordTable.load(fn)
+        assert list(wt) == sorted(set(WORDS))
+        assert "zebra" in wt
+
+        # suggestions work the same from a word table
+        index = spellcheck.SuggestionIndex(wt, True)
+        assert index.find("tabel", 2) == \
+               spellcheck.SuggestionIndex(set(WORDS)).find("tabel", 2)
+    finally:
+        os.remove(fn)
@@ -1,14 +1,14 @@
 #!/usr/bin/env python
-# add words to ../dict_en.dat in the correct place
+# add words to ../dict_en.dat in the correct place, and regenerate
+# ../dict_en.bin, the precompiled version of it that the program actually
+# uses. with no words given, only dict_en.bin is regenerated.
 
 import sys
 
-if len(sys.argv) < 2:
-    raise Exception("add_word.py word1 word2...")
-
 sys.path.insert(0, "../src")
 
 import misc
+import spellcheck
 import util
 
 util.init(False)
@@ -24,14 +24,19 @@ lines = s.splitlines()
 for it in lines:
     words[util.lower(it)] = None
 
-for arg in sys.argv[1:]:
-    words[util.lower(arg)] = None
+if len(sys.argv) > 1:
+    for arg in sys.argv[1:]:
+        words[util.lower(arg)] = None
+
+    words = words.keys()
+    words.sort()
 
-words = words.keys()
-words.sort()
+    f = open("../dict_en.dat", "wb")
+    for w in words:
+        f.write("%s\n" % w)
 
-f = open("../dict_en.dat", "wb")
-for w in words:
-    f.write("%s\n" % w)
+    f.close()
 
+f = open("../dict_en.bin", "wb")
+f.write(spellcheck.WordTable.generate(words))
 f.close()
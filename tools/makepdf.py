@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# generate PDFs from Trelby scripts without starting the program.
+#
+# with -w, one watermarked copy is generated per watermark instead, named
+# <output>-<watermark>.pdf, just like the watermark tool in the program
+# does. page contents are generated in parallel in -j worker processes.
+
+import locale
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "../src"))
+
+from error import *
+import config
+import misc
+import pdf
+import screenplay
+import util
+import watermarkdlg
+
+# write PML document 'doc' to 'filename' as a PDF.
+def writeFile(filename, doc, pool):
+    f = open(filename, "wb")
+
+    try:
+        pdf.generateTo(doc, f, pool)
+    finally:
+        f.close()
+
+def main():
+    parser = optparse.OptionParser(
+        usage = "%prog [options] script.trelby output.pdf")
+
+    parser.add_option("-j", "--jobs", type = "int",
+        default = multiprocessing.cpu_count(),
+        help = "number of worker processes (default: number of CPUs)")
+    parser.add_option("-w", "--watermark", action = "append", default = [],
+        help = "generate a copy with this watermark (can be repeated)")
+    parser.add_option("-c", "--common-mark", default = "Confidential",
+        help = "text added to all watermarked copies")
+    parser.add_option("-s", "--mark-size", type = "int", default = 40,
+        help = "watermark font size")
+
+    opts, args = parser.parse_args()
+
+    if len(args) != 2:
+        parser.error("need input and output filenames")
+
+    misc.init(False)
+    util.init(False)
+
+    t = time.time()
+
+    try:
+        f = open(args[0], "rb")
+
+        try:
+            sp, msg = screenplay.Screenplay.loadFile(f,
+                                                     config.ConfigGlobal())
+        finally:
+            f.close()
+
+    except (IOError, TrelbyError), e:
+        sys.exit("Error loading %s: %s" % (args[0], e))
+
+    if msg:
+        print >> sys.stderr, msg
+
+    pool = None
+
+    if opts.jobs > 1:
+        pool = multiprocessing.Pool(opts.jobs)
+
+    try:
+        doc = sp.generatePML(True)
+
+        if not opts.watermark:
+            writeFile(args[1], doc, pool)
+        else:
+            prefix = os.path.splitext(args[1])[0]
+            enc = locale.getpreferredencoding()
+            common = opts.common_mark.decode(enc)
+            usedIds = set()
+
+            for mark in opts.watermark:
+                wdoc = watermarkdlg.addWatermark(doc, sp.cfg, common,
+                    mark.decode(enc), opts.mark_size)
+                wdoc.uniqueId = watermarkdlg.WatermarkDlg.getUniqueId(
+                    usedIds)
+
+                writeFile("%s-%s.pdf" % (prefix, mark.replace(" ", "-")),
+                          wdoc, pool)
+    finally:
+        if pool:
+            pool.terminate()
+
+    print "%d pages in %.2f seconds" % (len(sp.pages) - 1, time.time() - t)
+
+if __name__ == "__main__":
+    main()